@@ -3,7 +3,10 @@
 # which implement the agents and their RL logic
 
 import random
-from constants import ACTIONS
+from constants import ACTIONS, ACTION_INDEX
+from rng import RandomStream
+
+ACTION_BITS = {action: 1 << i for i, action in enumerate(ACTIONS)} # argmax cache bitmask per action
 
 class Agent:
     """A simple class to hold the state of an agent."""
@@ -22,46 +25,118 @@ class Agent:
     def __str__(self):
         return f"Agent {self.name} at ({self.x}, {self.y}), holding: {self.has_block}"
 
+class EligibilityTraces:
+    """
+    Replacing eligibility traces of the recently visited (state, action) pairs, oldest first.
+    Every trace decays by the same factor per update, so the oldest pairs are also the smallest:
+    pairs below `threshold` drop off the front, and at most `max_size` are kept.
+    """
+    def __init__(self, decay, threshold=1e-3, max_size=1000):
+        if max_size < 1:
+            raise ValueError(f"max_traces must be at least 1, got {max_size}")
+        self.decay = decay
+        self.threshold = threshold
+        self.max_size = max_size
+        self.traces = {} # (state, action) -> eligibility, in visit order
+
+    def __len__(self):
+        return len(self.traces)
+
+    def visit(self, state, action):
+        """Sets the pair's trace to 1 and moves it to the back."""
+        key = (state, action)
+        self.traces.pop(key, None)
+        self.traces[key] = 1.0
+        if len(self.traces) > self.max_size:
+            del self.traces[next(iter(self.traces))]
+
+    def clear(self):
+        self.traces.clear()
+
 class RLAgentController:
     """
     The "brain" for an agent. Owns the Q-table and all RL logic.
     Implements Option (a): separate Q-tables, but state includes other agent.
+    (With N agents the runner can hand every controller the same Q-table.)
     """
-    def __init__(self, agent, other_agent, world, learning_rate, discount_factor):
+    def __init__(self, agent, other_agent, world, learning_rate, discount_factor, dense_q_table=False, rng=None,
+                 argmax_cache=False, state_encoder=None):
         self.agent = agent
         self.other_agent = other_agent
         self.world = world
         self.learning_rate = learning_rate
         self.discount_factor = discount_factor
-        self.q_table = {}  # Key: state tuple, Value: {action: q_value}
+        self.dense = dense_q_table
+        if self.dense:
+            from q_table import DenseQTable # only pull in numpy when asked for
+            self.q_table = DenseQTable(world.width, world.height)
+        else:
+            self.q_table = {}  # Key: state tuple, Value: {action: q_value}
+        # Own random stream (exploration and tie-breaks); without one, seed from the global generator
+        self.rng = rng if rng is not None else RandomStream(random.getrandbits(63))
+        # Optional {state: (max_q, bitmask of the actions with that value)}, kept up to date by _set_q_value.
+        # Must be cleared whenever q_table is replaced or written directly
+        self.argmax_cache = {} if argmax_cache else None
+        # N agents: other_agent is None and state_encoder (multi_agent.state_encoder) builds the state
+        self.state_encoder = state_encoder
+        self.traces = None # EligibilityTraces for the lambda updates (enable_traces)
 
     def get_current_state(self): # the current state from this agent's perspective
         """Generates the state tuple from the agent's perspective."""
+        if self.state_encoder is not None:
+            return self.state_encoder()
         return (self.agent.x, self.agent.y, self.agent.has_block, 
                 self.other_agent.x, self.other_agent.y)
 
     def get_q_value(self, state, action):
         """Helper to get Q-value, initializing if not present."""
+        if self.dense:
+            return float(self.q_table.row(state)[ACTION_INDEX[action]])
         if state not in self.q_table: # if state not in Q-table, initialize
             self.q_table[state] = {act: 0.0 for act in ACTIONS} # all actions start at 0.0
         if action not in self.q_table[state]: # if action not in Q-table for this state, initialize
              self.q_table[state][action] = 0.0 # default Q-value
         return self.q_table[state][action] # return the Q-value if present (this will return 0.0 if just initialized)
 
+    def _argmax_entry(self, state):
+        """(max_q, bitmask of the actions reaching it) over all actions of a state's row."""
+        if self.dense:
+            row = self.q_table.row(state).tolist()
+        else:
+            self.get_q_value(state, ACTIONS[0]) # initializes the state's row
+            actions = self.q_table[state]
+            row = [actions.get(a, 0.0) for a in ACTIONS]
+        max_q = max(row)
+        bits = 0
+        for i, q_val in enumerate(row):
+            if q_val == max_q:
+                bits |= 1 << i
+        self.argmax_cache[state] = entry = (max_q, bits)
+        return entry
+
     def get_max_q_action(self, state, possible_actions):
         """Finds the action with the highest Q-value from a list of possible actions."""
         if not possible_actions:
             return None, 0.0
+        if self.argmax_cache is not None:
+            entry = self.argmax_cache.get(state)
+            max_q, bits = entry if entry is not None else self._argmax_entry(state)
+            # If a best action of the whole row is possible, the possible ones with that value are exactly
+            # the ties the scan below would find (in the same order); otherwise fall back to the scan
+            best_actions = [a for a in possible_actions if bits & ACTION_BITS[a]]
+            if best_actions:
+                return self.rng.choice(best_actions), max_q
         max_q = -float('inf')
         best_actions = []
+        row = self.q_table.row(state).tolist() if self.dense else None # fetch the dense row once
         for action in possible_actions: # iterate only over possible actions
-            q_val = self.get_q_value(state, action)
+            q_val = row[ACTION_INDEX[action]] if self.dense else self.get_q_value(state, action)
             if q_val > max_q: # found a new max
                 max_q = q_val
                 best_actions = [action]
             elif q_val == max_q: # found another action with same max Q-value
                 best_actions.append(action)
-        return random.choice(best_actions), max_q # break ties randomly
+        return self.rng.choice(best_actions), max_q # break ties randomly
 
     def choose_action(self, policy, possible_actions):
         """Chooses an action based on the current policy."""
@@ -76,17 +151,17 @@ class RLAgentController:
             return 'Dropoff'
 
         if policy == 'PRANDOM':
-            return random.choice(possible_actions)
+            return self.rng.choice(possible_actions)
         
         elif policy == 'PEXPLOIT':
             best_action, _ = self.get_max_q_action(state, possible_actions)
-            if random.random() < 0.8: # 80% exploit
+            if self.rng.random() < 0.8: # 80% exploit
                 return best_action
             else: # 20% explore
                 exploration_choices = [a for a in possible_actions if a != best_action]
                 if not exploration_choices:
                     return best_action
-                return random.choice(exploration_choices)
+                return self.rng.choice(exploration_choices)
 
         elif policy == 'PGREEDY':
             best_action, _ = self.get_max_q_action(state, possible_actions)
@@ -94,18 +169,117 @@ class RLAgentController:
             
         raise ValueError(f"Unknown policy: {policy}")
 
+    def _set_q_value(self, state, action, q_val):
+        """Writes a Q-value (the state has already been initialized by get_q_value)."""
+        if self.dense:
+            self.q_table.row(state)[ACTION_INDEX[action]] = q_val
+        else:
+            self.q_table[state][action] = q_val
+        entry = self.argmax_cache.get(state) if self.argmax_cache is not None else None
+        if entry is not None:
+            max_q, bits = entry
+            bit = ACTION_BITS[action]
+            if q_val > max_q:
+                self.argmax_cache[state] = (q_val, bit)
+            elif q_val == max_q:
+                self.argmax_cache[state] = (max_q, bits | bit)
+            elif bits & bit:
+                if bits == bit: # the only best action dropped: rescan the row
+                    self._argmax_entry(state)
+                else:
+                    self.argmax_cache[state] = (max_q, bits & ~bit)
+
     def update_q_table(self, old_state, action, reward, new_state, new_possible_actions):
-        """Performs the Q-Learning update rule."""
+        """Performs the Q-Learning update rule. Returns the TD error."""
         old_q = self.get_q_value(old_state, action)
         _ , max_next_q = self.get_max_q_action(new_state, new_possible_actions)
         temporal_difference = reward + (self.discount_factor * max_next_q) - old_q
         new_q = old_q + (self.learning_rate * temporal_difference)
-        self.q_table[old_state][action] = new_q
+        self._set_q_value(old_state, action, new_q)
+        return temporal_difference
+
+    def greedy_actions(self, state, possible_actions):
+        """All possible actions with the highest Q-value (no random draw), and that value."""
+        q_values = [self.get_q_value(state, a) for a in possible_actions]
+        max_q = max(q_values)
+        return [a for a, q_val in zip(possible_actions, q_values) if q_val == max_q], max_q
+
+    def policy_probabilities(self, policy, state, possible_actions):
+        """{action: probability} of choose_action's pick (ties split evenly, like its random tie-break)."""
+        if not possible_actions:
+            return {}
+        for forced in ('Pickup', 'Dropoff'):
+            if forced in possible_actions:
+                return {forced: 1.0}
+        n = len(possible_actions)
+        if policy == 'PRANDOM':
+            return {a: 1.0 / n for a in possible_actions}
+        best, _ = self.greedy_actions(state, possible_actions)
+        if policy == 'PGREEDY' or n == 1:
+            return {a: (1.0 / len(best) if a in best else 0.0) for a in possible_actions}
+        if policy == 'PEXPLOIT': # 80% the (randomly tie-broken) best action, 20% one of the others
+            probs = dict.fromkeys(possible_actions, 0.0)
+            for b in best:
+                for a in possible_actions:
+                    probs[a] += (0.8 if a == b else 0.2 / (n - 1)) / len(best)
+            return probs
+        raise ValueError(f"Unknown policy: {policy}")
+
+    def update_expected_sarsa_table(self, old_state, action, reward, new_state, new_possible_actions, policy):
+        """Expected SARSA: bootstraps on the policy's expected Q-value in the new state. Returns the TD error."""
+        probs = self.policy_probabilities(policy, new_state, new_possible_actions)
+        expected_q = sum(p * self.get_q_value(new_state, a) for a, p in probs.items())
+        return self.update_towards(old_state, action, reward + self.discount_factor * expected_q)
+
+    def update_towards(self, state, action, target):
+        """Moves Q(state, action) a learning-rate step towards target. Returns the TD error."""
+        old_q = self.get_q_value(state, action)
+        temporal_difference = target - old_q
+        self._set_q_value(state, action, old_q + self.learning_rate * temporal_difference)
+        return temporal_difference
+
+    def enable_traces(self, lam, threshold=1e-3, max_size=1000):
+        """Gives the controller eligibility traces decaying by discount_factor * lam per move."""
+        if not 0 <= lam <= 1:
+            raise ValueError(f"lambda must be in [0, 1], got {lam}")
+        self.traces = EligibilityTraces(self.discount_factor * lam, threshold, max_size)
+
+    def _apply_traces(self, step):
+        """Adds step * eligibility to every traced pair's Q-value, then decays the traces."""
+        traces = self.traces.traces
+        decay, threshold = self.traces.decay, self.traces.threshold
+        expired = 0
+        for key, eligibility in traces.items():
+            state, action = key
+            self._set_q_value(state, action, self.get_q_value(state, action) + step * eligibility)
+            eligibility *= decay
+            traces[key] = eligibility
+            if eligibility < threshold:
+                expired += 1
+        for _ in range(expired): # all decay alike, so the expired ones are the oldest
+            del traces[next(iter(traces))]
+
+    def update_q_lambda_table(self, old_state, action, reward, new_state, new_possible_actions):
+        """Watkins's Q(lambda) update (the caller cuts the traces after exploratory actions). Returns the TD error."""
+        max_next_q = self.greedy_actions(new_state, new_possible_actions)[1] if new_possible_actions else 0.0
+        temporal_difference = reward + (self.discount_factor * max_next_q) - self.get_q_value(old_state, action)
+        self.traces.visit(old_state, action)
+        self._apply_traces(self.learning_rate * temporal_difference)
+        return temporal_difference
+
+    def update_sarsa_lambda_table(self, old_state, action, reward, new_state, next_action):
+        """SARSA(lambda) update: the TD error of the move updates every traced pair. Returns the TD error."""
+        next_q = self.get_q_value(new_state, next_action) if next_action else 0.0
+        temporal_difference = reward + (self.discount_factor * next_q) - self.get_q_value(old_state, action)
+        self.traces.visit(old_state, action)
+        self._apply_traces(self.learning_rate * temporal_difference)
+        return temporal_difference
 
     def update_sarsa_table(self, old_state, action, reward, new_state, next_action):
-        """Performs the SARSA update rule."""
+        """Performs the SARSA update rule. Returns the TD error."""
         old_q = self.get_q_value(old_state, action)
         next_q = self.get_q_value(new_state, next_action) if next_action else 0.0
         temporal_difference = reward + (self.discount_factor * next_q) - old_q
         new_q = old_q + (self.learning_rate * temporal_difference)
-        self.q_table[old_state][action] = new_q
\ No newline at end of file
+        self._set_q_value(old_state, action, new_q)
+        return temporal_difference
\ No newline at end of file
@@ -0,0 +1,171 @@
+# this is discover-paths-rl/batch_environment.py
+# this file contains the BatchPDWorld class which steps many
+# independent PD-Worlds at once using NumPy arrays
+
+import numpy as np
+from constants import *
+
+# Action indices (see ACTION_INDEX in constants.py)
+PICKUP = ACTION_INDEX['Pickup']
+DROPOFF = ACTION_INDEX['Dropoff']
+
+# (dx, dy) for North, South, East, West, in ACTIONS order
+MOVE_DELTAS = np.array([(0, -1), (0, 1), (1, 0), (-1, 0)], dtype=np.int64)
+
+class BatchPDWorld:
+    """
+    Holds N independent copies of the PD-World (two agents each) as arrays and
+    applies one action per world in a single vectorized call.
+    Same rules and rewards as PDWorld (including obstacles and dropoff capacities):
+    -1 per move, -10 for an invalid action, +13 for a pickup or dropoff.
+    Agent 0 is F and agent 1 is M.
+    """
+    def __init__(self, num_worlds, pickup_locs=None, dropoff_locs=None,
+                 agent_starts=None, auto_reset=True, width=None, height=None,
+                 obstacles=None, dropoff_capacity=None):
+        self.num_worlds = num_worlds
+        self.width = GRID_WIDTH if width is None else width
+        self.height = GRID_HEIGHT if height is None else height
+        if self.width < 1 or self.height < 1:
+            raise ValueError(f"Invalid grid size: {self.width}x{self.height}")
+        self.auto_reset = auto_reset
+
+        # Cells an agent can stand on (False on obstacles)
+        self._open = np.ones((self.width, self.height), dtype=bool)
+        for x, y in (obstacles or ()):
+            self._open[x, y] = False
+
+        starts = agent_starts if agent_starts else [AGENT_F_START, AGENT_M_START]
+        self.start_pos = np.array([(s['x'], s['y']) for s in starts], dtype=np.int64)
+        self.start_has_block = np.array([s.get('has_block', False) for s in starts], dtype=bool)
+
+        self.dropoff_cells = list(dropoff_locs if dropoff_locs else DEFAULT_DROPOFF_LOCS)
+        self._dropoff_index = np.full((self.width, self.height), -1, dtype=np.int64)
+        for i, (x, y) in enumerate(self.dropoff_cells):
+            self._dropoff_index[x, y] = i
+        capacity = dropoff_capacity or {}
+        self.dropoff_capacity = np.array([capacity.get(c, np.iinfo(np.int64).max) for c in self.dropoff_cells], dtype=np.int64)
+
+        # Per-world state
+        self.agent_pos = np.zeros((num_worlds, 2, 2), dtype=np.int64) # [world, agent, (x, y)]
+        self.has_block = np.zeros((num_worlds, 2), dtype=bool)
+        self.dropoff_blocks = np.zeros((num_worlds, len(self.dropoff_cells)), dtype=np.int64)
+        self.total_blocks_delivered = np.zeros(num_worlds, dtype=np.int64)
+        self.run_steps = np.zeros(num_worlds, dtype=np.int64) # steps taken in the current run
+        self.finished_run_steps = np.zeros(num_worlds, dtype=np.int64) # run length, valid where the last step was terminal
+        self._worlds = np.arange(num_worlds)
+
+        self._set_pickups(pickup_locs if pickup_locs else DEFAULT_PICKUP_LOCS)
+        self.reset()
+
+    def _set_pickups(self, pickup_locs):
+        """Rebuilds the pickup lookup grid and block counts from a {(x, y): blocks} dict."""
+        self.pickup_cells = list(pickup_locs)
+        self.initial_pickup_blocks = np.array([pickup_locs[c] for c in self.pickup_cells], dtype=np.int64)
+        self.total_blocks_at_start = int(self.initial_pickup_blocks.sum())
+        self._pickup_index = np.full((self.width, self.height), -1, dtype=np.int64)
+        for i, (x, y) in enumerate(self.pickup_cells):
+            self._pickup_index[x, y] = i
+        self.pickup_blocks = np.tile(self.initial_pickup_blocks, (self.num_worlds, 1))
+
+    def reset(self, mask=None):
+        """Resets every world, or only the worlds where mask is True."""
+        if mask is None:
+            mask = np.ones(self.num_worlds, dtype=bool)
+        self.agent_pos[mask] = self.start_pos
+        self.has_block[mask] = self.start_has_block
+        self.pickup_blocks[mask] = self.initial_pickup_blocks
+        self.dropoff_blocks[mask] = 0
+        self.total_blocks_delivered[mask] = 0
+        self.run_steps[mask] = 0
+
+    def change_pickup_locations(self, new_pickup_locs):
+        """
+        For Experiment 4. Changes the pickup locations in every world mid-run.
+        As in PDWorld, the delivered count restarts for the new task.
+        """
+        self._set_pickups(new_pickup_locs)
+        self.total_blocks_delivered[:] = 0
+
+    def is_terminal_state(self):
+        """Boolean array: True where all blocks have been delivered."""
+        return self.total_blocks_delivered == self.total_blocks_at_start
+
+    def _agent_arrays(self, agent_idx):
+        """Broadcasts a scalar or per-world agent index to (N,) arrays for the agent and the other agent."""
+        agent = np.broadcast_to(np.asarray(agent_idx, dtype=np.int64), (self.num_worlds,))
+        return agent, 1 - agent
+
+    def valid_action_mask(self, agent_idx):
+        """
+        Returns an (N, 6) boolean mask of valid actions (columns in ACTIONS order)
+        for the acting agent in each world.
+        """
+        agent, other = self._agent_arrays(agent_idx)
+        pos = self.agent_pos[self._worlds, agent]
+        other_pos = self.agent_pos[self._worlds, other]
+        hb = self.has_block[self._worlds, agent]
+
+        mask = np.zeros((self.num_worlds, len(ACTIONS)), dtype=bool)
+        targets = pos[:, None, :] + MOVE_DELTAS[None, :, :] # (N, 4, 2)
+        in_bounds = ((targets[..., 0] >= 0) & (targets[..., 0] < self.width) &
+                     (targets[..., 1] >= 0) & (targets[..., 1] < self.height))
+        in_bounds[in_bounds] = self._open[targets[..., 0][in_bounds], targets[..., 1][in_bounds]]
+        blocked = np.all(targets == other_pos[:, None, :], axis=2)
+        mask[:, :4] = in_bounds & ~blocked
+
+        pk = self._pickup_index[pos[:, 0], pos[:, 1]]
+        stock = self.pickup_blocks[self._worlds, np.maximum(pk, 0)]
+        mask[:, PICKUP] = ~hb & (pk >= 0) & (stock > 0)
+        dk = self._dropoff_index[pos[:, 0], pos[:, 1]]
+        room = self.dropoff_blocks[self._worlds, np.maximum(dk, 0)] < self.dropoff_capacity[np.maximum(dk, 0)]
+        mask[:, DROPOFF] = hb & (dk >= 0) & room
+        return mask
+
+    def step(self, agent_idx, actions):
+        """
+        Applies one action per world for the given agent (scalar or per-world index).
+        Returns (rewards, terminal) arrays. If auto_reset is on, terminal worlds are
+        reset before returning; their run length is left in finished_run_steps.
+        """
+        actions = np.asarray(actions, dtype=np.int64)
+        agent, other = self._agent_arrays(agent_idx)
+        worlds = self._worlds
+        pos = self.agent_pos[worlds, agent]
+        other_pos = self.agent_pos[worlds, other]
+        hb = self.has_block[worlds, agent]
+
+        # Movement: boundary and blockage checks
+        is_move = actions < 4
+        targets = pos + MOVE_DELTAS[np.minimum(actions, 3)] * is_move[:, None]
+        in_bounds = ((targets[:, 0] >= 0) & (targets[:, 0] < self.width) &
+                     (targets[:, 1] >= 0) & (targets[:, 1] < self.height))
+        in_bounds[in_bounds] = self._open[targets[in_bounds, 0], targets[in_bounds, 1]]
+        blocked = np.all(targets == other_pos, axis=1)
+        move_ok = is_move & in_bounds & ~blocked
+
+        # Pickup / Dropoff eligibility
+        pk = self._pickup_index[pos[:, 0], pos[:, 1]]
+        stock = self.pickup_blocks[worlds, np.maximum(pk, 0)]
+        pickup_ok = (actions == PICKUP) & ~hb & (pk >= 0) & (stock > 0)
+        dk = self._dropoff_index[pos[:, 0], pos[:, 1]]
+        room = self.dropoff_blocks[worlds, np.maximum(dk, 0)] < self.dropoff_capacity[np.maximum(dk, 0)]
+        dropoff_ok = (actions == DROPOFF) & hb & (dk >= 0) & room
+
+        rewards = np.where(pickup_ok | dropoff_ok, 13, np.where(move_ok, -1, -10))
+
+        # Apply the valid effects
+        self.agent_pos[worlds[move_ok], agent[move_ok]] = targets[move_ok]
+        self.pickup_blocks[worlds[pickup_ok], pk[pickup_ok]] -= 1
+        self.has_block[worlds[pickup_ok], agent[pickup_ok]] = True
+        self.has_block[worlds[dropoff_ok], agent[dropoff_ok]] = False
+        self.dropoff_blocks[worlds[dropoff_ok], dk[dropoff_ok]] += 1
+        self.total_blocks_delivered += dropoff_ok
+
+        self.run_steps += 1
+        terminal = self.is_terminal_state()
+        if terminal.any():
+            self.finished_run_steps[terminal] = self.run_steps[terminal]
+            if self.auto_reset:
+                self.reset(terminal)
+        return rewards, terminal
@@ -0,0 +1,370 @@
+# this is discover-paths-rl/bench.py
+# this file contains the benchmark suite: steps/second, memory and
+# convergence speed for the world, the controllers and both training loops
+#
+# Usage:
+#   python bench.py                                  # default suite, writes results/bench_<timestamp>.json
+#   python bench.py --grid-sizes 5 10 20 --backends python numba
+#   python bench.py --baseline results/bench_old.json   # compare; exits 1 on a regression
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import datetime
+import platform
+import tempfile
+import multiprocessing
+from constants import *
+from environment import PDWorld
+from agent import Agent, RLAgentController
+from experiment import ExperimentRunner
+from event_log import EventLog, LEVELS
+
+try:
+    import resource # Unix only
+except ImportError:
+    resource = None
+
+POLICIES = ['PRANDOM', 'PEXPLOIT', 'PGREEDY']
+ALGORITHMS = ['Q_LEARNING', 'SARSA']
+
+def scaled_world(size):
+    """The default 5x5 layout stretched onto a size x size grid (size 5 gives the original world)."""
+    scale = (size - 1) / (GRID_WIDTH - 1)
+    cell = lambda pos: (round(pos[0] * scale), round(pos[1] * scale))
+    return {
+        'width': size,
+        'height': size,
+        'pickups': [[*cell(pos), blocks] for pos, blocks in DEFAULT_PICKUP_LOCS.items()],
+        'dropoffs': [[*cell(pos)] for pos in DEFAULT_DROPOFF_LOCS],
+        'agents': [{'name': 'F', **dict(zip('xy', cell((AGENT_F_START['x'], AGENT_F_START['y']))))},
+                   {'name': 'M', **dict(zip('xy', cell((AGENT_M_START['x'], AGENT_M_START['y']))))}],
+    }
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far (None where unavailable; see run_isolated)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024 # bytes on macOS, KB on Linux
+
+def q_table_bytes(controller):
+    """Approximate memory held by a controller's Q-table (deep size for the dict form)."""
+    if controller.dense:
+        return int(controller.q_table.nbytes)
+    q_table = controller.q_table
+    total = sys.getsizeof(q_table)
+    for state, actions in q_table.items():
+        total += sys.getsizeof(state) + sys.getsizeof(actions)
+        total += sum(sys.getsizeof(v) for v in actions.values())
+    return total
+
+def _ops_per_sec(count, seconds):
+    return count / seconds if seconds > 0 else None
+
+# --- Micro benchmarks ---
+
+def bench_world_ops(world_def, n_ops, rng):
+    """Times PDWorld.get_possible_actions and PDWorld.apply_action on random positions/actions."""
+    runner_config = {'name': 'bench', 'world': world_def}
+    world, starts = _make_world(runner_config)
+
+    # Sample (agent, other) pairs from a random walk so lookups hit varied cells
+    agent, other = Agent('F', **starts[0]), Agent('M', **starts[1])
+    pairs = []
+    for i in range(n_ops):
+        mover, still = (agent, other) if i % 2 == 0 else (other, agent)
+        world.apply_action(mover, still, rng.choice(world.get_possible_actions(mover, still)))
+        pairs.append((Agent('F', agent.x, agent.y, agent.has_block), Agent('M', other.x, other.y, other.has_block)))
+        if world.is_terminal_state():
+            world.reset()
+
+    start = time.perf_counter()
+    for a, o in pairs:
+        world.get_possible_actions(a, o)
+    possible_seconds = time.perf_counter() - start
+
+    world.reset()
+    agent, other = Agent('F', **starts[0]), Agent('M', **starts[1])
+    actions = [rng.choice(ACTIONS) for _ in range(n_ops)]
+    start = time.perf_counter()
+    for i, action in enumerate(actions):
+        if i % 2 == 0:
+            world.apply_action(agent, other, action)
+        else:
+            world.apply_action(other, agent, action)
+    apply_seconds = time.perf_counter() - start
+
+    return {
+        'get_possible_actions_per_sec': _ops_per_sec(n_ops, possible_seconds),
+        'apply_action_per_sec': _ops_per_sec(n_ops, apply_seconds),
+    }
+
+def bench_choose_action(world_def, n_ops, rng, dense):
+    """Times RLAgentController.choose_action for each policy on a partly filled Q-table."""
+    world, starts = _make_world({'name': 'bench', 'world': world_def})
+    agent, other = Agent('F', **starts[0]), Agent('M', **starts[1])
+    controller = RLAgentController(agent, other, world, 0.3, 0.5, dense_q_table=dense)
+
+    # Random-walk states with random Q-values so max/argmax do real work
+    samples = []
+    for _ in range(min(n_ops, 5000)):
+        agent.x, agent.y = rng.randrange(world.width), rng.randrange(world.height)
+        possible = world.get_possible_actions(agent, other)
+        if not possible:
+            continue
+        state = controller.get_current_state()
+        for action in possible:
+            controller.get_q_value(state, action)
+            controller._set_q_value(state, action, rng.uniform(-5, 5))
+        samples.append(((agent.x, agent.y), possible))
+
+    results = {}
+    for policy in POLICIES:
+        start = time.perf_counter()
+        for i in range(n_ops):
+            (agent.x, agent.y), possible = samples[i % len(samples)]
+            controller.choose_action(policy, possible)
+        results[f'choose_action_{policy}_per_sec'] = _ops_per_sec(n_ops, time.perf_counter() - start)
+    return results
+
+def bench_batch_world(world_def, n_worlds, n_steps, seed):
+    """
+    Times BatchPDWorld stepping n_worlds worlds for n_steps random valid actions (auto-reset on),
+    next to one PDWorld doing the same number of world steps one at a time.
+    """
+    import numpy as np
+    from batch_environment import BatchPDWorld
+    from world_config import world_spec_from_config
+    spec = world_spec_from_config({'name': 'bench', 'world': world_def})
+    batch = BatchPDWorld(n_worlds, spec['pickup_locs'], spec['dropoff_locs'], agent_starts=spec['agents'][:2],
+                         width=spec['width'], height=spec['height'], obstacles=spec['obstacles'],
+                         dropoff_capacity=spec['dropoff_capacity'])
+    np_rng = np.random.default_rng(seed)
+    start = time.perf_counter()
+    for step in range(n_steps):
+        mask = batch.valid_action_mask(step % 2)
+        actions = (np_rng.random(mask.shape) * mask).argmax(axis=1) # uniform over the valid actions
+        batch.step(step % 2, actions)
+    batch_seconds = time.perf_counter() - start
+
+    world, starts = _make_world({'name': 'bench', 'world': world_def})
+    agents = [Agent('F', **starts[0]), Agent('M', **starts[1])]
+    rng = random.Random(seed)
+    single_steps = n_worlds * n_steps
+    start = time.perf_counter()
+    for step in range(single_steps):
+        mover, other = agents[step % 2], agents[1 - step % 2]
+        possible = world.get_possible_actions(mover, other)
+        if possible:
+            world.apply_action(mover, other, rng.choice(possible))
+        if world.is_terminal_state():
+            world.reset()
+            for agent, start_cell in zip(agents, starts):
+                agent.reset(**start_cell)
+    single_seconds = time.perf_counter() - start
+    return {
+        'world_steps_per_sec': _ops_per_sec(n_worlds * n_steps, batch_seconds),
+        'single_world_steps_per_sec': _ops_per_sec(single_steps, single_seconds),
+    }
+
+def _make_world(config):
+    """Builds a PDWorld (and agent starts) the same way ExperimentRunner does."""
+    from world_config import world_spec_from_config
+    spec = world_spec_from_config(config)
+    world = PDWorld(spec['pickup_locs'], spec['dropoff_locs'], width=spec['width'], height=spec['height'],
+                    obstacles=spec['obstacles'], dropoff_capacity=spec['dropoff_capacity'])
+    starts = [{k: a[k] for k in ('x', 'y', 'has_block')} for a in spec['agents']]
+    return world, starts
+
+# --- Training loop benchmarks ---
+
+def run_isolated(function, *args):
+    """
+    Calls function(*args) in a fresh (spawned) process and returns its result, so the peak RSS
+    it reports belongs to that one benchmark rather than to everything this process ran before.
+    """
+    with multiprocessing.get_context('spawn').Pool(1) as pool:
+        return pool.apply(function, args)
+
+def bench_training(world_def, algorithm, policy, backend, total_steps, terminal_n, dense, seed, repeat=1,
+                   log_level='INFO'):
+    """
+    Runs one ExperimentRunner training loop and measures throughput, memory and convergence.
+    With repeat > 1 the same seeded run is repeated and the fastest time is kept. Events at
+    `log_level` and above are written to a temporary log file, and the time includes writing them.
+    Run it through run_isolated for a per-benchmark peak_rss_mb; rss_growth_mb is the peak's
+    growth over the process's peak before the first run (after imports and numba compilation).
+    """
+    schedule = [(total_steps, 'PRANDOM')] if policy == 'PRANDOM' else \
+               [(min(500, total_steps), 'PRANDOM'), (max(total_steps - 500, 0), policy)]
+    config = {
+        'name': f'bench_{algorithm}_{policy}',
+        'total_steps': total_steps,
+        'algorithm': algorithm,
+        'learning_rate': 0.3,
+        'discount_factor': 0.5,
+        'policy_schedule': schedule,
+        'world': world_def,
+        'dense_q_table': dense,
+        'backend': backend,
+    }
+    with tempfile.TemporaryDirectory() as log_dir:
+        log_path = os.path.join(log_dir, 'events.jsonl')
+        if backend == 'numba': # compile (or load the cached kernel) before measuring
+            ExperimentRunner({**config, 'total_steps': 100, 'policy_schedule': [(100, 'PRANDOM')]},
+                             event_log=EventLog()).train()
+        rss_start = peak_rss_mb()
+        seconds = float('inf')
+        for _ in range(max(repeat, 1)):
+            random.seed(seed)
+            event_log = EventLog(log_path, level=log_level)
+            runner = ExperimentRunner(config, event_log=event_log)
+            start = time.perf_counter()
+            runner.train()
+            event_log.close()
+            seconds = min(seconds, time.perf_counter() - start)
+        log_bytes = os.path.getsize(log_path)
+    rss_peak = peak_rss_mb()
+
+    steps_to_n = runner.terminal_steps[terminal_n - 1] + 1 if len(runner.terminal_steps) >= terminal_n else None
+    return {
+        'seconds': seconds,
+        'steps_per_sec': _ops_per_sec(total_steps, seconds),
+        'terminal_states': int(runner.terminal_states_reached),
+        'avg_steps_per_run': (sum(runner.steps_per_run) / len(runner.steps_per_run)) if runner.steps_per_run else None,
+        f'steps_to_{terminal_n}_terminal': steps_to_n,
+        # Per-step cost is roughly constant, so scale the elapsed time by the step count
+        f'seconds_to_{terminal_n}_terminal': seconds * steps_to_n / total_steps if steps_to_n else None,
+        'q_table_states': sum(len(c.q_table) for c in runner.controllers),
+        'q_table_bytes': sum(q_table_bytes(c) for c in runner.controllers),
+        'log_bytes': log_bytes,
+        'peak_rss_mb': rss_peak,
+        'rss_growth_mb': rss_peak - rss_start if rss_peak is not None else None,
+    }
+
+def run_suite(args):
+    """Runs every benchmark case and returns the list of {'name', 'params', 'metrics'} results."""
+    results = []
+    rng = random.Random(args.seed)
+
+    def record(name, params, metrics):
+        results.append({'name': name, 'params': params, 'metrics': metrics})
+        shown = (metrics.get('steps_per_sec') or metrics.get('world_steps_per_sec') or metrics.get('apply_action_per_sec')
+                 or metrics.get('choose_action_PGREEDY_per_sec'))
+        print(f"  {name:<60} {shown:>12,.0f}/s" if shown else f"  {name}", flush=True)
+
+    for size in args.grid_sizes:
+        world_def = scaled_world(size)
+        print(f"\nGrid {size}x{size}")
+        record(f'world_ops/grid{size}', {'grid': size}, bench_world_ops(world_def, args.micro_ops, rng))
+        if args.batch_worlds:
+            record(f'batch_world/grid{size}/{args.batch_worlds}', {'grid': size, 'worlds': args.batch_worlds},
+                   bench_batch_world(world_def, args.batch_worlds, max(args.micro_ops // args.batch_worlds, 1), args.seed))
+        for dense in args.q_tables:
+            record(f'choose_action/grid{size}/{dense}', {'grid': size, 'q_table': dense},
+                   bench_choose_action(world_def, args.micro_ops, rng, dense == 'dense'))
+
+        for backend in args.backends:
+            if backend == 'numba':
+                from compiled_backend import NUMBA_AVAILABLE
+                if not NUMBA_AVAILABLE:
+                    print("  (numba is not installed, skipping the numba backend)")
+                    continue
+            for q_table in (['dense'] if backend == 'numba' else args.q_tables):
+                for algorithm in args.algorithms:
+                    for policy in args.policies:
+                        params = {'grid': size, 'algorithm': algorithm, 'policy': policy,
+                                  'backend': backend, 'q_table': q_table, 'total_steps': args.steps}
+                        metrics = run_isolated(bench_training, world_def, algorithm, policy, backend, args.steps,
+                                               args.terminal_n, q_table == 'dense', args.seed, args.repeat,
+                                               args.log_level)
+                        record(f'train/grid{size}/{backend}/{q_table}/{algorithm}/{policy}', params, metrics)
+    return results
+
+# --- Baseline comparison ---
+
+# Metrics where larger is better; everything else is informational
+RATE_KEYS = ('_per_sec',)
+
+def compare_to_baseline(results, baseline, tolerance):
+    """Prints the speed ratio for each benchmark found in both runs. Returns the regressed names."""
+    old = {r['name']: r['metrics'] for r in baseline['results']}
+    regressions = []
+    print(f"\nComparison against baseline (tolerance {tolerance:.0%}):")
+    for result in results:
+        if result['name'] not in old:
+            continue
+        for key, value in result['metrics'].items():
+            old_value = old[result['name']].get(key)
+            if not key.endswith(RATE_KEYS) or not value or not old_value:
+                continue
+            ratio = value / old_value
+            flag = ''
+            if ratio < 1 - tolerance:
+                flag = '  <-- REGRESSION'
+                regressions.append(f"{result['name']}:{key}")
+            print(f"  {result['name']:<55} {key:<32} {ratio:6.2f}x{flag}")
+    return regressions
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the PD-World simulator and training loops.")
+    parser.add_argument('--grid-sizes', type=int, nargs='+', default=[5, 10])
+    parser.add_argument('--steps', type=int, default=8000, help="Steps per training-loop benchmark.")
+    parser.add_argument('--algorithms', nargs='+', default=ALGORITHMS, choices=ALGORITHMS)
+    parser.add_argument('--policies', nargs='+', default=POLICIES, choices=POLICIES)
+    parser.add_argument('--backends', nargs='+', default=['python'], choices=['python', 'numba'])
+    parser.add_argument('--q-tables', nargs='+', default=['dict', 'dense'], choices=['dict', 'dense'])
+    parser.add_argument('--micro-ops', type=int, default=50000, help="Calls per micro benchmark.")
+    parser.add_argument('--batch-worlds', type=int, default=256,
+                        help="Worlds stepped together in the BatchPDWorld benchmark (0 = skip it).")
+    parser.add_argument('--terminal-n', type=int, default=10, help="N for the time-to-N-terminal-states metric.")
+    parser.add_argument('--repeat', type=int, default=3, help="Repeats per training benchmark (fastest is kept).")
+    parser.add_argument('--log-level', default='INFO', choices=list(LEVELS),
+                        help="Events written to the training benchmarks' log files.")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default=None, help="JSON output path (default results/bench_<timestamp>.json).")
+    parser.add_argument('--baseline', default=None, help="Earlier JSON output to compare against.")
+    parser.add_argument('--tolerance', type=float, default=0.10, help="Allowed slowdown before flagging a regression.")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = run_suite(args)
+
+    try:
+        import numpy
+        numpy_version = numpy.__version__
+    except ImportError:
+        numpy_version = None
+    report = {
+        'meta': {
+            'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'numpy': numpy_version,
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+            'args': vars(args),
+        },
+        'results': results,
+    }
+    out = args.out or os.path.join('results', f"bench_{datetime.datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.json")
+    os.makedirs(os.path.dirname(out) or '.', exist_ok=True)
+    with open(out, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nBenchmark results saved to '{out}'")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) found.")
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,194 @@
+# this is discover-paths-rl/checkpoint.py
+# this file saves and restores experiment checkpoints: both agents' Q-tables,
+# the world and agent state, the controllers' random streams and the state of
+# the run in progress
+
+import os
+import json
+import numpy as np
+from constants import ACTIONS
+from q_table import sparse_q_arrays
+from rng import RandomStream
+from results_sink import atomic_write
+
+FORMAT_VERSION = 3 # 2: per-controller random streams instead of the global `random` state; 3: run state
+
+def _load_q_table(controller, states, values):
+    """Replaces a controller's Q-table with the sparse arrays (dict or dense store as configured)."""
+    if controller.argmax_cache is not None:
+        controller.argmax_cache.clear()
+    if controller.dense:
+        table = controller.q_table
+        table.values[...] = 0.0
+        table.visited[...] = False
+        idx = tuple(np.asarray(states, dtype=np.int64).T)
+        table.values[idx] = values
+        table.visited[idx] = True
+        return
+    controller.q_table = {
+        (int(x), int(y), bool(b), *map(int, rest)): dict(zip(ACTIONS, map(float, row)))
+        for (x, y, b, *rest), row in zip(states.tolist(), values)
+    }
+
+def checkpoint_arrays(runner, step):
+    """Collects everything a checkpoint stores as a dict of NumPy arrays (plus a JSON 'meta' string)."""
+    world = runner.world
+    arrays = {}
+    for i, controller in enumerate(runner.controllers):
+        arrays[f'q_states_{i}'], arrays[f'q_values_{i}'] = sparse_q_arrays(controller.q_table)
+    arrays['agent_pos'] = np.array([(a.x, a.y) for a in runner.agents], dtype=np.int32)
+    arrays['agent_has_block'] = np.array([a.has_block for a in runner.agents], dtype=bool)
+    arrays['pickup_cells'] = np.array(list(world.initial_pickup_locs), dtype=np.int32).reshape(-1, 2)
+    arrays['pickup_initial'] = np.array(list(world.initial_pickup_locs.values()), dtype=np.int64)
+    arrays['pickup_blocks'] = np.array([world.pickup_locs[c] for c in world.initial_pickup_locs], dtype=np.int64)
+    arrays['dropoff_cells'] = np.array(list(world.dropoff_locs), dtype=np.int32).reshape(-1, 2)
+    arrays['dropoff_blocks'] = np.array(list(world.dropoff_locs.values()), dtype=np.int64)
+    arrays['runs'] = runner.metrics.runs.to_array() # the run table so far
+    meta = {
+        'format_version': FORMAT_VERSION,
+        'rng_streams': [controller.rng.state() for controller in runner.controllers],
+        'turn_stream': runner.turn_rng.state(), # random turn order
+        'experiment': runner.config['name'],
+        'algorithm': runner.config['algorithm'],
+        'step': step,
+        'width': world.width,
+        'height': world.height,
+        'agents': [a.name for a in runner.agents],
+        'total_blocks_delivered': world.total_blocks_delivered,
+        'terminal_states': int(runner.terminal_states_reached),
+        'total_rewards': runner.total_rewards,
+        'run': { # the run in progress and what decides when training stops
+            'current_run_steps': runner.current_run_steps,
+            'run_start_step': runner._run_start_step,
+            'round_order': list(runner._round_order),
+            'frozen_view': runner.view.frozen if runner.view is not None else None,
+            'world_changed': runner.world_changed,
+            'first_policy_switch_run': runner.first_policy_switch_run,
+            'learner': runner.learner.state() if runner.learner is not None else runner.learner_state,
+            'metrics': runner.metrics.state(),
+            'stop': runner.stop_state(),
+        },
+    }
+    arrays['meta'] = np.array(json.dumps(meta))
+    return arrays
+
+def _write_checkpoint(path, arrays):
+    """The atomic_write function for a checkpoint's arrays (.npz file or directory of .npy files)."""
+    def write(tmp_path):
+        if path.endswith('.npz'):
+            with open(tmp_path, 'wb') as f:
+                np.savez_compressed(f, **arrays)
+            return
+        os.makedirs(tmp_path)
+        for name, array in arrays.items():
+            if name == 'meta':
+                with open(os.path.join(tmp_path, 'meta.json'), 'w', encoding='utf-8') as f:
+                    f.write(str(array))
+            else:
+                np.save(os.path.join(tmp_path, f'{name}.npy'), array)
+    return write
+
+def save_checkpoint(runner, path, step, sink=None):
+    """
+    Writes a checkpoint of the runner after `step` steps. The file is written in full, then moved into place.
+      path ending in .npz - one compressed file
+      any other path      - a directory of .npy files (memory-mappable, see load_checkpoint)
+    With a ResultsSink the arrays are collected now and written in the background.
+    Returns the path.
+    """
+    arrays = checkpoint_arrays(runner, step)
+    if sink is not None:
+        return sink.submit(path, _write_checkpoint(path, arrays), sum(a.nbytes for a in arrays.values()))
+    return atomic_write(path, _write_checkpoint(path, arrays))
+
+def load_checkpoint(path, mmap=False):
+    """
+    Reads a checkpoint into {'meta': dict, <name>: array, ...}.
+    With mmap=True, a directory checkpoint's arrays are memory-mapped read-only instead of read into memory.
+    """
+    if path.endswith('.npz'):
+        with np.load(path) as data:
+            checkpoint = {name: data[name] for name in data.files}
+        checkpoint['meta'] = json.loads(str(checkpoint['meta']))
+        return checkpoint
+    if not os.path.isdir(path):
+        raise ValueError(f"Checkpoint not found: {path}")
+    checkpoint = {}
+    for filename in os.listdir(path):
+        name, ext = os.path.splitext(filename)
+        if ext == '.npy':
+            checkpoint[name] = np.load(os.path.join(path, filename), mmap_mode='r' if mmap else None)
+    with open(os.path.join(path, 'meta.json'), 'r', encoding='utf-8') as f:
+        checkpoint['meta'] = json.load(f)
+    return checkpoint
+
+def restore_checkpoint(runner, checkpoint, restore='q_tables'):
+    """
+    Loads a checkpoint (path or load_checkpoint dict) into a runner.
+      restore='q_tables' - only the learned Q-tables (warm start; world, agents and RNG start fresh)
+      restore='all'      - resume: also the world, agents, random streams, step, reward totals, run table,
+                           the run in progress (its steps, the learner's pending actions / traces) and the
+                           early-stop / convergence state. Training then continues from the checkpoint's step.
+                           Not restored: the replay buffer and the sampled per-step metrics rows.
+    Raises ValueError if the checkpoint was made on a different grid or number of agents, or (restore='all')
+    by an older format without the run state.
+    """
+    if restore not in ('q_tables', 'all'):
+        raise ValueError(f"Unknown checkpoint restore mode: {restore}")
+    if isinstance(checkpoint, str):
+        checkpoint = load_checkpoint(checkpoint, mmap=True)
+    meta = checkpoint['meta']
+    world = runner.world
+    if (meta['width'], meta['height']) != (world.width, world.height):
+        raise ValueError(f"Checkpoint grid {meta['width']}x{meta['height']} does not match "
+                         f"the experiment's {world.width}x{world.height} grid")
+
+    if len(meta['agents']) != len(runner.agents):
+        raise ValueError(f"Checkpoint has {len(meta['agents'])} agents, the experiment has {len(runner.agents)}")
+    for i, controller in enumerate(runner.controllers):
+        _load_q_table(controller, checkpoint[f'q_states_{i}'], checkpoint[f'q_values_{i}'])
+    runner.link_shared_q_table()
+    if restore == 'q_tables':
+        return meta
+    if meta['format_version'] < FORMAT_VERSION:
+        raise ValueError(f"Checkpoint format {meta['format_version']} has no run state to resume from; "
+                         f"use restore='q_tables'")
+
+    dropoff_cells = [tuple(c) for c in checkpoint['dropoff_cells'].tolist()]
+    if set(dropoff_cells) != set(world.dropoff_locs):
+        raise ValueError(f"Checkpoint dropoff cells {dropoff_cells} do not match the experiment's world")
+    pickup_cells = [tuple(c) for c in checkpoint['pickup_cells'].tolist()]
+    world.initial_pickup_locs = dict(zip(pickup_cells, checkpoint['pickup_initial'].tolist()))
+    world.pickup_locs = dict(zip(pickup_cells, checkpoint['pickup_blocks'].tolist()))
+    world.dropoff_locs = dict(zip(dropoff_cells, checkpoint['dropoff_blocks'].tolist()))
+    world.total_blocks_at_start = sum(world.initial_pickup_locs.values())
+    world.total_blocks_delivered = meta['total_blocks_delivered']
+    world._build_cell_flags()
+
+    for agent, (x, y), has_block in zip(runner.agents, checkpoint['agent_pos'].tolist(),
+                                        checkpoint['agent_has_block'].tolist()):
+        agent.x, agent.y, agent.has_block = x, y, has_block
+    if world.occupied is not None:
+        world.track_agents(runner.agents)
+
+    for controller, state in zip(runner.controllers, meta['rng_streams']):
+        controller.rng = RandomStream.from_state(state)
+    runner.turn_rng = RandomStream.from_state(meta['turn_stream'])
+
+    run = meta['run']
+    runner.start_step = meta['step']
+    runner.terminal_states_reached = meta['terminal_states']
+    runner.total_rewards.update(meta['total_rewards'])
+    runner.current_run_steps = run['current_run_steps']
+    runner._run_start_step = run['run_start_step']
+    runner._round_order = run['round_order']
+    if runner.view is not None and run['frozen_view'] is not None:
+        runner.view.frozen = [tuple(p) for p in run['frozen_view']]
+        world.visible_occupied = set(runner.view.frozen)
+    runner.world_changed = run['world_changed']
+    runner.first_policy_switch_run = run['first_policy_switch_run']
+    if meta['algorithm'] == runner.config['algorithm']: # otherwise the new learner starts its run afresh
+        runner.learner_state = run['learner']
+    runner.metrics.load_state(run['metrics'], checkpoint['runs'])
+    runner.load_stop_state(run['stop'])
+    return meta
@@ -0,0 +1,512 @@
+# this is discover-paths-rl/compiled_backend.py
+# this file contains the optional numba backend that runs a whole
+# Q-Learning or SARSA experiment as a single compiled kernel
+
+import numpy as np
+from constants import ACTIONS
+from q_table import DenseQTable
+from rng import stream_generator
+from world_config import cell_list
+from metrics import STEP_DTYPE
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError: # numba is optional: keep the module importable
+    NUMBA_AVAILABLE = False
+    def njit(*args, **kwargs):
+        if args and callable(args[0]):
+            return args[0]
+        return lambda f: f
+
+# Policy name -> code used inside the kernel
+POLICY_CODES = {'PRANDOM': 0, 'PEXPLOIT': 1, 'PGREEDY': 2}
+
+# Action indices follow ACTIONS: North, South, East, West, Pickup, Dropoff
+PICKUP = 4
+DROPOFF = 5
+OBSTACLE = -2 # marks obstacle cells in the pickup index grid
+UNLIMITED = 2 ** 62 # capacity of a dropoff cell without a limit
+MAX_CONVERTED_BYTES = 512 * 2**20 # largest dense table run_compiled converts a dict Q-table to
+DX = np.array([0, 0, 1, -1], dtype=np.int64)
+DY = np.array([-1, 1, 0, 0], dtype=np.int64)
+
+# --- Random draws ---
+# Each controller's RandomStream continues inside the kernel as a NumPy Generator
+# (rng.stream_generator at the stream's position); used[turn] counts the uniforms
+# an agent drew, so its stream can skip past them afterwards. One uniform per
+# draw, mapped to an index exactly like RandomStream.below.
+
+@njit(cache=True)
+def _random(turn, rng_f, rng_m, used):
+    """RandomStream.random() of the given agent's stream."""
+    used[turn] += 1
+    if turn == 0:
+        return rng_f.random()
+    return rng_m.random()
+
+@njit(cache=True)
+def _below(n, turn, rng_f, rng_m, used):
+    """RandomStream.below(n) (so choice(seq) == seq[_below(len(seq))])."""
+    return min(int(_random(turn, rng_f, rng_m, used) * n), n - 1)
+
+# --- World rules (mirror PDWorld) ---
+
+@njit(cache=True)
+def _possible_actions(turn, pos, has_block, pickup_index, pickup_blocks, dropoff_room, out):
+    """Fills out[] with the valid action indices in ACTIONS order and returns how many there are."""
+    width, height = dropoff_room.shape
+    x, y = pos[turn, 0], pos[turn, 1]
+    ox, oy = pos[1 - turn, 0], pos[1 - turn, 1]
+    n = 0
+    for a in range(4):
+        nx, ny = x + DX[a], y + DY[a]
+        if 0 <= nx < width and 0 <= ny < height and pickup_index[nx, ny] != OBSTACLE and not (nx == ox and ny == oy):
+            out[n] = a
+            n += 1
+    pk = pickup_index[x, y]
+    if has_block[turn] == 0 and pk >= 0 and pickup_blocks[pk] > 0:
+        out[n] = PICKUP
+        n += 1
+    if has_block[turn] == 1 and dropoff_room[x, y] > 0:
+        out[n] = DROPOFF
+        n += 1
+    return n
+
+@njit(cache=True)
+def _apply_action(turn, action, pos, has_block, pickup_index, pickup_blocks, dropoff_room, dropoff_blocks, delivered):
+    """Applies the action and returns the reward (-1 move, -10 invalid, +13 pickup/dropoff)."""
+    width, height = dropoff_room.shape
+    x, y = pos[turn, 0], pos[turn, 1]
+    if action == PICKUP:
+        pk = pickup_index[x, y]
+        if has_block[turn] == 0 and pk >= 0 and pickup_blocks[pk] > 0:
+            has_block[turn] = 1
+            pickup_blocks[pk] -= 1
+            return 13
+        return -10
+    if action == DROPOFF:
+        if has_block[turn] == 1 and dropoff_room[x, y] > 0:
+            has_block[turn] = 0
+            dropoff_blocks[x, y] += 1
+            dropoff_room[x, y] -= 1
+            delivered[0] += 1
+            return 13
+        return -10
+    nx, ny = x + DX[action], y + DY[action]
+    if not (0 <= nx < width and 0 <= ny < height) or pickup_index[nx, ny] == OBSTACLE:
+        return -10
+    if nx == pos[1 - turn, 0] and ny == pos[1 - turn, 1]:
+        return -10
+    pos[turn, 0] = nx
+    pos[turn, 1] = ny
+    return -1
+
+# --- Controller logic (mirror RLAgentController) ---
+
+@njit(cache=True)
+def _max_q_action(q, visited, turn, s, poss, n, ties, rng_f, rng_m, used):
+    """get_max_q_action on the acting agent's q / visited arrays: returns (action, max_q), breaking ties with choice()."""
+    if n == 0:
+        return -1, 0.0
+    visited[s[0], s[1], s[2], s[3], s[4]] = True
+    max_q = -np.inf
+    n_ties = 0
+    for i in range(n):
+        q_val = q[s[0], s[1], s[2], s[3], s[4], poss[i]]
+        if q_val > max_q:
+            max_q = q_val
+            ties[0] = poss[i]
+            n_ties = 1
+        elif q_val == max_q:
+            ties[n_ties] = poss[i]
+            n_ties += 1
+    return ties[_below(n_ties, turn, rng_f, rng_m, used)], max_q
+
+@njit(cache=True)
+def _choose_action(policy, q, visited, turn, s, poss, n, ties, rng_f, rng_m, used):
+    """choose_action: Pickup/Dropoff take precedence, then PRANDOM/PEXPLOIT/PGREEDY."""
+    if n == 0:
+        return -1
+    for i in range(n):
+        if poss[i] == PICKUP:
+            return PICKUP
+    for i in range(n):
+        if poss[i] == DROPOFF:
+            return DROPOFF
+    if policy == 0:
+        return poss[_below(n, turn, rng_f, rng_m, used)]
+    best, _ = _max_q_action(q, visited, turn, s, poss, n, ties, rng_f, rng_m, used)
+    if policy == 2:
+        return best
+    if _random(turn, rng_f, rng_m, used) < 0.8: # 80% exploit
+        return best
+    m = 0 # 20% explore among the other actions
+    for i in range(n):
+        if poss[i] != best:
+            ties[m] = poss[i]
+            m += 1
+    if m == 0:
+        return best
+    return ties[_below(m, turn, rng_f, rng_m, used)]
+
+@njit(cache=True)
+def _fill_state(turn, pos, has_block, s):
+    s[0] = pos[turn, 0]
+    s[1] = pos[turn, 1]
+    s[2] = has_block[turn]
+    s[3] = pos[1 - turn, 0]
+    s[4] = pos[1 - turn, 1]
+
+@njit(cache=True)
+def _train_kernel(is_sarsa, initial_policy, policy_codes, first_switch_step, learning_rate, discount_factor,
+                  q_f, q_m, visited_f, visited_m, rng_f, rng_m, used, start_pos, start_has_block,
+                  pickup_index, pickup_init, dropoff_capacity,
+                  change_after, new_pickup_index, new_pickup_init,
+                  pos, has_block, pickup_blocks, dropoff_blocks,
+                  steps_per_run, terminal_steps, run_rewards, rewards,
+                  sample_every, samples, sample_td,
+                  patience, window, min_delta, best_mean, sa_state, sa_action, out):
+    """
+    Runs the full training loop on both agents' dense Q-values and visited flags (q_f / visited_f
+    for F, q_m / visited_m for M, updated in place). pickup_index marks pickup cells (>= 0) and
+    obstacles (OBSTACLE); dropoff_capacity is 0 except on dropoff cells. Outputs:
+    steps_per_run/terminal_steps/run_rewards (cumulative rewards, distance total and distance
+    sample count at each terminal state) for the first out[0] runs, rewards per agent,
+    out[1] = number of Manhattan distance samples, out[2] = first_policy_switch_run, out[3] = world change step (-1 if none),
+    out[4] = blocks delivered in the unfinished run, out[5] = Manhattan distance total,
+    out[6] = number of sampled step rows in samples/sample_td (every sample_every steps, 0 = none),
+    out[7] = steps trained, out[8] = 1 if early stopping triggered, out[9] = steps of the unfinished run,
+    out[10] = terminal states since the best mean. With patience > 0, training stops once the mean steps
+    of the last `window` runs hasn't dropped below best_mean[0] - min_delta for `patience` terminal
+    states (best_mean[0] holds the best mean on return). sa_state / sa_action (2x5, 2) hold SARSA's
+    pending (S, A) per agent on return (action -1: trapped).
+    Returns the final pickup block counts.
+    """
+    total_steps = policy_codes.shape[0]
+    delivered = np.zeros(1, dtype=np.int64)
+    total_blocks = pickup_init.sum()
+    dropoff_room = dropoff_capacity - dropoff_blocks # space left on each dropoff cell
+    poss = np.empty(6, dtype=np.int64)
+    ties = np.empty(6, dtype=np.int64)
+    s_old = np.empty(5, dtype=np.int64)
+    s_new = np.empty(5, dtype=np.int64)
+    n_runs = 0
+    n_dist = 0
+    dist_sum = 0
+    n_samples = 0
+    runs_since_best = 0
+    steps_trained = total_steps
+    stopped = 0
+    first_switch_run = -1
+    world_changed = False
+    change_step = -1
+    current_run_steps = 0
+
+    if is_sarsa:
+        for i in range(2):
+            _fill_state(i, pos, has_block, sa_state[i])
+            n = _possible_actions(i, pos, has_block, pickup_index, pickup_blocks, dropoff_room, poss)
+            sa_action[i] = _choose_action(initial_policy, q_f if i == 0 else q_m, visited_f if i == 0 else visited_m,
+                                          i, sa_state[i], poss, n, ties, rng_f, rng_m, used)
+
+    for step in range(total_steps):
+        policy = policy_codes[step]
+        if step == first_switch_step:
+            first_switch_run = n_runs
+
+        # Experiment 4 world change
+        if change_after >= 0 and not world_changed and n_runs == change_after:
+            pickup_index = new_pickup_index
+            pickup_init = new_pickup_init
+            pickup_blocks = new_pickup_init.copy()
+            total_blocks = new_pickup_init.sum()
+            delivered[0] = 0
+            world_changed = True
+            change_step = step
+
+        turn = step % 2
+        q = q_f if turn == 0 else q_m
+        visited = visited_f if turn == 0 else visited_m
+        if is_sarsa:
+            action = sa_action[turn]
+            if action == -1:
+                continue # Agent was trapped
+            for k in range(5):
+                s_old[k] = sa_state[turn, k]
+        else:
+            _fill_state(turn, pos, has_block, s_old)
+            n = _possible_actions(turn, pos, has_block, pickup_index, pickup_blocks, dropoff_room, poss)
+            action = _choose_action(policy, q, visited, turn, s_old, poss, n, ties, rng_f, rng_m, used)
+            if action == -1:
+                continue # Agent is trapped
+
+        reward = _apply_action(turn, action, pos, has_block, pickup_index, pickup_blocks,
+                               dropoff_room, dropoff_blocks, delivered)
+        rewards[turn] += reward
+        _fill_state(turn, pos, has_block, s_new)
+        n = _possible_actions(turn, pos, has_block, pickup_index, pickup_blocks, dropoff_room, poss)
+
+        # TD update
+        visited[s_old[0], s_old[1], s_old[2], s_old[3], s_old[4]] = True
+        old_q = q[s_old[0], s_old[1], s_old[2], s_old[3], s_old[4], action]
+        if is_sarsa:
+            next_action = _choose_action(policy, q, visited, turn, s_new, poss, n, ties, rng_f, rng_m, used)
+            next_q = 0.0
+            if next_action != -1:
+                visited[s_new[0], s_new[1], s_new[2], s_new[3], s_new[4]] = True
+                next_q = q[s_new[0], s_new[1], s_new[2], s_new[3], s_new[4], next_action]
+            sa_action[turn] = next_action
+            for k in range(5):
+                sa_state[turn, k] = s_new[k]
+        else:
+            _, next_q = _max_q_action(q, visited, turn, s_new, poss, n, ties, rng_f, rng_m, used)
+        temporal_difference = reward + (discount_factor * next_q) - old_q
+        q[s_old[0], s_old[1], s_old[2], s_old[3], s_old[4], action] = old_q + (learning_rate * temporal_difference)
+        if sample_every > 0 and step % sample_every == 0:
+            samples[n_samples, 0] = step
+            samples[n_samples, 1] = turn
+            samples[n_samples, 2] = reward
+            for i in range(2):
+                samples[n_samples, 3 + 3 * i] = pos[i, 0]
+                samples[n_samples, 4 + 3 * i] = pos[i, 1]
+                samples[n_samples, 5 + 3 * i] = has_block[i]
+            sample_td[n_samples] = temporal_difference
+            n_samples += 1
+
+        # Stats and terminal state check (ExperimentRunner.finish_run)
+        if step % 2 == 1:
+            dist_sum += abs(pos[0, 0] - pos[1, 0]) + abs(pos[0, 1] - pos[1, 1])
+            n_dist += 1
+        if delivered[0] == total_blocks:
+            steps_per_run[n_runs] = current_run_steps + 1
+            terminal_steps[n_runs] = step
+            run_rewards[n_runs, 0] = rewards[0]
+            run_rewards[n_runs, 1] = rewards[1]
+            run_rewards[n_runs, 2] = dist_sum
+            run_rewards[n_runs, 3] = n_dist
+            n_runs += 1
+            pickup_blocks[:] = pickup_init
+            dropoff_blocks[:, :] = 0
+            dropoff_room[:, :] = dropoff_capacity
+            delivered[0] = 0
+            pos[:, :] = start_pos
+            has_block[:] = start_has_block
+            current_run_steps = 0
+            if patience > 0: # early stopping (ExperimentRunner._check_early_stop)
+                lo = max(0, n_runs - window)
+                recent_mean = steps_per_run[lo:n_runs].sum() / (n_runs - lo)
+                if recent_mean < best_mean[0] - min_delta:
+                    best_mean[0] = recent_mean
+                    runs_since_best = 0
+                else:
+                    runs_since_best += 1
+                if runs_since_best >= patience:
+                    steps_trained = step + 1
+                    stopped = 1
+                    break
+
+        # SARSA re-chooses both (S, A) pairs whenever the run counter is 0
+        if is_sarsa and current_run_steps == 0:
+            for i in range(2):
+                _fill_state(i, pos, has_block, sa_state[i])
+                n = _possible_actions(i, pos, has_block, pickup_index, pickup_blocks, dropoff_room, poss)
+                sa_action[i] = _choose_action(policy, q_f if i == 0 else q_m, visited_f if i == 0 else visited_m,
+                                              i, sa_state[i], poss, n, ties, rng_f, rng_m, used)
+
+        current_run_steps += 1
+
+    out[0] = n_runs
+    out[1] = n_dist
+    out[2] = first_switch_run
+    out[3] = change_step
+    out[4] = delivered[0]
+    out[5] = dist_sum
+    out[6] = n_samples
+    out[7] = steps_trained
+    out[8] = stopped
+    out[9] = current_run_steps
+    out[10] = runs_since_best
+    return pickup_blocks # may have been replaced by the world change, so hand it back
+
+def _policy_codes(policy_schedule, total_steps):
+    """
+    Replays ExperimentRunner's policy switching logic ahead of time.
+    Returns (per-step policy codes, first switch step or -1, [(step, policy), ...] switches).
+    """
+    for _, policy in policy_schedule:
+        if policy not in POLICY_CODES:
+            raise ValueError(f"Unknown policy: {policy}")
+    codes = np.empty(total_steps, dtype=np.int64)
+    policy_index = 0
+    current_policy = policy_schedule[0][1]
+    policy_switch_step = policy_schedule[0][0]
+    switches = []
+    for step in range(total_steps):
+        if policy_index < len(policy_schedule) - 1 and step >= policy_switch_step:
+            policy_index += 1
+            switch_step_limit, current_policy = policy_schedule[policy_index]
+            policy_switch_step += switch_step_limit
+            switches.append((step, current_policy))
+        codes[step] = POLICY_CODES[current_policy]
+    first_switch_step = switches[0][0] if switches else -1
+    return codes, first_switch_step, switches
+
+def _pickup_arrays(pickup_locs, width, height, obstacles):
+    """{(x, y): blocks} -> (W, H) index grid (obstacles marked OBSTACLE) and per-cell block counts."""
+    index = np.full((width, height), -1, dtype=np.int64)
+    for x, y in obstacles:
+        index[x, y] = OBSTACLE
+    blocks = np.zeros(len(pickup_locs), dtype=np.int64)
+    for i, ((x, y), count) in enumerate(pickup_locs.items()):
+        index[x, y] = i
+        blocks[i] = count
+    return index, blocks
+
+def run_compiled(runner):
+    """
+    Runs the runner's training loop through the compiled kernel and fills in the
+    same stats the Python loops produce (run table, sampled step rows, Manhattan distance total,
+    rewards, first_policy_switch_run). Consumes each controller's random stream
+    exactly like the Python loop does.
+    """
+    config = runner.config
+    if config['algorithm'] not in ('Q_LEARNING', 'SARSA'):
+        raise ValueError(f"Unknown algorithm: {config['algorithm']}")
+    world = runner.world
+    width, height = world.width, world.height
+    total_steps = config['total_steps']
+    policy_codes, first_switch_step, switches = _policy_codes(config['policy_schedule'], total_steps)
+
+    # The kernel updates the controllers' dense Q-tables in place. A dict table is converted once
+    # (the controller keeps the dense table), unless that would allocate more than MAX_CONVERTED_BYTES
+    states = width * height * 2 * width * height
+    converted_bytes = states * (len(ACTIONS) * 8 + 1)
+    if converted_bytes > MAX_CONVERTED_BYTES and not all(c.dense for c in runner.controllers):
+        raise ValueError(f"backend='numba' would convert each dict Q-table to a {converted_bytes / 2**20:.0f} MiB "
+                         f"dense table on the {width}x{height} grid (limit {MAX_CONVERTED_BYTES / 2**20:.0f} MiB); "
+                         f"set dense_q_table or use the Python backend")
+    for controller in runner.controllers:
+        if not controller.dense:
+            controller.q_table = DenseQTable.from_dict(controller.q_table, width, height)
+            controller.dense = True
+    tables = [controller.q_table for controller in runner.controllers]
+
+    # World and agents
+    pickup_index, pickup_init = _pickup_arrays(world.initial_pickup_locs, width, height, world.obstacles)
+    pickup_blocks = np.array([world.pickup_locs[c] for c in world.initial_pickup_locs], dtype=np.int64)
+    dropoff_capacity = np.zeros((width, height), dtype=np.int64)
+    dropoff_blocks = np.zeros((width, height), dtype=np.int64)
+    for (x, y), count in world.dropoff_locs.items():
+        dropoff_capacity[x, y] = world.dropoff_capacity.get((x, y), UNLIMITED)
+        dropoff_blocks[x, y] = count
+    pos = np.array([(a.x, a.y) for a in runner.agents], dtype=np.int64)
+    has_block = np.array([int(a.has_block) for a in runner.agents], dtype=np.int64)
+    start_pos = np.array([(s['x'], s['y']) for s in runner.agent_starts], dtype=np.int64)
+    start_has_block = np.array([int(s['has_block']) for s in runner.agent_starts], dtype=np.int64)
+
+    change_after = -1
+    new_pickup_index, new_pickup_init = pickup_index, pickup_init
+    if runner.world_change_after is not None and not runner.world_changed:
+        change_after = max(runner.world_change_after - runner.terminal_states_reached, 0) # counted from this call
+        new_pickup_index, new_pickup_init = _pickup_arrays(runner.world_change_pickup_locs, width, height, world.obstacles)
+
+    # Controllers' random streams -> kernel
+    rng_f, rng_m = (stream_generator(c.rng.seed, c.rng.stream, c.rng.position) for c in runner.controllers)
+    used = np.zeros(2, dtype=np.int64)
+
+    steps_per_run = np.zeros(total_steps, dtype=np.int64)
+    terminal_steps = np.zeros(total_steps, dtype=np.int64)
+    run_rewards = np.zeros((total_steps, 4), dtype=np.int64)
+    rewards = np.zeros(2, dtype=np.int64)
+    out = np.zeros(11, dtype=np.int64)
+    best_mean = np.array([runner._best_recent_mean], dtype=np.float64)
+    metrics = runner.metrics
+    sample_every = metrics.step_interval
+    n_sample_rows = total_steps // sample_every + 1 if sample_every else 0
+    samples = np.zeros((n_sample_rows, 9), dtype=np.int64) # STEP_DTYPE columns except td_error
+    sample_td = np.zeros(n_sample_rows, dtype=np.float64)
+    sa_state = np.zeros((2, 5), dtype=np.int64) # SARSA's stored (S, A) per agent
+    sa_action = np.full(2, -1, dtype=np.int64)
+
+    final_pickup_blocks = _train_kernel(
+        config['algorithm'] == 'SARSA', POLICY_CODES[config['policy_schedule'][0][1]], policy_codes,
+        first_switch_step, float(config['learning_rate']), float(config['discount_factor']),
+        tables[0].values, tables[1].values, tables[0].visited, tables[1].visited,
+        rng_f, rng_m, used, start_pos, start_has_block,
+        pickup_index, pickup_init, dropoff_capacity,
+        change_after, new_pickup_index, new_pickup_init,
+        pos, has_block, pickup_blocks, dropoff_blocks,
+        steps_per_run, terminal_steps, run_rewards, rewards,
+        sample_every, samples, sample_td,
+        runner.early_stop_patience, runner.early_stop_window, float(runner.early_stop_min_delta), best_mean,
+        sa_state, sa_action, out)
+    (n_runs, n_dist, first_switch_run, change_step, delivered, dist_sum, n_samples, steps_trained, stopped,
+     current_run_steps, runs_since_best) = (int(v) for v in out)
+
+    # Kernel -> Python objects
+    for controller, n_used in zip(runner.controllers, used):
+        controller.rng.seek(controller.rng.position + int(n_used))
+    for controller in runner.controllers:
+        if controller.argmax_cache is not None: # the kernel wrote the values directly
+            controller.argmax_cache.clear()
+    for i, agent in enumerate(runner.agents):
+        agent.x, agent.y = int(pos[i, 0]), int(pos[i, 1])
+        agent.has_block = bool(has_block[i])
+    if change_step >= 0:
+        world.initial_pickup_locs = dict(runner.world_change_pickup_locs)
+        world.total_blocks_at_start = sum(runner.world_change_pickup_locs.values())
+    world.pickup_locs = {c: int(b) for c, b in zip(world.initial_pickup_locs, final_pickup_blocks)}
+    world.dropoff_locs = {c: int(dropoff_blocks[c]) for c in world.dropoff_locs}
+    world.total_blocks_delivered = delivered
+    world._build_cell_flags()
+
+    reward_offset = [runner.total_rewards[agent.name] for agent in runner.agents]
+    distance_offset = (metrics.distance_sum, metrics.distance_count)
+    for i in range(n_runs):
+        # The recorder takes each run's distance share from its running totals
+        metrics.distance_sum = distance_offset[0] + int(run_rewards[i, 2])
+        metrics.distance_count = distance_offset[1] + int(run_rewards[i, 3])
+        metrics.record_run(int(terminal_steps[i]), int(steps_per_run[i]),
+                           [reward_offset[0] + int(run_rewards[i, 0]), reward_offset[1] + int(run_rewards[i, 1])])
+    if n_samples:
+        rows = np.empty(n_samples, dtype=STEP_DTYPE)
+        for k, name in enumerate(STEP_DTYPE.names[:-1]):
+            rows[name] = samples[:n_samples, k]
+        rows['td_error'] = sample_td[:n_samples]
+        metrics.steps.extend(rows)
+    metrics.distance_sum = distance_offset[0] + dist_sum
+    metrics.distance_count = distance_offset[1] + n_dist
+    runner.terminal_states_reached += n_runs
+    runner.first_policy_switch_run = first_switch_run
+    runner.steps_trained = steps_trained
+    runner._best_recent_mean = float(best_mean[0])
+    runner._runs_since_best = runs_since_best
+    runner.current_run_steps = current_run_steps
+    if n_runs:
+        runner._run_start_step = int(terminal_steps[n_runs - 1]) + 1
+    runner.world_changed = runner.world_changed or change_step >= 0
+    runner.learner_state = {} # what a checkpoint stores to resume the Python learner from
+    if config['algorithm'] == 'SARSA':
+        runner.learner_state['pending'] = [[[x, y, bool(b), ox, oy], ACTIONS[a] if a >= 0 else None]
+                                           for (x, y, b, ox, oy), a in zip(sa_state.tolist(), sa_action.tolist())]
+    runner._recent_run_steps.extend(steps_per_run[max(0, n_runs - runner.early_stop_window):n_runs].tolist())
+    for i, agent in enumerate(runner.agents):
+        runner.total_rewards[agent.name] += int(rewards[i])
+
+    # Replay the events the Python loop emits, in step order
+    log = runner.log
+    events = [(step, 0, 'policy_switch', 'INFO', {'policy': policy}) for step, policy in switches if step < steps_trained]
+    if log.enabled('DEBUG'):
+        events += [(int(terminal_steps[i]), 2, 'terminal_reached', 'DEBUG',
+                    {'terminal_state': i + 1, 'run_steps': int(steps_per_run[i])}) for i in range(n_runs)]
+    if change_step >= 0:
+        events.append((change_step, 1, 'world_change', 'INFO', {'pickup_locs': cell_list(runner.world_change_pickup_locs)}))
+    if stopped:
+        runner.stopped = True
+        runner.stop_reason = 'early_stop'
+        events.append((steps_trained - 1, 3, 'early_stop', 'INFO',
+                       {'terminal_states': n_runs, 'best_recent_mean': runner._best_recent_mean,
+                        'patience': runner.early_stop_patience}))
+    for step, _, event, level, fields in sorted(events, key=lambda e: e[:2]):
+        log.emit(event, level, step=step, **fields)
@@ -0,0 +1,164 @@
+# this is discover-paths-rl/config_loader.py
+# this file loads experiment configs from JSON / TOML / YAML files, validates them,
+# expands "matrix" entries and yields the configs one at a time
+
+import os
+import json
+import numbers
+import fnmatch
+import itertools
+from engine import LEARNERS
+from world_config import world_spec_from_config, parse_pickup_locs, validate_world_change
+
+try:
+    import tomllib # Python 3.11+
+    TOML_AVAILABLE = True
+except ImportError:
+    try:
+        import tomli as tomllib
+        TOML_AVAILABLE = True
+    except ImportError:
+        TOML_AVAILABLE = False
+
+try:
+    import yaml
+    YAML_AVAILABLE = True
+except ImportError:
+    YAML_AVAILABLE = False
+
+ALGORITHMS = tuple(LEARNERS)
+POLICIES = ('PRANDOM', 'PGREEDY', 'PEXPLOIT')
+
+# Every key ExperimentRunner reads; anything else is reported as a typo
+REQUIRED_KEYS = ('name', 'total_steps', 'algorithm', 'learning_rate', 'discount_factor', 'policy_schedule')
+OPTIONAL_KEYS = ('seed', 'plots', 'visualize_paths', 'backend', 'world', 'world_file', 'world_change',
+                 'dense_q_table', 'argmax_cache', 'metrics', 'checkpoint_path', 'checkpoint_every', 'warm_start',
+                 'early_stop', 'turn_order', 'state_encoding', 'shared_q_table', 'replay', 'dp_baseline',
+                 'n_step', 'lambda', 'trace_threshold', 'max_traces', 'instrumentation',
+                 'convergence', 'repeat_of')
+
+def load_file(path):
+    """
+    Reads an experiments file (.json, .toml, .yaml / .yml). The file holds either a list of
+    experiments or {"defaults": {...}, "experiments": [...]}; returns (defaults, experiments).
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.json':
+        with open(path) as f:
+            data = json.load(f)
+    elif ext == '.toml':
+        if not TOML_AVAILABLE:
+            raise ValueError(f"Reading {path} needs Python 3.11+ or the tomli package")
+        with open(path, 'rb') as f:
+            data = tomllib.load(f)
+    elif ext in ('.yaml', '.yml'):
+        if not YAML_AVAILABLE:
+            raise ValueError(f"Reading {path} needs PyYAML; use a .json or .toml file instead")
+        with open(path) as f:
+            data = yaml.safe_load(f)
+    else:
+        raise ValueError(f"Unknown experiments file type: {path} (expected .json, .toml, .yaml or .yml)")
+
+    if isinstance(data, list):
+        return {}, data
+    if not isinstance(data, dict) or not isinstance(data.get('experiments'), list):
+        raise ValueError(f"{path}: expected a list of experiments or an \"experiments\" list")
+    return data.get('defaults', {}), data['experiments']
+
+def expand_matrix(entry):
+    """
+    Yields the configs of one entry. A "matrix" of {key: [values]} gives one config per
+    combination, named <name>__<key>-<value>... (a plain entry yields itself).
+    """
+    matrix = entry.get('matrix')
+    if not matrix:
+        yield entry
+        return
+    base = {k: v for k, v in entry.items() if k != 'matrix'}
+    keys = list(matrix)
+    for values in itertools.product(*(matrix[k] for k in keys)):
+        suffix = ''.join(f"__{k}-{v}" for k, v in zip(keys, values))
+        yield {**base, **dict(zip(keys, values)), 'name': f"{base.get('name', '')}{suffix}"}
+
+def validate_config(config):
+    """Raises ValueError if the config is missing keys, has unknown ones or has invalid values."""
+    name = config.get('name')
+    if not isinstance(name, str) or not name:
+        raise ValueError(f"Experiment without a name: {config}")
+    missing = [k for k in REQUIRED_KEYS if k not in config]
+    if missing:
+        raise ValueError(f"{name}: missing {missing}")
+    unknown = [k for k in config if k not in REQUIRED_KEYS and k not in OPTIONAL_KEYS]
+    if unknown:
+        raise ValueError(f"{name}: unknown keys {unknown}")
+
+    if not _is_int(config['total_steps']) or config['total_steps'] < 1:
+        raise ValueError(f"{name}: total_steps must be a positive integer, got {config['total_steps']!r}")
+    if config['algorithm'] not in ALGORITHMS:
+        raise ValueError(f"{name}: unknown algorithm {config['algorithm']!r} (expected one of {ALGORITHMS})")
+    if not _is_real(config['learning_rate']) or not 0 < config['learning_rate'] <= 1:
+        raise ValueError(f"{name}: learning_rate must be a number in (0, 1], got {config['learning_rate']!r}")
+    if not _is_real(config['discount_factor']) or not 0 <= config['discount_factor'] <= 1:
+        raise ValueError(f"{name}: discount_factor must be a number in [0, 1], got {config['discount_factor']!r}")
+
+    schedule = config['policy_schedule']
+    if not isinstance(schedule, (list, tuple)) or not schedule:
+        raise ValueError(f"{name}: policy_schedule must be a non-empty list of [steps, policy], got {schedule!r}")
+    for entry in schedule:
+        if (not isinstance(entry, (list, tuple)) or len(entry) != 2 or not _is_int(entry[0]) or entry[0] < 1
+                or entry[1] not in POLICIES):
+            raise ValueError(f"{name}: policy_schedule entries are [steps, policy] with policy in {POLICIES}, got {entry!r}")
+
+    repeat_of = config.get('repeat_of')
+    if repeat_of is not None and (not isinstance(repeat_of, str) or not repeat_of):
+        raise ValueError(f"{name}: repeat_of must be the name of the repeated experiment, got {repeat_of!r}")
+
+    # The world is built here as well as in the runner, so a bad cell fails before the job starts
+    try:
+        world_spec = world_spec_from_config(config)
+    except (ValueError, TypeError, KeyError, IndexError, OSError) as e:
+        raise ValueError(f"{name}: invalid world: {e}") from None
+
+    world_change = config.get('world_change')
+    if world_change is not None:
+        if not isinstance(world_change, dict) or 'after_terminal_states' not in world_change or 'pickup_locs' not in world_change:
+            raise ValueError(f"{name}: world_change needs after_terminal_states and pickup_locs")
+        after = world_change['after_terminal_states']
+        if not _is_int(after) or after < 0:
+            raise ValueError(f"{name}: world_change after_terminal_states must be a non-negative integer, got {after!r}")
+        if not world_change['pickup_locs']:
+            raise ValueError(f"{name}: world_change pickup_locs is empty")
+        try:
+            validate_world_change(world_spec, parse_pickup_locs(world_change['pickup_locs']))
+        except ValueError as e:
+            raise ValueError(f"{name}: {e}") from None
+        except (TypeError, IndexError) as e:
+            raise ValueError(f"{name}: world_change pickup_locs are [x, y, blocks] entries, got {world_change['pickup_locs']!r}") from None
+
+def _is_int(value):
+    return isinstance(value, numbers.Integral) and not isinstance(value, bool)
+
+def _is_real(value):
+    return isinstance(value, numbers.Real) and not isinstance(value, bool)
+
+def name_selected(name, only=None, exclude=None):
+    """True if the name matches one of the `only` globs (or there are none) and none of the `exclude` globs."""
+    if only and not any(fnmatch.fnmatchcase(name, pattern) for pattern in only):
+        return False
+    return not (exclude and any(fnmatch.fnmatchcase(name, pattern) for pattern in exclude))
+
+def iter_configs(paths, only=None, exclude=None):
+    """
+    Yields the validated configs of one or more experiment files, one at a time: each file's
+    defaults are merged under its entries, matrices are expanded, and names are filtered with
+    the `only` / `exclude` globs before validation. Policy schedules become lists of tuples.
+    """
+    for path in [paths] if isinstance(paths, str) else paths:
+        defaults, experiments = load_file(path)
+        for entry in experiments:
+            for config in expand_matrix({**defaults, **entry}):
+                if not name_selected(config.get('name', ''), only, exclude):
+                    continue
+                validate_config(config)
+                config['policy_schedule'] = [tuple(e) for e in config['policy_schedule']]
+                yield config
@@ -16,4 +16,7 @@ AGENT_F_START = {'x': 0, 'y': 2, 'has_block': False}
 AGENT_M_START = {'x': 4, 'y': 2, 'has_block': False}
 
 # RL Actions
-ACTIONS = ['North', 'South', 'East', 'West', 'Pickup', 'Dropoff']
\ No newline at end of file
+ACTIONS = ['North', 'South', 'East', 'West', 'Pickup', 'Dropoff']
+
+# Action name -> integer index (the last axis of a dense Q-table)
+ACTION_INDEX = {action: i for i, action in enumerate(ACTIONS)}
\ No newline at end of file
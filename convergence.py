@@ -0,0 +1,101 @@
+# this is discover-paths-rl/convergence.py
+# this file contains the ConvergenceMonitor, which ends an experiment once its
+# steps per run, Q-values or greedy policy have settled
+
+from collections import deque
+import numpy as np
+
+CRITERIA = ('steps_variance', 'q_delta', 'policy_stable')
+MODES = ('any', 'all')
+
+class ConvergenceMonitor:
+    """
+    Convergence criteria checked after every run, from a config's "convergence" entry:
+      {"window": 10, "steps_variance": 25.0, "q_delta": 0.01, "policy_stable": True,
+       "mode": "any", "stop": True}
+    - steps_variance: the variance of the steps of the last `window` runs is at most this.
+    - q_delta: for `window` runs in a row, no Q-value moved by more than this since the previous run's end.
+    - policy_stable: for `window` runs in a row, no already visited state changed its greedy action.
+    `mode` says whether any or all of the given criteria must hold. With "stop": False the runner
+    only records when they first held and trains on to total_steps.
+    """
+    def __init__(self, config):
+        self.window = config.get('window', 10)
+        self.steps_variance = config.get('steps_variance')
+        self.q_delta = config.get('q_delta')
+        self.policy_stable = config.get('policy_stable', False)
+        self.mode = config.get('mode', 'any')
+        self.stop = config.get('stop', True)
+        if self.window < 2:
+            raise ValueError(f"convergence window must be at least 2, got {self.window}")
+        if self.mode not in MODES:
+            raise ValueError(f"Unknown convergence mode: {self.mode} (expected one of {MODES})")
+        if self.steps_variance is None and self.q_delta is None and not self.policy_stable:
+            raise ValueError(f"convergence needs at least one of {CRITERIA}")
+        self._run_steps = deque(maxlen=self.window)
+        self._snapshots = None # one per distinct Q-table, from the previous run's end
+        self._small_delta_runs = 0 # runs in a row with every |delta Q| <= q_delta
+        self._stable_policy_runs = 0 # runs in a row without a greedy-action change
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config) if config else None
+
+    def state(self):
+        """The counters and the steps window (the Q-table snapshots are not kept: the first run after
+        a load_state only takes a new snapshot)."""
+        return {'run_steps': list(self._run_steps), 'small_delta_runs': self._small_delta_runs,
+                'stable_policy_runs': self._stable_policy_runs}
+
+    def load_state(self, state):
+        self._run_steps.extend(state['run_steps'])
+        self._small_delta_runs = state['small_delta_runs']
+        self._stable_policy_runs = state['stable_policy_runs']
+
+    def update(self, q_tables, run_steps):
+        """Adds a finished run; returns the criteria that now hold if that converges the experiment, else []."""
+        results = {}
+        if self.steps_variance is not None:
+            self._run_steps.append(run_steps)
+            results['steps_variance'] = (len(self._run_steps) == self.window
+                                         and np.var(self._run_steps) <= self.steps_variance)
+        if self.q_delta is not None or self.policy_stable:
+            snapshots = [_snapshot(table) for table in q_tables]
+            if self._snapshots is not None:
+                max_delta, policy_changes = 0.0, 0
+                for old, new in zip(self._snapshots, snapshots):
+                    delta, changes = _compare(old, new)
+                    max_delta, policy_changes = max(max_delta, delta), policy_changes + changes
+                self._small_delta_runs = self._small_delta_runs + 1 if max_delta <= (self.q_delta or 0.0) else 0
+                self._stable_policy_runs = self._stable_policy_runs + 1 if policy_changes == 0 else 0
+            self._snapshots = snapshots
+            if self.q_delta is not None:
+                results['q_delta'] = self._small_delta_runs >= self.window
+            if self.policy_stable:
+                results['policy_stable'] = self._stable_policy_runs >= self.window
+        met = [name for name, ok in results.items() if ok]
+        converged = all(results.values()) if self.mode == 'all' else bool(met)
+        return met if converged else []
+
+def _snapshot(table):
+    """A copy of a Q-table's values: (values, visited) arrays for a DenseQTable, {state: row tuple} for a dict."""
+    if isinstance(table, dict):
+        return {state: tuple(row.values()) for state, row in table.items()}
+    return table.values.copy(), table.visited.copy()
+
+def _compare(old, new):
+    """(largest |Q change|, number of previously visited states whose greedy action changed)."""
+    if isinstance(new, dict):
+        max_delta, changes = 0.0, 0
+        for state, row in new.items():
+            old_row = old.get(state)
+            if old_row is None:
+                max_delta = max(max_delta, max(map(abs, row)))
+            elif old_row != row:
+                max_delta = max(max_delta, max(abs(a - b) for a, b in zip(old_row, row)))
+                changes += old_row.index(max(old_row)) != row.index(max(row))
+        return max_delta, changes
+    (old_values, old_visited), (new_values, _) = old, new
+    max_delta = float(np.abs(new_values - old_values).max())
+    changes = int((old_values[old_visited].argmax(axis=1) != new_values[old_visited].argmax(axis=1)).sum())
+    return max_delta, changes
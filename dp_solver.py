@@ -0,0 +1,276 @@
+# this is discover-paths-rl/dp_solver.py
+# this file contains the exact dynamic-programming baseline: it enumerates every
+# reachable joint state of the 2-agent PD-World and solves for the fewest steps
+# to the terminal state, so learned policies can be scored against the optimum
+
+import time
+import numpy as np
+from constants import ACTIONS
+from environment import PDWorld, MOVE_DELTAS
+from agent import Agent
+
+MOVES = ACTIONS[:4]
+PICKUP, DROPOFF, PASS = 4, 5, 6 # PASS: an agent with no valid action loses its turn (a step, as in the engine)
+MAX_KEY = 2**62
+
+class StateCodec:
+    """
+    Packs a joint state into one int64 (mixed radix):
+      turn, F cell, M cell, F has_block, M has_block, blocks left at each pickup cell,
+      blocks at each dropoff cell with a capacity (unlimited dropoffs don't need a count).
+    Cells are y * width + x. The arrays passed around are one column per field.
+    """
+    def __init__(self, spec):
+        self.width, self.height = spec['width'], spec['height']
+        cells = self.width * self.height
+        self.pickup_cells = list(spec['pickup_locs'])
+        self.capped_dropoffs = [pos for pos in spec['dropoff_locs'] if pos in spec['dropoff_capacity']]
+        self.radix = np.array([2, cells, cells, 2, 2]
+                              + [spec['pickup_locs'][pos] + 1 for pos in self.pickup_cells]
+                              + [spec['dropoff_capacity'][pos] + 1 for pos in self.capped_dropoffs], dtype=np.int64)
+        if np.prod(self.radix.astype(object)) >= MAX_KEY:
+            raise ValueError("World too large for the DP solver's 64-bit state keys")
+        self.num_pickups = len(self.pickup_cells)
+
+    def encode(self, fields):
+        """(n, len(radix)) int64 fields -> (n,) int64 keys."""
+        keys = np.zeros(len(fields), dtype=np.int64)
+        for j, r in enumerate(self.radix):
+            keys = keys * r + fields[:, j]
+        return keys
+
+    def decode(self, keys):
+        fields = np.empty((len(keys), len(self.radix)), dtype=np.int64)
+        keys = keys.copy()
+        for j in range(len(self.radix) - 1, -1, -1):
+            keys, fields[:, j] = np.divmod(keys, self.radix[j])
+        return fields
+
+class DPSolution:
+    """
+    The solved world: sorted state keys, the successor of every (state, action) (-1 = invalid),
+    and V* / Q* as steps left to the terminal state (np.inf where it can't be reached).
+    """
+    def __init__(self, spec, codec, keys, successors, costs, values, iterations, seconds):
+        self.spec = spec
+        self.codec = codec
+        self.keys = keys
+        self.successors = successors
+        self.costs = costs
+        self.values = values
+        self.iterations = iterations
+        self.seconds = seconds
+
+    @property
+    def num_states(self):
+        return len(self.keys)
+
+    @property
+    def q_values(self):
+        """Q*(s, a) over ACTIONS as steps left (np.inf for invalid actions), shape (num_states, 6)."""
+        nxt = self.successors[:, :len(ACTIONS)]
+        q = self.costs[:, :len(ACTIONS)] + self.values[np.maximum(nxt, 0)]
+        q[nxt < 0] = np.inf
+        return q
+
+    def index(self, fields):
+        """State indices of (n, fields) rows (ValueError if one was never reached)."""
+        keys = self.codec.encode(np.atleast_2d(np.asarray(fields, dtype=np.int64)))
+        idx = np.searchsorted(self.keys, keys)
+        if np.any(idx >= len(self.keys)) or np.any(self.keys[np.minimum(idx, len(self.keys) - 1)] != keys):
+            raise ValueError("State is not reachable from the start state")
+        return idx
+
+    def state_fields(self, agents, world, turn):
+        """The field row of a live PDWorld and its two agents."""
+        w = self.codec.width
+        f, m = agents
+        return ([turn, f.y * w + f.x, m.y * w + m.x, int(f.has_block), int(m.has_block)]
+                + [world.pickup_locs[pos] for pos in self.codec.pickup_cells]
+                + [world.dropoff_locs[pos] for pos in self.codec.capped_dropoffs])
+
+    def optimal_steps(self, turn=0):
+        """Fewest steps for a run from the start state, with agent `turn` (0 = F) moving first."""
+        return float(self.values[self.index(start_fields(self.spec, self.codec, turn))[0]])
+
+def start_fields(spec, codec, turn=0):
+    f, m = spec['agents'][0], spec['agents'][1]
+    w = spec['width']
+    return ([turn, f['y'] * w + f['x'], m['y'] * w + m['x'], int(f['has_block']), int(m['has_block'])]
+            + [spec['pickup_locs'][pos] for pos in codec.pickup_cells]
+            + [spec['dropoff_locs'][pos] for pos in codec.capped_dropoffs])
+
+def _cell_tables(spec, codec):
+    """Per-cell lookups: move targets (-1 = off-grid/obstacle), pickup index, dropoff flag and capped-dropoff index."""
+    w, h = spec['width'], spec['height']
+    targets = np.full((w * h, len(MOVES)), -1, dtype=np.int64)
+    for x in range(w):
+        for y in range(h):
+            for a, action in enumerate(MOVES):
+                dx, dy = MOVE_DELTAS[action]
+                nx, ny = x + dx, y + dy
+                if 0 <= nx < w and 0 <= ny < h and (nx, ny) not in spec['obstacles']:
+                    targets[y * w + x, a] = ny * w + nx
+    pickup = np.full(w * h, -1, dtype=np.int64)
+    for k, (x, y) in enumerate(codec.pickup_cells):
+        pickup[y * w + x] = k
+    dropoff = np.zeros(w * h, dtype=bool)
+    capped = np.full(w * h, -1, dtype=np.int64)
+    for (x, y) in spec['dropoff_locs']:
+        dropoff[y * w + x] = True
+    for j, (x, y) in enumerate(codec.capped_dropoffs):
+        capped[y * w + x] = j
+    capacity = np.array([spec['dropoff_capacity'][pos] for pos in codec.capped_dropoffs], dtype=np.int64)
+    return targets, pickup, dropoff, capped, capacity
+
+def _successors(fields, codec, tables, forced_pickup_dropoff):
+    """
+    Successor keys (n, 7) and step costs (n, 7) of decoded states, vectorized over the states:
+    the 4 moves, Pickup, Dropoff and PASS (only when the acting agent has no valid action).
+    Every action costs 1, PASS included: the engine spends a step on a trapped agent's turn,
+    so V* is the fewest engine steps and a run's steps minus V* is never negative.
+    Terminal states have no successors. -1 marks an invalid action.
+    """
+    targets, pickup, dropoff, capped, capacity = tables
+    n = len(fields)
+    rows = np.arange(n)
+    stock_cols = 5 + np.arange(codec.num_pickups)
+    drop_col0 = 5 + codec.num_pickups
+    turn = fields[:, 0]
+    actor_col, other_col, block_col = 1 + turn, 2 - turn, 3 + turn
+    pos, other = fields[rows, actor_col], fields[rows, other_col]
+    has_block = fields[rows, block_col] == 1
+    terminal = (fields[:, stock_cols].sum(axis=1) == 0) & (fields[:, 3] == 0) & (fields[:, 4] == 0)
+
+    succ = np.full((n, 7), -1, dtype=np.int64)
+    costs = np.ones((n, 7), dtype=np.int64)
+    flipped = fields.copy()
+    flipped[:, 0] = 1 - turn
+
+    k = pickup[pos]
+    can_pickup = ~has_block & (k >= 0)
+    can_pickup[can_pickup] &= fields[rows[can_pickup], 5 + k[can_pickup]] > 0
+    j = capped[pos]
+    can_dropoff = has_block & dropoff[pos]
+    limited = can_dropoff & (j >= 0)
+    can_dropoff[limited] &= fields[rows[limited], drop_col0 + j[limited]] < capacity[j[limited]]
+    can_dropoff &= ~terminal
+    can_pickup &= ~terminal
+
+    special = (can_pickup | can_dropoff) if forced_pickup_dropoff else np.zeros(n, dtype=bool)
+    any_valid = np.zeros(n, dtype=bool)
+    for a in range(len(MOVES)):
+        target = targets[pos, a]
+        valid = (target >= 0) & (target != other) & ~terminal & ~special
+        nxt = flipped[valid].copy()
+        nxt[np.arange(len(nxt)), actor_col[valid]] = target[valid]
+        succ[valid, a] = codec.encode(nxt)
+        any_valid |= valid
+
+    nxt = flipped[can_pickup].copy()
+    nxt[np.arange(len(nxt)), block_col[can_pickup]] = 1
+    nxt[np.arange(len(nxt)), 5 + k[can_pickup]] -= 1
+    succ[can_pickup, PICKUP] = codec.encode(nxt)
+
+    nxt = flipped[can_dropoff].copy()
+    nxt[np.arange(len(nxt)), block_col[can_dropoff]] = 0
+    limited = j[can_dropoff] >= 0
+    nxt[np.nonzero(limited)[0], drop_col0 + j[can_dropoff][limited]] += 1
+    succ[can_dropoff, DROPOFF] = codec.encode(nxt)
+
+    trapped = ~terminal & ~any_valid & ~can_pickup & ~can_dropoff
+    succ[trapped, PASS] = codec.encode(flipped[trapped])
+    return succ, costs
+
+def enumerate_states(spec, forced_pickup_dropoff=True, codec=None):
+    """
+    Breadth-first search from both start states (F or M moving first), one vectorized frontier
+    at a time. Returns the sorted int64 keys of every reachable state.
+    """
+    codec = codec if codec is not None else StateCodec(spec)
+    tables = _cell_tables(spec, codec)
+    frontier = np.unique(codec.encode(np.array([start_fields(spec, codec, 0), start_fields(spec, codec, 1)])))
+    seen = frontier
+    while len(frontier):
+        succ, _ = _successors(codec.decode(frontier), codec, tables, forced_pickup_dropoff)
+        succ = np.unique(succ[succ >= 0])
+        frontier = succ[~np.isin(succ, seen, assume_unique=True)]
+        seen = np.union1d(seen, frontier)
+    return seen
+
+def solve(spec, forced_pickup_dropoff=True, chunk_size=65536, max_iterations=100000):
+    """
+    Solves a 2-agent world spec (world_config): enumerates the reachable states, builds the
+    successor table (chunk_size states at a time) and runs value iteration on
+    V(s) = min_a cost(a) + V(s') until it stops changing. forced_pickup_dropoff applies the
+    agents' rule that Pickup / Dropoff are always taken when possible.
+    """
+    if len(spec['agents']) != 2:
+        raise ValueError(f"The DP solver handles 2 agents, got {len(spec['agents'])}")
+    start = time.perf_counter()
+    codec = StateCodec(spec)
+    tables = _cell_tables(spec, codec)
+    keys = enumerate_states(spec, forced_pickup_dropoff, codec)
+
+    successors = np.empty((len(keys), 7), dtype=np.int32 if len(keys) < 2**31 else np.int64)
+    costs = np.empty((len(keys), 7), dtype=np.int8)
+    for lo in range(0, len(keys), chunk_size):
+        succ, cost = _successors(codec.decode(keys[lo:lo + chunk_size]), codec, tables, forced_pickup_dropoff)
+        successors[lo:lo + chunk_size] = np.where(succ >= 0, np.searchsorted(keys, succ), -1)
+        costs[lo:lo + chunk_size] = cost
+
+    invalid = successors < 0
+    terminal = invalid.all(axis=1)
+    values = np.where(terminal, 0.0, np.inf)
+    cost = costs.astype(np.float64)
+    index = np.maximum(successors, 0)
+    for iteration in range(1, max_iterations + 1):
+        q = cost + values[index]
+        q[invalid] = np.inf
+        new_values = np.where(terminal, 0.0, q.min(axis=1))
+        if np.array_equal(new_values, values):
+            break
+        values = new_values
+    return DPSolution(spec, codec, keys, successors, costs, values, iteration, time.perf_counter() - start)
+
+def _greedy_action(controller, state, possible_actions):
+    """The controller's greedy action without touching its table or random stream (ties: first possible action)."""
+    if 'Pickup' in possible_actions:
+        return 'Pickup'
+    if 'Dropoff' in possible_actions:
+        return 'Dropoff'
+    if controller.dense:
+        table = controller.q_table
+        row = table.values[table.index(state)]
+        return max(possible_actions, key=lambda a: row[ACTIONS.index(a)])
+    row = controller.q_table.get(state, {})
+    return max(possible_actions, key=lambda a: row.get(a, 0.0))
+
+def greedy_regret(solution, runner, turn=0, max_steps=None):
+    """
+    Rolls out the runner's learned greedy policy from the start state on a scratch copy of its
+    world and returns {'steps', 'optimal_steps', 'regret' (per step: extra steps to go that each
+    action cost), 'reached_terminal'}. A trapped agent's lost turn counts as a step, as in the engine.
+    The runner's agents, world and streams are left untouched.
+    """
+    spec = solution.spec
+    world = PDWorld(spec['pickup_locs'], spec['dropoff_locs'], width=spec['width'], height=spec['height'],
+                    obstacles=spec['obstacles'], dropoff_capacity=spec['dropoff_capacity'])
+    agents = [Agent(a['name'], a['x'], a['y'], a['has_block']) for a in spec['agents'][:2]]
+    optimal = solution.optimal_steps(turn)
+    if max_steps is None:
+        max_steps = int(10 * optimal) if np.isfinite(optimal) else 10000
+    current = solution.values[solution.index(solution.state_fields(agents, world, turn))[0]]
+    regret, steps = [], 0
+    while not world.is_terminal_state() and steps < max_steps:
+        agent, other = agents[turn], agents[1 - turn]
+        state = (agent.x, agent.y, agent.has_block, other.x, other.y)
+        possible = world.get_possible_actions(agent, other)
+        if possible: # else the agent is trapped and passes
+            world.apply_action(agent, other, _greedy_action(runner.controllers[turn], state, possible))
+        turn = 1 - turn
+        steps += 1
+        following = solution.values[solution.index(solution.state_fields(agents, world, turn))[0]]
+        regret.append(float(1 + following - current))
+        current = following
+    return {'steps': steps, 'optimal_steps': optimal, 'regret': regret, 'reached_terminal': world.is_terminal_state()}
@@ -0,0 +1,371 @@
+# this is discover-paths-rl/engine.py
+# this file contains the step engine that runs ExperimentRunner's training loop,
+# the pluggable learners (the update rule of each algorithm) and the event
+# schedule for policy switches, world changes and checkpoints
+
+import heapq
+from collections import deque
+from multi_agent import mean_pairwise_distance
+
+# Order of events due on the same step (the order the original loops checked them in)
+CHECKPOINT, POLICY_SWITCH, WORLD_CHANGE = 0, 1, 2
+
+class EventSchedule:
+    """
+    Events keyed on a step or on a terminal-state count. A terminal-count event becomes due
+    at the start of the step after that terminal state was reached (or at step 0 if the
+    count is already reached at the start step). The engine only asks for due events when
+    next_step() comes up, so nothing is checked on the other steps.
+    """
+    def __init__(self, terminal_count=0, start_step=0):
+        self._steps = [] # heap of (step, kind, seq, value); kind doubles as the same-step order
+        self._terminal = {} # count -> [(kind, value)]
+        self._seq = 0
+        self.terminal_count = terminal_count
+        self.start_step = start_step
+
+    def at_step(self, step, kind, value=None):
+        heapq.heappush(self._steps, (step, kind, self._seq, value))
+        self._seq += 1
+
+    def at_terminal(self, count, kind, value=None):
+        if count == self.terminal_count:
+            self.at_step(self.start_step, kind, value)
+        else:
+            self._terminal.setdefault(count, []).append((kind, value))
+
+    def terminal_reached(self, step):
+        """Counts a terminal state reached on `step`; its events become due on the next step."""
+        self.terminal_count += 1
+        for kind, value in self._terminal.pop(self.terminal_count, ()):
+            self.at_step(step + 1, kind, value)
+
+    def next_step(self):
+        return self._steps[0][0] if self._steps else -1
+
+    def pop_due(self, step):
+        """(kind, value) of every event due on `step`, in CHECKPOINT, POLICY_SWITCH, WORLD_CHANGE order."""
+        due = []
+        while self._steps and self._steps[0][0] == step:
+            _, kind, _, value = heapq.heappop(self._steps)
+            due.append((kind, value))
+        return due
+
+def policy_switches(policy_schedule):
+    """(step, policy) of every switch in a policy schedule, the step counted from the start of training."""
+    switches = []
+    switch_step = 0
+    for (steps, _), (_, next_policy) in zip(policy_schedule, policy_schedule[1:]):
+        switch_step += steps
+        switches.append((switch_step, next_policy))
+    return switches
+
+def policy_before(policy_schedule, step):
+    """The policy in effect just before the switches due on `step` (the first policy at step 0)."""
+    policy = policy_schedule[0][1]
+    for switch_step, next_policy in policy_switches(policy_schedule):
+        if switch_step >= step:
+            break
+        policy = next_policy
+    return policy
+
+def build_schedule(runner):
+    """
+    The runner's policy switches, world change and periodic checkpoints as an EventSchedule,
+    from runner.start_step on (a resumed run skips what happened before its checkpoint).
+    """
+    start = runner.start_step
+    schedule = EventSchedule(int(runner.terminal_states_reached), start)
+    for switch_step, next_policy in policy_switches(runner.config['policy_schedule']):
+        if switch_step >= start:
+            schedule.at_step(switch_step, POLICY_SWITCH, next_policy)
+    if runner.world_change_after is not None and not runner.world_changed:
+        schedule.at_terminal(runner.world_change_after, WORLD_CHANGE, runner.world_change_pickup_locs)
+    if runner.checkpoint_every:
+        schedule.at_step((start // runner.checkpoint_every + 1) * runner.checkpoint_every, CHECKPOINT)
+    return schedule
+
+class Learner:
+    """
+    An algorithm's update rule. The engine calls, for the acting controller i:
+      act(i, controller, policy)  -> (state, action), action None if the agent can't act
+      learn(i, controller, state, action, reward, new_state, new_possible_actions, policy)
+                                  -> (TD error, the next action if the learner already chose it)
+    and begin_run(policy) / end_run() around each run. on_policy learners pick the next action
+    in learn (SARSA-style); the others pick it in act. state() / load_state(state) hand over the
+    learner's mid-run state (JSON-serializable) for checkpoints.
+    """
+    on_policy = False
+
+    def __init__(self, runner, config):
+        self.runner = runner
+        self.controllers = runner.controllers
+        self.world = runner.world
+
+    def begin_run(self, policy):
+        pass
+
+    def end_run(self):
+        pass
+
+    def state(self):
+        return {}
+
+    def load_state(self, state):
+        pass
+
+    def act(self, i, controller, policy):
+        state = controller.get_current_state()
+        possible_actions = self.world.get_possible_actions(controller.agent, controller.other_agent)
+        return state, controller.choose_action(policy, possible_actions)
+
+class QLearning(Learner):
+    def learn(self, i, controller, state, action, reward, new_state, new_possible_actions, policy):
+        return controller.update_q_table(state, action, reward, new_state, new_possible_actions), None
+
+class ExpectedSarsa(Learner):
+    def learn(self, i, controller, state, action, reward, new_state, new_possible_actions, policy):
+        return controller.update_expected_sarsa_table(state, action, reward, new_state,
+                                                      new_possible_actions, policy), None
+
+class Sarsa(Learner):
+    """Chooses each agent's next action right after its move, and acts on it at the agent's next turn."""
+    on_policy = True
+
+    def __init__(self, runner, config):
+        super().__init__(runner, config)
+        self.pending = [None] * len(self.controllers) # (state, action) per agent
+
+    def begin_run(self, policy):
+        for i, controller in enumerate(self.controllers):
+            self.pending[i] = Learner.act(self, i, controller, policy)
+
+    def state(self):
+        return {'pending': [[list(state), action] for state, action in self.pending]}
+
+    def load_state(self, state):
+        self.pending = [(tuple(s), action) for s, action in state['pending']]
+
+    def act(self, i, controller, policy):
+        state, action = self.pending[i]
+        if action is None and self.runner.view is not None:
+            # Boxed in by other agents on its last turn; they may have moved away since
+            state, action = self.pending[i] = Learner.act(self, i, controller, policy)
+        return state, action
+
+    def learn(self, i, controller, state, action, reward, new_state, new_possible_actions, policy):
+        next_action = controller.choose_action(policy, new_possible_actions)
+        td_error = self._update(i, controller, state, action, reward, new_state, next_action)
+        self.pending[i] = (new_state, next_action)
+        return td_error, next_action
+
+    def _update(self, i, controller, state, action, reward, new_state, next_action):
+        return controller.update_sarsa_table(state, action, reward, new_state, next_action)
+
+class NStepSarsa(Sarsa):
+    """
+    n-step SARSA ("n_step" in the config, default 3): Q(s, a) moves towards the discounted
+    rewards of the agent's next n moves plus gamma^n Q(s_n, a_n). At the end of a run the
+    remaining moves are updated with the shorter returns.
+    """
+    def __init__(self, runner, config):
+        super().__init__(runner, config)
+        self.n = config.get('n_step', 3)
+        if self.n < 1:
+            raise ValueError(f"n_step must be at least 1, got {self.n}")
+        self.history = [deque() for _ in self.controllers] # (state, action, reward) per agent
+
+    def state(self):
+        return {**super().state(), 'history': [[[list(s), a, r] for s, a, r in h] for h in self.history]}
+
+    def load_state(self, state):
+        super().load_state(state)
+        self.history = [deque((tuple(s), a, r) for s, a, r in h) for h in state['history']]
+
+    def _update(self, i, controller, state, action, reward, new_state, next_action):
+        history = self.history[i]
+        history.append((state, action, reward))
+        if len(history) < self.n:
+            return 0.0
+        return self._update_oldest(controller, history, new_state, next_action)
+
+    def _update_oldest(self, controller, history, last_state, last_action):
+        gamma = controller.discount_factor
+        target = controller.get_q_value(last_state, last_action) if last_action else 0.0
+        for _, _, r in reversed(history):
+            target = r + gamma * target
+        state, action, _ = history.popleft()
+        return controller.update_towards(state, action, target)
+
+    def end_run(self):
+        for i, controller in enumerate(self.controllers):
+            last_state, last_action = self.pending[i]
+            while self.history[i]:
+                self._update_oldest(controller, self.history[i], last_state, last_action)
+
+def enable_traces(controllers, config):
+    """Eligibility traces from the config: "lambda" (default 0.8), "trace_threshold" (1e-3), "max_traces" (1000)."""
+    for controller in controllers:
+        controller.enable_traces(config.get('lambda', 0.8), config.get('trace_threshold', 1e-3),
+                                 config.get('max_traces', 1000))
+
+def traces_state(controllers):
+    """Every controller's eligibility traces as [[state, action, eligibility], ...], oldest first."""
+    return [[[list(s), a, e] for (s, a), e in c.traces.traces.items()] for c in controllers]
+
+def load_traces(controllers, traces):
+    for controller, pairs in zip(controllers, traces):
+        controller.traces.traces = {(tuple(s), a): e for s, a, e in pairs}
+
+class QLambda(QLearning):
+    """
+    Watkins's Q(lambda): the TD error of each move updates every (state, action) pair in the agent's
+    eligibility traces (RLAgentController.update_q_lambda_table). Traces are cut when the agent takes
+    an exploratory action and cleared at the end of each run.
+    """
+    def __init__(self, runner, config):
+        super().__init__(runner, config)
+        enable_traces(self.controllers, config)
+
+    def end_run(self):
+        for controller in self.controllers:
+            controller.traces.clear()
+
+    def state(self):
+        return {'traces': traces_state(self.controllers)}
+
+    def load_state(self, state):
+        load_traces(self.controllers, state['traces'])
+
+    def act(self, i, controller, policy):
+        state, action = super().act(i, controller, policy)
+        if action is not None and action not in ('Pickup', 'Dropoff') and len(controller.traces):
+            possible_actions = self.world.get_possible_actions(controller.agent, controller.other_agent)
+            if action not in controller.greedy_actions(state, possible_actions)[0]:
+                controller.traces.clear()
+        return state, action
+
+    def learn(self, i, controller, state, action, reward, new_state, new_possible_actions, policy):
+        return controller.update_q_lambda_table(state, action, reward, new_state, new_possible_actions), None
+
+class SarsaLambda(Sarsa):
+    """SARSA(lambda): SARSA with eligibility traces (RLAgentController.update_sarsa_lambda_table), cleared at the end of each run."""
+    def __init__(self, runner, config):
+        super().__init__(runner, config)
+        enable_traces(self.controllers, config)
+
+    def end_run(self):
+        for controller in self.controllers:
+            controller.traces.clear()
+
+    def state(self):
+        return {**super().state(), 'traces': traces_state(self.controllers)}
+
+    def load_state(self, state):
+        super().load_state(state)
+        load_traces(self.controllers, state['traces'])
+
+    def _update(self, i, controller, state, action, reward, new_state, next_action):
+        return controller.update_sarsa_lambda_table(state, action, reward, new_state, next_action)
+
+LEARNERS = {
+    'Q_LEARNING': QLearning,
+    'SARSA': Sarsa,
+    'EXPECTED_SARSA': ExpectedSarsa,
+    'N_STEP_SARSA': NStepSarsa,
+    'Q_LAMBDA': QLambda,
+    'SARSA_LAMBDA': SarsaLambda,
+}
+
+def make_learner(runner):
+    algorithm = runner.config['algorithm']
+    if algorithm not in LEARNERS:
+        raise ValueError(f"Unknown algorithm: {algorithm} (expected one of {tuple(LEARNERS)})")
+    return LEARNERS[algorithm](runner, runner.config)
+
+def run_engine(runner, learner=None):
+    """
+    Runs the runner's training loop: one agent turn per step from runner.start_step (0, or the
+    step of a resumed checkpoint) to total_steps, with the learner's update rule and the events
+    of build_schedule. Stops early when runner.stopped is set.
+    """
+    learner = learner if learner is not None else make_learner(runner)
+    schedule = build_schedule(runner)
+    world, controllers, metrics, log = runner.world, runner.controllers, runner.metrics, runner.log
+    total_rewards = runner.total_rewards
+    replay = runner.replay
+    sample_every = metrics.step_interval # 0 = no per-step rows
+    num_agents = runner.num_agents
+    round_robin = runner.turn_order == 'round_robin'
+    pairwise_distance = num_agents == 2
+    agent_f, agent_m = runner.agent_f, runner.agent_m
+
+    start = runner.start_step
+    policy = policy_before(runner.config['policy_schedule'], start)
+    if runner.learner_state is not None: # resumed mid-run: the actions already chosen, n-step history, traces
+        learner.load_state(runner.learner_state)
+    else:
+        learner.begin_run(policy)
+
+    next_event = schedule.next_step()
+    current_run_steps = runner.current_run_steps
+    total_steps = runner.config['total_steps']
+    runner.steps_trained = max(total_steps - start, 0)
+    for step in range(start, total_steps):
+        # --- Scheduled events: checkpoint, policy switch, world change ---
+        if step == next_event:
+            for kind, value in schedule.pop_due(step):
+                if kind == CHECKPOINT: # state after `step` steps
+                    runner.current_run_steps = current_run_steps
+                    runner.save_checkpoint(step)
+                    schedule.at_step(step + runner.checkpoint_every, CHECKPOINT)
+                elif kind == POLICY_SWITCH:
+                    if runner.first_policy_switch_run == -1:
+                        runner.first_policy_switch_run = metrics.num_runs
+                    policy = value
+                    log.emit('policy_switch', step=step, policy=policy)
+                else:
+                    runner.change_world(step, value)
+            next_event = schedule.next_step()
+
+        # --- Agent turn ---
+        agent_turn = step % num_agents if round_robin else runner._next_turn(step)
+        controller = controllers[agent_turn]
+        state, action = learner.act(agent_turn, controller, policy)
+        if action is None:
+            continue # Agent is trapped
+
+        reward = world.apply_action(controller.agent, controller.other_agent, action)
+        total_rewards[controller.agent.name] += reward
+        new_state = controller.get_current_state()
+        new_possible_actions = world.get_possible_actions(controller.agent, controller.other_agent)
+
+        td_error, next_action = learner.learn(agent_turn, controller, state, action, reward,
+                                              new_state, new_possible_actions, policy)
+        if replay is not None:
+            replay.record(agent_turn, state, action, reward, new_state, new_possible_actions, next_action)
+        if sample_every and step % sample_every == 0:
+            metrics.record_step(step, agent_turn, reward, agent_f, agent_m, td_error)
+
+        # --- Stats: Manhattan distance once per round, then the terminal check ---
+        if step % num_agents == num_agents - 1:
+            if pairwise_distance:
+                metrics.add_distance(abs(agent_f.x - agent_m.x) + abs(agent_f.y - agent_m.y))
+            else:
+                metrics.add_distance(mean_pairwise_distance(runner.agents))
+        if world.is_terminal_state():
+            runner.finish_run(step, current_run_steps)
+            schedule.terminal_reached(step)
+            next_event = schedule.next_step()
+            if runner.stopped:
+                runner.steps_trained = step + 1 - start
+                break
+            learner.end_run()
+            learner.begin_run(policy)
+            current_run_steps = 0
+        elif current_run_steps == 0 and learner.on_policy:
+            # The original SARSA loop (and the numba kernel) also re-chose every pending action
+            # after the first step of training; kept so the results stay the same
+            learner.begin_run(policy)
+        current_run_steps += 1
+    runner.current_run_steps = current_run_steps
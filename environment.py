@@ -4,26 +4,84 @@
 import copy
 from constants import *
 
+# (dx, dy) for each movement action
+MOVE_DELTAS = {'North': (0, -1), 'South': (0, 1), 'East': (1, 0), 'West': (-1, 0)}
+
+# Per-cell bitmask flags
+PICKUP_READY = 1 # pickup cell with at least one block left
+DROPOFF_CELL = 2 # dropoff cell with room for another block
+
 class PDWorld:
     """
-    Manages the state of the 5x5 grid, including pickup/dropoff locations
-    and the number of blocks. Enforces environment rules.
+    Manages the state of the grid (5x5 by default), including pickup/dropoff locations,
+    obstacles and the number of blocks. Enforces environment rules.
+    dropoff_capacity maps a dropoff cell to the most blocks it can hold
+    (cells left out have unlimited capacity).
     """
-    def __init__(self, pickup_locs=None, dropoff_locs=None):
-        self.width = GRID_WIDTH
-        self.height = GRID_HEIGHT
+    def __init__(self, pickup_locs=None, dropoff_locs=None, width=None, height=None,
+                 obstacles=None, dropoff_capacity=None):
+        self.width = GRID_WIDTH if width is None else width
+        self.height = GRID_HEIGHT if height is None else height
+        if self.width < 1 or self.height < 1:
+            raise ValueError(f"Invalid grid size: {self.width}x{self.height}")
+        self.obstacles = set(obstacles) if obstacles else set()
+        self.dropoff_capacity = dict(dropoff_capacity) if dropoff_capacity else {}
         
         self.initial_pickup_locs = copy.deepcopy(pickup_locs) if pickup_locs else copy.deepcopy(DEFAULT_PICKUP_LOCS)
         self.initial_dropoff_locs = copy.deepcopy(dropoff_locs) if dropoff_locs else copy.deepcopy(DEFAULT_DROPOFF_LOCS)
         
         self.total_blocks_at_start = sum(self.initial_pickup_locs.values())
+        # Occupancy (N agents, see track_agents): the cells holding an agent, and the set
+        # get_possible_actions checks moves against (the same set, or a snapshot of it)
+        self.occupied = None
+        self.visible_occupied = None
+        self._build_move_tables()
         self.reset()
 
+    def _build_move_tables(self):
+        """
+        Precomputes movement lookups, since the grid never changes during a run:
+        - _move_targets[pos][action] -> the in-bounds, obstacle-free cell the move leads to
+        - _moves_from[pos] -> the tuple of in-bounds, obstacle-free moves from pos
+        - _blocked_moves[(pos, other_pos)] -> the valid moves when the other agent
+          sits next to pos (every other position leaves _moves_from[pos] unchanged)
+        """
+        self._move_targets = {}
+        self._moves_from = {}
+        self._blocked_moves = {}
+        for x in range(self.width):
+            for y in range(self.height):
+                targets = {}
+                for action, (dx, dy) in MOVE_DELTAS.items():
+                    next_x, next_y = x + dx, y + dy
+                    if (0 <= next_x < self.width and 0 <= next_y < self.height
+                            and (next_x, next_y) not in self.obstacles):
+                        targets[action] = (next_x, next_y)
+                self._move_targets[(x, y)] = targets
+                self._moves_from[(x, y)] = tuple(targets)
+                for target in targets.values():
+                    self._blocked_moves[((x, y), target)] = tuple(a for a, t in targets.items() if t != target)
+
+    def _build_cell_flags(self):
+        """
+        Rebuilds the per-cell pickup/dropoff bitmasks from the current block counts.
+        Called on reset and world change; apply_action clears PICKUP_READY itself
+        when a pickup cell runs out of blocks, and DROPOFF_CELL when a dropoff cell fills up.
+        """
+        self._cell_flags = {}
+        for pos, blocks in self.dropoff_locs.items():
+            if blocks < self.dropoff_capacity.get(pos, float('inf')):
+                self._cell_flags[pos] = self._cell_flags.get(pos, 0) | DROPOFF_CELL
+        for pos, blocks in self.pickup_locs.items():
+            if blocks > 0:
+                self._cell_flags[pos] = self._cell_flags.get(pos, 0) | PICKUP_READY
+
     def reset(self):
         """Resets the environment to the initial state."""
         self.pickup_locs = copy.deepcopy(self.initial_pickup_locs)
         self.dropoff_locs = copy.deepcopy(self.initial_dropoff_locs)
         self.total_blocks_delivered = 0
+        self._build_cell_flags()
 
     def is_terminal_state(self):
         """Checks if all blocks have been delivered."""
@@ -40,75 +98,81 @@ class PDWorld:
         self.total_blocks_at_start = sum(self.initial_pickup_locs.values())
         # We must also reset delivered count to 0 for the *new* task
         self.total_blocks_delivered = 0 
-        print(f"\n--- WORLD CHANGE: Pickup locations changed to: {new_pickup_locs} ---")
+        self._build_cell_flags()
+
+    def track_agents(self, agents):
+        """
+        Switches collision checks to an occupancy set of the agents' cells (for any number of agents),
+        used when other_agent is None. Call again whenever agents are moved outside apply_action.
+        """
+        self.occupied = {(a.x, a.y) for a in agents}
+        self.visible_occupied = self.occupied
 
     def get_possible_actions(self, agent, other_agent):
-        """Returns a list of all valid actions for the agent."""
-        possible = []
+        """
+        Returns a list of all valid actions for the agent.
+        With other_agent None, moves are checked against the occupancy set (see track_agents).
+        """
         agent_pos = (agent.x, agent.y)
-        other_pos = (other_agent.x, other_agent.y)
-        
-        for action, (dx, dy) in {'North': (0, -1), 'South': (0, 1), 'East': (1, 0), 'West': (-1, 0)}.items():
-            next_x, next_y = agent.x + dx, agent.y + dy
-            if 0 <= next_x < self.width and 0 <= next_y < self.height:
-                if (next_x, next_y) != other_pos:
-                    possible.append(action)
-                    
-        if not agent.has_block and agent_pos in self.pickup_locs and self.pickup_locs[agent_pos] > 0:
-            possible.append('Pickup')
-        # Assuming dropoff locs have infinite capacity as per prompt (or e.g., 5)
-        if agent.has_block and agent_pos in self.dropoff_locs:
-            possible.append('Dropoff')
+        if other_agent is None:
+            targets = self._move_targets[agent_pos]
+            occupied = self.visible_occupied
+            possible = [a for a in self._moves_from[agent_pos] if targets[a] not in occupied]
+        else:
+            # Moves that stay on the grid, minus the one into the other agent (if adjacent)
+            possible = list(self._blocked_moves.get((agent_pos, (other_agent.x, other_agent.y)),
+                                                    self._moves_from[agent_pos]))
+        flags = self._cell_flags.get(agent_pos, 0)
+        if flags:
+            if not agent.has_block and flags & PICKUP_READY:
+                possible.append('Pickup')
+            # Dropoff locs have infinite capacity unless the world sets dropoff_capacity
+            if agent.has_block and flags & DROPOFF_CELL:
+                possible.append('Dropoff')
         return possible
 
     def apply_action(self, agent, other_agent, action):
         """
-        Applies an agent's action to the world.
+        Applies an agent's action to the world (other_agent None: collisions use the occupancy set).
+        With a frozen snapshot (simultaneous turns) a move is checked against the same snapshot
+        get_possible_actions offered it from; if an earlier agent of the round already moved into
+        the target, the agent stays where it is at the cost of a normal move (-1, not -10).
         MODIFIES the agent object and the world state.
-        Returns the reward.
+        Returns the reward. Raises ValueError for an unknown action.
         """
         agent_pos = (agent.x, agent.y)
-        other_pos = (other_agent.x, other_agent.y)
-        reward = -1  # Default cost for a move
-        is_valid = True
-        new_x, new_y = agent.x, agent.y
 
-        if action == 'North': new_y -= 1
-        elif action == 'South': new_y += 1
-        elif action == 'East': new_x += 1
-        elif action == 'West': new_x -= 1
-        elif action == 'Pickup':
-            if not agent.has_block and agent_pos in self.pickup_locs and self.pickup_locs[agent_pos] > 0:
+        if action == 'Pickup':
+            if not agent.has_block and self._cell_flags.get(agent_pos, 0) & PICKUP_READY:
                 agent.has_block = True
                 self.pickup_locs[agent_pos] -= 1
-                reward = 13
-            else:
-                is_valid = False
-                reward = -10
-        elif action == 'Dropoff':
-            if agent.has_block and agent_pos in self.dropoff_locs:
+                if self.pickup_locs[agent_pos] == 0: # out of stock: clear the pickup bit
+                    self._cell_flags[agent_pos] &= ~PICKUP_READY
+                return 13
+            return -10
+
+        if action == 'Dropoff':
+            if agent.has_block and self._cell_flags.get(agent_pos, 0) & DROPOFF_CELL:
                 agent.has_block = False
                 self.dropoff_locs[agent_pos] += 1
+                if self.dropoff_locs[agent_pos] >= self.dropoff_capacity.get(agent_pos, float('inf')):
+                    self._cell_flags[agent_pos] &= ~DROPOFF_CELL # full: clear the dropoff bit
                 self.total_blocks_delivered += 1
-                reward = 13
-            else:
-                is_valid = False
-                reward = -10
-
-        if action in ['North', 'South', 'East', 'West']:
-            # Boundary check
-            if not (0 <= new_x < self.width and 0 <= new_y < self.height):
-                is_valid = False
-                reward = -10
-                new_x, new_y = agent.x, agent.y
-            # Blockage check
-            elif (new_x, new_y) == other_pos:
-                is_valid = False
-                reward = -10
-                new_x, new_y = agent.x, agent.y
-        
-        # Apply valid move
-        if action in ['North', 'South', 'East', 'West'] and is_valid:
-            agent.x, agent.y = new_x, new_y
+                return 13
+            return -10
 
-        return reward
\ No newline at end of file
+        # Movement: off-grid/obstacle moves have no target, and the other agent blocks its cell
+        target = self._move_targets[agent_pos].get(action)
+        if target is None and action not in MOVE_DELTAS:
+            raise ValueError(f"Unknown action: {action} (expected one of {ACTIONS})")
+        if other_agent is None: # N agents: any occupied cell blocks
+            if target is None or target in self.visible_occupied:
+                return -10
+            if target in self.occupied: # taken earlier in this simultaneous round: a clash, not an invalid move
+                return -1
+            self.occupied.discard(agent_pos)
+            self.occupied.add(target)
+        elif target is None or target == (other_agent.x, other_agent.y):
+            return -10
+        agent.x, agent.y = target
+        return -1
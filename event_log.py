@@ -0,0 +1,116 @@
+# this is discover-paths-rl/event_log.py
+# this file contains the EventLog class, a structured (JSON Lines) run log
+# with level filtering and batched writes
+
+import json
+import time
+
+LEVELS = {'DEBUG': 10, 'INFO': 20, 'WARNING': 30, 'ERROR': 40}
+
+class EventLog:
+    """
+    Records structured events such as {"event": "terminal_reached", "step": 812, ...}.
+    Events below `level` are dropped. The rest are buffered and written to `filename`
+    as JSON Lines once `buffer_size` events have built up (and on flush/close).
+    With echo=True, events are also printed as readable lines to sys.stdout.
+    With a ResultsSink (results_sink.py), the batches are written by its background thread.
+    The process's stdout/stderr are never replaced.
+    """
+    def __init__(self, filename=None, level='INFO', buffer_size=512, echo=False, sink=None):
+        self.filename = filename
+        self.level = LEVELS[level]
+        self.buffer_size = buffer_size
+        self.echo = echo
+        self.sink = sink
+        self._buffer = []
+        self._file = open(filename, 'w', encoding='utf-8') if filename else None
+
+    def enabled(self, level):
+        """True if events at this level are kept (lets callers skip building costly fields)."""
+        return LEVELS[level] >= self.level
+
+    def emit(self, event, level='INFO', **fields):
+        """Records one event. Fields must be JSON-serializable."""
+        if LEVELS[level] < self.level:
+            return
+        record = {'time': time.time(), 'level': level, 'event': event, **fields}
+        if self.echo:
+            details = ", ".join(f"{k}={v}" for k, v in fields.items())
+            print(f"[{level}] {event}: {details}" if details else f"[{level}] {event}")
+        if self._file is not None:
+            self._buffer.append(record)
+            if len(self._buffer) >= self.buffer_size:
+                self.flush()
+
+    def bind(self, **fields):
+        """Returns a view of this log that adds `fields` (e.g. experiment=name) to every event."""
+        return BoundEventLog(self, fields)
+
+    def flush(self):
+        """Writes all buffered events in one batch."""
+        if self._file is None or not self._buffer:
+            return
+        text = "".join(json.dumps(r, default=str) + "\n" for r in self._buffer)
+        if self.sink is not None:
+            self.sink.append(self._file, text)
+        else:
+            self._file.write(text)
+            self._file.flush()
+        self._buffer.clear()
+
+    def close(self):
+        """Flushes and closes the log file."""
+        self.flush()
+        if self._file is not None:
+            try:
+                if self.sink is not None:
+                    self.sink.flush() # the queued batches go to this file
+            finally:
+                self._file.close()
+                self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class BoundEventLog:
+    """An EventLog view that adds fixed fields to every event; writes go to the parent log."""
+    def __init__(self, log, fields):
+        self._log = log
+        self.fields = fields
+
+    def enabled(self, level):
+        return self._log.enabled(level)
+
+    def emit(self, event, level='INFO', **fields):
+        self._log.emit(event, level, **self.fields, **fields)
+
+    def bind(self, **fields):
+        return BoundEventLog(self._log, {**self.fields, **fields})
+
+    def flush(self):
+        self._log.flush()
+
+def console_log(level='INFO'):
+    """An EventLog that only prints readable lines (the default for a standalone ExperimentRunner)."""
+    return EventLog(level=level, echo=True)
+
+def read_events(filename, event=None, level=None, **match):
+    """
+    Yields the events in a JSON Lines log, optionally filtered by event name,
+    minimum level and exact field values, e.g.
+    read_events(path, 'terminal_reached', experiment='Exp_2_SARSA').
+    """
+    min_level = LEVELS[level] if level else 0
+    with open(filename, 'r', encoding='utf-8') as f:
+        for line in f:
+            record = json.loads(line)
+            if event and record['event'] != event:
+                continue
+            if LEVELS.get(record['level'], 0) < min_level:
+                continue
+            if any(record.get(k) != v for k, v in match.items()):
+                continue
+            yield record
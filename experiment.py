@@ -2,250 +2,492 @@
 # this file contains the ExperimentRunner class
 # which sets up and runs experiments based on configurations
 
+import os
+import random
+from collections import deque
+from constants import ACTIONS
 from environment import PDWorld
 from agent import Agent, RLAgentController
-from visualization import Visualization
-from constants import AGENT_F_START, AGENT_M_START
+from q_table import sparse_q_arrays
+from world_config import world_spec_from_config, parse_pickup_locs, cell_list, validate_world_change
+from event_log import console_log
+from metrics import MetricsRecorder, ARROW_AVAILABLE
+from rng import RandomStream, stream_generator
+from multi_agent import TURN_ORDERS, AgentView, parse_state_encoding, state_encoder
+from replay import Replay
+from dp_solver import solve, greedy_regret
+from engine import LEARNERS, make_learner, run_engine
+from instrumentation import Instrumentation
+from convergence import ConvergenceMonitor
 
 class ExperimentRunner:
     """Runs a single, complete experiment based on a configuration."""
     
-    def __init__(self, config):
+    def __init__(self, config, event_log=None, renderer=None, sink=None):
         self.config = config
+        self.renderer = renderer # shared PlotRenderer; None = draw this experiment's figures inline
+        self.sink = sink # shared ResultsSink (background file writes); None = write them here
+
+        # Structured events (see event_log.py); without a log, INFO events are printed to the console
+        self.log = (event_log if event_log is not None else console_log()).bind(experiment=self.config['name'])
+        self.log.emit('experiment_init')
         
-        print("\n" + "="*50)
-        print(f"Initializing Experiment: {self.config['name']}")
-        print("="*50)
-        
-        # Init environment
-        self.world = PDWorld()
-        
-        # Init agents
-        self.agent_f = Agent('F', **AGENT_F_START)
-        self.agent_m = Agent('M', **AGENT_M_START)
-        
-        # Init controllers
-        self.controller_f = RLAgentController(
-            self.agent_f, self.agent_m, self.world,
-            self.config['learning_rate'], self.config['discount_factor']
-        )
-        self.controller_m = RLAgentController(
-            self.agent_m, self.agent_f, self.world,
-            self.config['learning_rate'], self.config['discount_factor']
+        # Init environment (geometry from config['world'] / config['world_file'], default 5x5)
+        self.world_spec = world_spec_from_config(self.config)
+        self.world = PDWorld(
+            self.world_spec['pickup_locs'], self.world_spec['dropoff_locs'],
+            width=self.world_spec['width'], height=self.world_spec['height'],
+            obstacles=self.world_spec['obstacles'],
+            dropoff_capacity=self.world_spec['dropoff_capacity']
         )
+
+        # World change: pickup locations move after N terminal states
+        world_change = self.config.get('world_change')
+        if world_change:
+            self.world_change_after = world_change['after_terminal_states']
+            self.world_change_pickup_locs = parse_pickup_locs(world_change['pickup_locs'])
+            validate_world_change(self.world_spec, self.world_change_pickup_locs)
+        else:
+            self.world_change_after = None
+            self.world_change_pickup_locs = None
         
-        self.agents = [self.agent_f, self.agent_m]
-        self.controllers = [self.controller_f, self.controller_m]
+        # Init agents (the first two keep their F / M roles in the stats and plots)
+        self.agent_starts = [{k: a[k] for k in ('x', 'y', 'has_block')} for a in self.world_spec['agents']]
+        self.agents = [Agent(a['name'], **start) for a, start in zip(self.world_spec['agents'], self.agent_starts)]
+        self.agent_f, self.agent_m = self.agents[0], self.agents[1]
+        self.num_agents = len(self.agents)
+
+        # N agents: turn order, state encoding and an optional shared Q-table. Two agents with the
+        # joint state and sequential turns keep the original pairwise collision check and state tuple;
+        # everything else goes through the world's occupancy set and a state encoder
+        self.turn_order = self.config.get('turn_order', 'round_robin')
+        if self.turn_order not in TURN_ORDERS:
+            raise ValueError(f"Unknown turn order: {self.turn_order} (expected one of {TURN_ORDERS})")
+        self.state_encoding, nearest_k = parse_state_encoding(self.config.get('state_encoding', 'joint'))
+        self.shared_q_table = self.config.get('shared_q_table', False)
+        pairwise = self.num_agents == 2 and self.state_encoding == 'joint' and self.turn_order != 'simultaneous'
+        self.view = None
+        if not pairwise:
+            self.world.track_agents(self.agents)
+            self.view = AgentView(self.agents, self.world)
+        # The numba kernel only implements the original setup and algorithms
+        if self.config['algorithm'] not in LEARNERS:
+            raise ValueError(f"Unknown algorithm: {self.config['algorithm']} (expected one of {tuple(LEARNERS)})")
+        self.kernel_compatible = (pairwise and self.turn_order == 'round_robin' and not self.shared_q_table
+                                  and self.config['algorithm'] in ('Q_LEARNING', 'SARSA'))
+
+        # Random streams: one per controller, derived from config['seed'] (or from the global
+        # generator, which main.py / the scheduler seed per experiment)
+        self.seed = self.config.get('seed')
+        if self.seed is None:
+            self.seed = random.getrandbits(63)
+        self.turn_rng = RandomStream(self.seed, self.num_agents + 1) # random turn order
+
+        # Init controllers
+        dense_q_table = self.config.get('dense_q_table', False) # opt-in NumPy-backed Q-table
+        if dense_q_table and not (self.num_agents == 2 and self.state_encoding == 'joint'):
+            raise ValueError("dense_q_table needs 2 agents and the joint state encoding")
+        argmax_cache = self.config.get('argmax_cache', False) # opt-in per-state max/argmax cache
+        self.controllers = [
+            RLAgentController(
+                agent, self.agents[1 - i] if pairwise else None, self.world,
+                self.config['learning_rate'], self.config['discount_factor'],
+                dense_q_table=dense_q_table, rng=RandomStream(self.seed, i), argmax_cache=argmax_cache,
+                state_encoder=None if pairwise else state_encoder(self.state_encoding, i, self.view, nearest_k)
+            )
+            for i, agent in enumerate(self.agents)
+        ]
+        self.link_shared_q_table()
+        self.controller_f, self.controller_m = self.controllers[0], self.controllers[1]
+        self._round_order = list(range(self.num_agents))
+
+        # Experience replay (replay.py): batched TD updates from past transitions, on the dense table
+        self.replay = None
+        if self.config.get('replay'):
+            if not dense_q_table:
+                raise ValueError("replay needs dense_q_table")
+            self.replay = Replay(self.config['replay'], self.controllers,
+                                 stream_generator(self.seed, self.num_agents + 2),
+                                 sarsa=LEARNERS[self.config['algorithm']].on_policy)
+            self.kernel_compatible = False
 
-        # Stats tracking
-        self.steps_per_run = []
-        self.all_manhattan_distances = []
-        self.total_rewards = {self.agent_f.name: 0, self.agent_m.name: 0}
+        # Stats tracking (per-run table, sampled per-step rows, Manhattan distance total)
+        self.metrics = MetricsRecorder.from_config(self.config.get('metrics'))
+        self.total_rewards = {agent.name: 0 for agent in self.agents}
         self.terminal_states_reached = 0
 
+        # Opt-in per-phase timers, counters and profiler for this experiment (instrumentation.py)
+        self.instrumentation = Instrumentation.from_config(self.config.get('instrumentation'), self.config['name'])
+
+        # Checkpoints (checkpoint.py): warm start from a saved one, save every N steps and at the end
+        self.checkpoint_every = self.config.get('checkpoint_every', 0)
+        self.checkpoint_path = self.config.get('checkpoint_path')
+        if self.checkpoint_every and not self.checkpoint_path:
+            self.checkpoint_path = f"results/{self.config['name']}_checkpoint.npz"
+
+        # Early stopping: stop when the mean steps over the last `window` runs hasn't improved
+        # (dropped by more than min_delta) for `patience` terminal states
+        early_stop = self.config.get('early_stop') or {}
+        self.early_stop_patience = early_stop.get('patience', 0)
+        self.early_stop_window = early_stop.get('window', 5)
+        self.early_stop_min_delta = early_stop.get('min_delta', 0.0)
+        self._recent_run_steps = deque(maxlen=self.early_stop_window)
+        self._best_recent_mean = float('inf')
+        self._runs_since_best = 0
+        self.stopped = False # set once early stopping triggers
+        self.stop_reason = 'budget'
+        self.steps_trained = 0 # by this train() call (a resumed run counts from its checkpoint)
+
+        # Run state: where training starts and the state of the run in progress there
+        # (all 0 / empty unless a warm start with restore="all" resumes a checkpoint)
+        self.start_step = 0
+        self.current_run_steps = 0
+        self._run_start_step = 0 # first step of the current run
+        self.first_policy_switch_run = -1 # run number where the policy first switched
+        self.world_changed = False
+        self.learner = None # the engine's learner while training
+        self.learner_state = None # Learner.state() to resume the learner from
+
+        # Convergence criteria (convergence.py): end the run once steps per run, Q-values or the greedy
+        # policy have settled. The first step they held on is recorded even with "stop": False
+        self.convergence = ConvergenceMonitor.from_config(self.config.get('convergence'))
+        self.converged_step = None
+        self.convergence_criteria = []
+        if self.convergence is not None:
+            self.kernel_compatible = False
+
+        # Exact baseline (dp_solver.py): the fewest steps per run, from dynamic programming over every
+        # reachable state, solved on first use (dp_solution). With an epsilon, training stops once the
+        # mean gap of the last `window` runs to the optimum is at most epsilon (relative)
+        dp_baseline = self.config.get('dp_baseline')
+        self.dp_baseline = bool(dp_baseline)
+        self.dp_solutions = {} # task (0, or 1 after the world change) -> DPSolution
+        self.near_optimal_epsilon = None
+        if dp_baseline:
+            if not (self.num_agents == 2 and self.state_encoding == 'joint' and self.turn_order == 'round_robin'):
+                raise ValueError("dp_baseline needs 2 agents, the joint state and round-robin turns")
+            dp_baseline = dp_baseline if isinstance(dp_baseline, dict) else {}
+            self.near_optimal_epsilon = dp_baseline.get('epsilon')
+            self._near_optimal_gaps = deque(maxlen=dp_baseline.get('window', 5))
+            if self.near_optimal_epsilon is not None:
+                self.kernel_compatible = False
+
+        if self.config.get('warm_start'):
+            self._warm_start(self.config['warm_start'])
+
+    @property
+    def steps_per_run(self):
+        """Steps taken in each finished run."""
+        return self.metrics.runs.column('steps').tolist()
+
+    @property
+    def terminal_steps(self):
+        """Step index at which each terminal state was reached."""
+        return self.metrics.runs.column('end_step').tolist()
+
     def run(self):
-        """Runs the simulation loop for this experiment."""
-        
-        print(f"Starting simulation... {self.config['total_steps']} steps.")
-        print(f"Algorithm: {self.config['algorithm']}, LR(α): {self.config['learning_rate']}")
-        
-        # Get policy schedule
-        policy_schedule = self.config['policy_schedule']
-        policy_index = 0
-        current_policy = policy_schedule[policy_index][1]
-        policy_switch_step = policy_schedule[policy_index][0]
-        first_policy_switch_run = -1 # Run number where policy switched
-        
-        current_run_steps = 0
-        
-        # --- Handle different loop logic for Q-Learning vs SARSA ---
-        if self.config['algorithm'] == 'Q_LEARNING':
-            self._run_q_learning_loop(policy_schedule, policy_index, current_policy, policy_switch_step, first_policy_switch_run, current_run_steps)
-        elif self.config['algorithm'] == 'SARSA':
-            self._run_sarsa_loop(policy_schedule, policy_index, current_policy, policy_switch_step, first_policy_switch_run, current_run_steps)
-        else:
-            raise ValueError(f"Unknown algorithm: {self.config['algorithm']}")
-            
+        """Runs the simulation loop for this experiment, then reports the results."""
+        self.train()
         self._print_results()
 
-    def _run_q_learning_loop(self, policy_schedule, policy_index, current_policy, policy_switch_step, first_policy_switch_run, current_run_steps):
-        """Main simulation loop for Q-Learning."""
-        
-        for step in range(self.config['total_steps']):
-            # --- Policy Switching Logic ---
-            if policy_index < len(policy_schedule) - 1 and step >= policy_switch_step:
-                if first_policy_switch_run == -1:
-                    first_policy_switch_run = len(self.steps_per_run)
-                policy_index += 1
-                switch_step_limit, new_policy = policy_schedule[policy_index]
-                current_policy = new_policy
-                policy_switch_step += switch_step_limit
-                print(f"--- Step {step}: Switching policy to {current_policy} ---")
-
-            # --- Experiment 4: World Change Logic ---
-            if 'Exp_4_Adaptability' in self.config['name'] and self.terminal_states_reached == 3:
-                self.world.change_pickup_locations({(1, 2): 5, (4, 4): 5}) # New locs
-                self.terminal_states_reached = 3.1 # Hack to prevent re-triggering
-
-            # --- Agent Turn ---
-            agent_turn = step % 2
-            controller = self.controllers[agent_turn]
-            
-            # 1. Get State (S)
-            old_state = controller.get_current_state()
-            possible_actions = self.world.get_possible_actions(controller.agent, controller.other_agent)
-            
-            # 2. Choose Action (A)
-            action = controller.choose_action(current_policy, possible_actions)
-            if action is None:
-                continue # Agent is trapped
-            
-            # 3. Apply Action, get Reward (R)
-            reward = self.world.apply_action(controller.agent, controller.other_agent, action)
-            self.total_rewards[controller.agent.name] += reward
-            
-            # 4. Get New State (S') and New Actions
-            new_state = controller.get_current_state()
-            new_possible_actions = self.world.get_possible_actions(controller.agent, controller.other_agent)
-            
-            # 5. Update Q-Table
-            controller.update_q_table(old_state, action, reward, new_state, new_possible_actions)
-            
-            # --- Stats and Terminal State Check ---
-            self.first_policy_switch_run = first_policy_switch_run # Store this for plotting
-            current_run_steps = self._track_stats_and_reset(step, current_run_steps)
-            current_run_steps += 1
-
-    def _run_sarsa_loop(self, policy_schedule, policy_index, current_policy, policy_switch_step, first_policy_switch_run, current_run_steps):
-        """Main simulation loop for SARSA."""
+    def link_shared_q_table(self):
+        """With shared_q_table, points every controller at the first one's table (and argmax cache)."""
+        if self.shared_q_table: # all agents learn into (and act on) one table
+            for controller in self.controllers[1:]:
+                controller.q_table = self.controllers[0].q_table
+                controller.argmax_cache = self.controllers[0].argmax_cache
+
+    def train(self):
+        """Runs only the simulation loop (no results printing or plots)."""
         
-        # SARSA requires choosing the first action *before* the loop
-        sarsa_s_a = [None, None] # To store (state, action) for F and M
-        for i in [0, 1]:
-            controller = self.controllers[i]
-            state = controller.get_current_state()
-            possible = self.world.get_possible_actions(controller.agent, controller.other_agent)
-            action = controller.choose_action(current_policy, possible)
-            sarsa_s_a[i] = {'state': state, 'action': action}
-
-        for step in range(self.config['total_steps']):
-            # --- Policy Switching Logic ---
-            if policy_index < len(policy_schedule) - 1 and step >= policy_switch_step:
-                if first_policy_switch_run == -1:
-                    first_policy_switch_run = len(self.steps_per_run)
-                policy_index += 1
-                switch_step_limit, new_policy = policy_schedule[policy_index]
-                current_policy = new_policy
-                policy_switch_step += switch_step_limit
-                print(f"--- Step {step}: Switching policy to {current_policy} ---")
-
-            # --- Experiment 4: World Change Logic ---
-            if 'Exp_4_Adaptability' in self.config['name'] and self.terminal_states_reached == 3:
-                self.world.change_pickup_locations({(1, 2): 5, (4, 4): 5}) # New locs
-                self.terminal_states_reached = 3.1 # Hack to prevent re-triggering
-
-            # --- Agent Turn ---
-            agent_turn = step % 2
-            controller = self.controllers[agent_turn]
-
-            # 1. Get OLD State and Action (S, A)
-            old_state = sarsa_s_a[agent_turn]['state']
-            action = sarsa_s_a[agent_turn]['action']
-            
-            if action is None:
-                continue # Agent was trapped
-
-            # 2. Apply Action, get Reward (R) and New State (S')
-            reward = self.world.apply_action(controller.agent, controller.other_agent, action)
-            self.total_rewards[controller.agent.name] += reward
-            new_state = controller.get_current_state()
-
-            # 3. Get New State's Actions and Choose NEXT Action (A')
-            new_possible_actions = self.world.get_possible_actions(controller.agent, controller.other_agent)
-            next_action = controller.choose_action(current_policy, new_possible_actions)
-
-            # 4. Update Q-Table (using S, A, R, S', A')
-            controller.update_sarsa_table(old_state, action, reward, new_state, next_action)
-            
-            # 5. Store S' and A' for the *next* loop iteration
-            sarsa_s_a[agent_turn]['state'] = new_state
-            sarsa_s_a[agent_turn]['action'] = next_action
-
-            # --- Stats and Terminal State Check ---
-            self.first_policy_switch_run = first_policy_switch_run # Store this for plotting
-            current_run_steps = self._track_stats_and_reset(step, current_run_steps)
-            
-            # If reset, we must re-initialize S-A for SARSA
-            if current_run_steps == 0:
-                for i in [0, 1]:
-                    c = self.controllers[i]
-                    s = c.get_current_state()
-                    p = self.world.get_possible_actions(c.agent, c.other_agent)
-                    a = c.choose_action(current_policy, p)
-                    sarsa_s_a[i] = {'state': s, 'action': a}
-            
-            current_run_steps += 1
-
-    def _track_stats_and_reset(self, step, current_run_steps):
-        """Internal helper to track stats and reset world if terminal."""
-        # Record Manhattan distance (once per step, e.g., after M moves)
-        if step % 2 == 1:
-            dist = abs(self.agent_f.x - self.agent_m.x) + abs(self.agent_f.y - self.agent_m.y)
-            self.all_manhattan_distances.append(dist)
-            
-        if self.world.is_terminal_state():
-            print(f"--- Step {step}: Terminal state {int(self.terminal_states_reached) + 1} reached in {current_run_steps + 1} steps! ---")
-            self.terminal_states_reached += 1
-            self.steps_per_run.append(current_run_steps + 1)
-            
-            # Reset world and agents
-            self.world.reset()
-            self.agent_f.reset(**AGENT_F_START)
-            self.agent_m.reset(**AGENT_M_START)
-            return 0 # Return 0 to reset current_run_steps
-            
-        return current_run_steps # Not terminal, return current count
+        self.log.emit('training_started', total_steps=self.config['total_steps'],
+                      algorithm=self.config['algorithm'], learning_rate=self.config['learning_rate'], seed=self.seed)
+
+        # --- Optional compiled backend (runs the whole loop as one numba kernel) ---
+        compiled = False
+        if self.config.get('backend', 'python') == 'numba':
+            from compiled_backend import NUMBA_AVAILABLE, run_compiled
+            compiled = NUMBA_AVAILABLE and self.kernel_compatible
+            if not NUMBA_AVAILABLE:
+                self.log.emit('backend_fallback', 'WARNING', requested='numba', used='python',
+                              reason="numba is not installed")
+            elif not compiled:
+                self.log.emit('backend_fallback', 'WARNING', requested='numba', used='python',
+                              reason="the kernel only runs Q_LEARNING / SARSA with 2 agents, the joint state, "
+                                     "round-robin turns and separate Q-tables, without replay, convergence "
+                                     "checks or a resumed checkpoint")
+            elif self.checkpoint_every:
+                self.log.emit('checkpoint_every_ignored', 'WARNING', reason="the numba kernel runs "
+                              "the whole loop at once; only the final checkpoint is saved")
+
+        # --- Training loop: the numba kernel, or the step engine with the algorithm's learner ---
+        learner = self.learner = None if compiled else make_learner(self)
+        if self.instrumentation is not None:
+            self.instrumentation.attach(self, learner)
+            self.instrumentation.start()
+        try:
+            if compiled:
+                run_compiled(self)
+            else:
+                run_engine(self, learner)
+        finally:
+            if self.instrumentation is not None:
+                self.instrumentation.stop()
+
+        if self.checkpoint_path: # labelled with the steps actually trained (early stops end before total_steps)
+            self.save_checkpoint(self.start_step + self.steps_trained)
+
+    def _warm_start(self, warm_start):
+        """
+        Loads a checkpoint before training. warm_start is a path, or
+        {"path": ..., "restore": "q_tables" | "all"} ("all" resumes the run: training continues from
+        the checkpoint's step to total_steps, on the same policy_schedule).
+        """
+        from checkpoint import restore_checkpoint
+        if isinstance(warm_start, str):
+            warm_start = {'path': warm_start}
+        restore = warm_start.get('restore', 'q_tables')
+        if self.sink is not None:
+            self.sink.flush() # the checkpoint may still be queued by an earlier experiment
+        meta = restore_checkpoint(self, warm_start['path'], restore)
+        if restore == 'all':
+            self.kernel_compatible = False # the kernel always starts at step 0
+        self.log.emit('warm_start', path=warm_start['path'], restore=restore,
+                      source_experiment=meta['experiment'], source_step=meta['step'],
+                      q_table_size={c.agent.name: len(c.q_table) for c in self.controllers})
+
+    def save_checkpoint(self, step):
+        """Saves a checkpoint (Q-tables, world, agents, RNG) after `step` steps to checkpoint_path."""
+        from checkpoint import save_checkpoint
+        path = save_checkpoint(self, self.checkpoint_path, step, self.sink)
+        self.log.emit('checkpoint_saved', step=step, path=path)
+
+    def _next_turn(self, step):
+        """The acting agent for the random and simultaneous turn orders (once per round: new order / snapshot)."""
+        i = step % self.num_agents
+        if i == 0:
+            if self.turn_order == 'random':
+                self._round_order = self.turn_rng.sample(range(self.num_agents), self.num_agents)
+            else: # simultaneous: everyone sees the others where they were at the start of the round
+                self.view.freeze()
+        return self._round_order[i]
+
+    def finish_run(self, step, run_steps):
+        """Records a run that ended in a terminal state on `step`, checks the stopping rules and resets the world and agents."""
+        self.log.emit('terminal_reached', 'DEBUG', step=step,
+                      terminal_state=self.terminal_states_reached + 1, run_steps=run_steps + 1)
+        self.terminal_states_reached += 1
+        self.metrics.record_run(step, run_steps + 1, [self.total_rewards[a.name] for a in self.agents])
+        if self.early_stop_patience:
+            self._check_early_stop(step, run_steps + 1)
+        if self.near_optimal_epsilon is not None and not self.stopped:
+            self._check_near_optimal(step)
+        if self.convergence is not None and self.converged_step is None and not self.stopped:
+            self._check_convergence(step, run_steps + 1)
+        self._run_start_step = step + 1
+
+        # Reset world and agents
+        self.world.reset()
+        for agent, start in zip(self.agents, self.agent_starts):
+            agent.reset(**start)
+        if self.view is not None:
+            self.world.track_agents(self.agents)
+            if self.turn_order == 'simultaneous':
+                self.view.freeze()
+
+    def change_world(self, step, pickup_locs):
+        """Moves the pickup locations (the world_change event)."""
+        self.world.change_pickup_locations(pickup_locs)
+        self.world_changed = True
+        self.log.emit('world_change', step=step, pickup_locs=cell_list(pickup_locs))
+        if self.replay is not None:
+            self.replay.world_changed()
+
+    def dp_solution(self, run_index):
+        """
+        The DP solution for the task of a run (the world after the change from world_change_after on),
+        solved the first time it is asked for.
+        """
+        task = int(self.world_change_after is not None and run_index >= self.world_change_after)
+        if task not in self.dp_solutions:
+            spec = self.world_spec if task == 0 else {**self.world_spec, 'pickup_locs': self.world_change_pickup_locs}
+            solution = self.dp_solutions[task] = solve(spec)
+            self.log.emit('dp_solved', task=task, states=solution.num_states, iterations=solution.iterations,
+                          seconds=round(solution.seconds, 3), optimal_steps=solution.optimal_steps(0))
+        return self.dp_solutions[task]
+
+    def regret_per_run(self):
+        """Steps of each finished run minus the optimum for its task and first mover."""
+        runs = self.metrics.runs
+        regret = []
+        start = 0
+        for i, end_step in enumerate(runs.column('end_step').tolist()):
+            regret.append(end_step + 1 - start - self.dp_solution(i).optimal_steps(start % 2))
+            start = end_step + 1
+        return regret
+
+    def _check_near_optimal(self, step):
+        """Stops training once the recent runs are within near_optimal_epsilon of the optimum."""
+        start = self._run_start_step
+        optimal = self.dp_solution(self.metrics.num_runs - 1).optimal_steps(start % 2)
+        self._near_optimal_gaps.append((step + 1 - start - optimal) / optimal)
+        gap = sum(self._near_optimal_gaps) / len(self._near_optimal_gaps)
+        if len(self._near_optimal_gaps) == self._near_optimal_gaps.maxlen and gap <= self.near_optimal_epsilon:
+            self.stopped = True
+            self.stop_reason = 'near_optimal'
+            self.log.emit('near_optimal_stop', step=step, terminal_states=int(self.terminal_states_reached),
+                          mean_gap=gap, epsilon=self.near_optimal_epsilon)
+
+    def _check_convergence(self, step, run_steps):
+        """Records the first terminal state where the convergence criteria hold, and stops there unless "stop" is False."""
+        tables = list({id(c.q_table): c.q_table for c in self.controllers}.values()) # shared_q_table: once
+        met = self.convergence.update(tables, run_steps)
+        if not met:
+            return
+        self.converged_step = step + 1
+        self.convergence_criteria = met
+        if self.convergence.stop:
+            self.stopped = True
+            self.stop_reason = 'converged'
+        self.log.emit('converged', step=step, terminal_states=int(self.terminal_states_reached),
+                      criteria=met, stopped=self.convergence.stop)
+
+    def stop_state(self):
+        """The early-stop, near-optimal and convergence bookkeeping (JSON-serializable, for checkpoints)."""
+        state = {'recent_run_steps': list(self._recent_run_steps), 'best_recent_mean': self._best_recent_mean,
+                 'runs_since_best': self._runs_since_best}
+        if self.near_optimal_epsilon is not None:
+            state['near_optimal_gaps'] = list(self._near_optimal_gaps)
+        if self.convergence is not None:
+            state.update(convergence=self.convergence.state(), converged_step=self.converged_step,
+                         convergence_criteria=self.convergence_criteria)
+        return state
+
+    def load_stop_state(self, state):
+        self._recent_run_steps.extend(state['recent_run_steps'])
+        self._best_recent_mean = state['best_recent_mean']
+        self._runs_since_best = state['runs_since_best']
+        if self.near_optimal_epsilon is not None and 'near_optimal_gaps' in state:
+            self._near_optimal_gaps.extend(state['near_optimal_gaps'])
+        if self.convergence is not None and 'convergence' in state:
+            self.convergence.load_state(state['convergence'])
+            self.converged_step = state['converged_step']
+            self.convergence_criteria = state['convergence_criteria']
+
+    def _check_early_stop(self, step, run_steps):
+        """Updates the early-stopping state after a terminal state (same rule as the numba kernel)."""
+        self._recent_run_steps.append(run_steps)
+        recent_mean = sum(self._recent_run_steps) / len(self._recent_run_steps)
+        if recent_mean < self._best_recent_mean - self.early_stop_min_delta:
+            self._best_recent_mean = recent_mean
+            self._runs_since_best = 0
+        else:
+            self._runs_since_best += 1
+        if self._runs_since_best >= self.early_stop_patience:
+            self.stopped = True
+            self.stop_reason = 'early_stop'
+            self.log.emit('early_stop', step=step, terminal_states=int(self.terminal_states_reached),
+                          best_recent_mean=self._best_recent_mean, patience=self.early_stop_patience)
         
+    def summary(self):
+        """Returns the final stats as a plain (picklable) dict."""
+        steps_per_run = self.steps_per_run
+        avg_steps = sum(steps_per_run) / len(steps_per_run) if steps_per_run else None
+        summary = {
+            'name': self.config['name'],
+            'algorithm': self.config['algorithm'],
+            'learning_rate': self.config['learning_rate'],
+            'discount_factor': self.config['discount_factor'],
+            'total_steps': self.config['total_steps'],
+            'steps_trained': self.steps_trained,
+            'stop_reason': self.stop_reason,
+            'terminal_states': int(self.terminal_states_reached),
+            'first_policy_switch_run': getattr(self, 'first_policy_switch_run', -1),
+            'steps_per_run': steps_per_run,
+            'rewards_per_run': self.metrics.runs.column('reward').tolist(),
+            'distance_per_run': self.metrics.runs.column('mean_distance').tolist(),
+            'avg_steps_per_run': avg_steps,
+            'avg_manhattan_distance': self.metrics.mean_distance(),
+            'total_rewards': dict(self.total_rewards),
+            'q_table_size': {c.agent.name: len(c.q_table) for c in self.controllers},
+            'replay_batches': self.replay.batches if self.replay is not None else 0,
+        }
+        if self.convergence is not None:
+            summary.update(converged_step=self.converged_step, convergence_criteria=self.convergence_criteria)
+        if self.instrumentation is not None:
+            summary['instrumentation'] = self.instrumentation.summary(self.steps_trained)
+        if self.dp_baseline:
+            # The learned greedy policy, rolled out from the start of the current task
+            greedy = greedy_regret(self.dp_solution(self.metrics.num_runs), self)
+            summary.update(optimal_steps=self.dp_solution(self.metrics.num_runs).optimal_steps(0),
+                           greedy_steps=greedy['steps'] if greedy['reached_terminal'] else None,
+                           greedy_regret=sum(greedy['regret']), regret_per_run=self.regret_per_run())
+        return summary
+
+    def _save_metrics(self):
+        """Writes the metrics tables if the config has a "metrics" section."""
+        metrics_config = self.config.get('metrics')
+        if not metrics_config:
+            return
+        path = metrics_config.get('path', f"results/{self.config['name']}_metrics.npz")
+        if not path.endswith('.npz') and not ARROW_AVAILABLE:
+            self.log.emit('metrics_fallback', 'WARNING', requested=path, reason="pyarrow is not installed")
+            path = os.path.splitext(path)[0] + '.npz'
+        files = self.metrics.save(path, self.sink)
+        self.log.emit('metrics_saved', files=files, sampling=self.metrics.sampling,
+                      step_rows=len(self.metrics.steps), run_rows=self.metrics.num_runs)
+
     def _print_results(self):
-        """Prints final stats and calls visualization functions."""
-        print("\n--- Simulation Finished ---")
-        print(f"Experiment: {self.config['name']}")
-        print(f"Total Steps: {self.config['total_steps']}")
-        print(f"Total Reward (F): {self.total_rewards[self.agent_f.name]}")
-        print(f"Total Reward (M): {self.total_rewards[self.agent_m.name]}")
-        print(f"Total Terminal States: {int(self.terminal_states_reached)}")
-        if self.steps_per_run:
-            print(f"Avg steps per run: {sum(self.steps_per_run) / len(self.steps_per_run):.2f}")
-        if self.all_manhattan_distances:
-            avg_dist = sum(self.all_manhattan_distances) / len(self.all_manhattan_distances)
-            print(f"Average Manhattan Distance: {avg_dist:.2f}")
-        print(f"Q-Table size (F): {len(self.controller_f.q_table)} states")
-        print(f"Q-Table size (M): {len(self.controller_m.q_table)} states")
-
-        # --- Call Visualizations ---
-        Visualization.plot_performance(
+        """Logs the final stats (one run_summary event) and calls visualization functions."""
+        summary = self.summary()
+        # name is the event's "experiment" field; the per-run curves are in the metrics tables
+        for key in ('name', 'steps_per_run', 'rewards_per_run', 'distance_per_run', 'regret_per_run'):
+            summary.pop(key, None)
+        self.log.emit('run_summary', **summary)
+        self._save_metrics()
+        if self.instrumentation is not None:
+            files = self.instrumentation.save(summary['instrumentation'], self.sink)
+            self.log.emit('instrumentation_saved', files=files, profiler=self.instrumentation.profiler)
+
+        # --- Figures (drawn by the PlotRenderer, in the background if it has workers) ---
+        # "plots": False skips them; matplotlib is then never imported
+        if self.config.get('plots', True):
+            self._draw_figures()
+        
+        # The sample has its own stream, so it never shifts the controllers' draws
+        if self.log.enabled('DEBUG'):
+            states, values = sparse_q_arrays(self.controller_f.q_table)
+            sample = RandomStream(self.seed, len(self.controllers)).sample(range(len(states)), min(5, len(states)))
+            self.log.emit('q_table_sample', 'DEBUG', agent=self.agent_f.name, q_table_size=len(states),
+                          states=[{'state': [x, y, bool(b), *rest], 'q_values': dict(zip(ACTIONS, values[i].tolist()))}
+                                  for i in sample for x, y, b, *rest in [states[i].tolist()]])
+
+    def _draw_figures(self):
+        """Hands the performance and path figures to the PlotRenderer."""
+        from plot_renderer import PlotRenderer # pulls in the plotting code only when figures are wanted
+        renderer = self.renderer if self.renderer is not None else PlotRenderer(workers=0)
+        renderer.plot_performance(
             self.steps_per_run, 
             getattr(self, 'first_policy_switch_run', -1), 
-            self.config['name']
+            self.config['name'],
+            self.log
         )
         
-        if self.config.get("visualize_paths", False):
-            print("\nGenerating final path visualizations...")
-            other_agent_start_pos = (AGENT_M_START['x'], AGENT_M_START['y'])
-            
-            Visualization.plot_attractive_paths(
-                self.controller_f.q_table, 
-                agent_has_block=False, 
-                other_agent_pos=other_agent_start_pos,
-                title=f"{self.config['name']}\nAgent F Paths (NO Block)"
-            )
-            Visualization.plot_attractive_paths(
-                self.controller_f.q_table, 
-                agent_has_block=True, 
-                other_agent_pos=other_agent_start_pos,
-                title=f"{self.config['name']}\nAgent F Paths (WITH Block)"
-            )
-        else:
-            print("\nSkipping path visualization for this run.")
-        
-        Visualization.print_q_table_sample(self.controller_f.q_table, num_states=5)
\ No newline at end of file
+        # visualize_paths: True = one figure per has_block value with the other agent at its start cell,
+        # "panels" = one multi-panel figure per has_block value covering every other-agent position
+        visualize_paths = self.config.get("visualize_paths", False)
+        if visualize_paths and (self.num_agents != 2 or self.state_encoding != 'joint'):
+            # The path figures index the table by (x, y, has_block, other_x, other_y)
+            self.log.emit('paths_skipped', 'WARNING', reason="path figures need 2 agents with the joint state",
+                          agents=self.num_agents, state_encoding=self.state_encoding)
+        elif visualize_paths:
+            other_agent_start_pos = (self.agent_starts[1]['x'], self.agent_starts[1]['y'])
+            for has_block, label in [(False, "NO Block"), (True, "WITH Block")]:
+                title = f"{self.config['name']}\nAgent {self.agent_f.name} Paths ({label})"
+                if visualize_paths == 'panels':
+                    renderer.plot_path_panels(self.controller_f.q_table, has_block, title, self.world_spec, self.log)
+                else:
+                    renderer.plot_paths(self.controller_f.q_table, has_block, other_agent_start_pos,
+                                        title, self.world_spec, self.log)
+        if self.renderer is None:
+            renderer.close()
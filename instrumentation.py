@@ -0,0 +1,229 @@
+# this is discover-paths-rl/instrumentation.py
+# this file contains the opt-in instrumentation of one experiment's training loop:
+# per-phase timers, Q-table growth and invalid-action counters, and an optional
+# cProfile or sampling profiler scoped to that experiment
+
+import os
+import sys
+import time
+import threading
+from collections import Counter
+from results_sink import write_data, write_json
+
+PROFILERS = ('cprofile', 'sampling')
+
+# Timed phases, in report order ("other" is the loop's own time outside them)
+PHASES = ('action_selection', 'get_possible_actions', 'apply_action', 'td_update', 'replay', 'stats_reset')
+
+class SamplingProfiler:
+    """
+    Samples the training thread's stack every `interval` seconds from a background thread.
+    Counts each sampled function once as the leaf ("self") and once per sample in "total".
+    """
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = 0
+        self.self_counts = Counter()
+        self.total_counts = Counter()
+        self._thread_id = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread_id = threading.get_ident()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is None:
+                continue
+            self.samples += 1
+            self.self_counts[_frame_name(frame)] += 1
+            seen = set()
+            while frame is not None:
+                name = _frame_name(frame)
+                if name not in seen:
+                    seen.add(name)
+                    self.total_counts[name] += 1
+                frame = frame.f_back
+
+    def report(self, top=25):
+        def rows(counts):
+            return [{'function': name, 'samples': n, 'share': n / self.samples} for name, n in counts.most_common(top)]
+        return {'samples': self.samples, 'interval': self.interval,
+                'self': rows(self.self_counts), 'total': rows(self.total_counts)}
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_firstlineno}({code.co_name})"
+
+class Instrumentation:
+    """
+    Instrumentation of one ExperimentRunner, from its "instrumentation" config:
+      {"timers": True, "profiler": None | "cprofile" | "sampling", "sample_interval": 0.005,
+       "top": 25, "path": "results/<name>_instrumentation.json"}
+    ("instrumentation": True uses these defaults). The timers wrap the loop's calls on the
+    world, controllers, learner, metrics and replay for the duration of training only, so a
+    runner without instrumentation runs the loop exactly as before. Times are exclusive:
+    a call's own time, without the timed calls it makes.
+    """
+    def __init__(self, config, name):
+        config = config if isinstance(config, dict) else {}
+        self.timers = config.get('timers', True)
+        self.profiler = config.get('profiler')
+        if self.profiler is not None and self.profiler not in PROFILERS:
+            raise ValueError(f"Unknown profiler: {self.profiler} (expected one of {PROFILERS})")
+        self.sample_interval = config.get('sample_interval', 0.005)
+        self.top = config.get('top', 25)
+        self.path = config.get('path', f"results/{name}_instrumentation.json")
+        self.seconds = dict.fromkeys(PHASES, 0.0)
+        self.calls = dict.fromkeys(PHASES, 0)
+        self.turns = 0
+        self.trapped_turns = 0 # the acting agent had no possible action
+        self.invalid_actions = 0 # actions the world rejected (-10: blocked move, failed pickup / dropoff)
+        self.q_table_sizes = [] # Q-table states (summed over distinct tables) after each run
+        self.loop_seconds = 0.0
+        self._stack = [] # child time of the timed calls in progress
+        self._patched = [] # (object, attribute) of the instance wrappers to remove
+        self._runner = None
+        self._profile = None
+        self._start = None
+
+    @classmethod
+    def from_config(cls, config, name):
+        """An Instrumentation for the config's "instrumentation" entry, or None if it's missing / false."""
+        return cls(config, name) if config else None
+
+    def _timed(self, phase, fn, on_result=None):
+        seconds, calls, stack = self.seconds, self.calls, self._stack
+        perf_counter = time.perf_counter
+        def wrapper(*args, **kwargs):
+            stack.append(0.0)
+            start = perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+            finally:
+                elapsed = perf_counter() - start
+                child = stack.pop()
+                seconds[phase] += elapsed - child
+                calls[phase] += 1
+                if stack:
+                    stack[-1] += elapsed
+            if on_result is not None:
+                on_result(result)
+            return result
+        return wrapper
+
+    def _wrap(self, obj, attribute, phase, on_result=None):
+        setattr(obj, attribute, self._timed(phase, getattr(obj, attribute), on_result))
+        self._patched.append((obj, attribute))
+
+    def _on_act(self, result):
+        self.turns += 1
+        if result[1] is None:
+            self.trapped_turns += 1
+
+    def _on_apply(self, reward):
+        if reward == -10:
+            self.invalid_actions += 1
+
+    def _on_finish_run(self, _):
+        tables = {id(c.q_table): c.q_table for c in self._runner.controllers}
+        self.q_table_sizes.append(sum(len(t) for t in tables.values()))
+
+    def attach(self, runner, learner=None):
+        """Wraps the runner's hot-path calls (learner None: the numba kernel, so only the total is timed)."""
+        self._runner = runner
+        if not self.timers or learner is None:
+            return
+        self._wrap(runner.world, 'apply_action', 'apply_action', self._on_apply)
+        self._wrap(runner.world, 'get_possible_actions', 'get_possible_actions')
+        self._wrap(learner, 'act', 'action_selection', self._on_act)
+        for controller in runner.controllers: # on-policy learners choose the next action in learn
+            self._wrap(controller, 'choose_action', 'action_selection')
+        self._wrap(learner, 'learn', 'td_update')
+        self._wrap(runner, 'finish_run', 'stats_reset', self._on_finish_run)
+        self._wrap(runner.metrics, 'add_distance', 'stats_reset')
+        self._wrap(runner.metrics, 'record_step', 'stats_reset')
+        if runner.replay is not None:
+            self._wrap(runner.replay, 'record', 'replay')
+
+    def detach(self):
+        """Removes the wrappers (the instance attributes), restoring the class methods."""
+        for obj, attribute in reversed(self._patched):
+            delattr(obj, attribute)
+        self._patched.clear()
+
+    def start(self):
+        if self.profiler == 'cprofile':
+            import cProfile
+            self._profile = cProfile.Profile()
+        elif self.profiler == 'sampling':
+            self._profile = SamplingProfiler(self.sample_interval)
+        self._start = time.perf_counter()
+        if self.profiler == 'cprofile':
+            self._profile.enable()
+        elif self.profiler == 'sampling':
+            self._profile.start()
+
+    def stop(self):
+        if self.profiler == 'cprofile':
+            self._profile.disable()
+        elif self.profiler == 'sampling':
+            self._profile.stop()
+        self.loop_seconds = time.perf_counter() - self._start
+        self.detach()
+
+    def summary(self, steps):
+        """The run_summary entry: per-phase seconds, shares and calls, rates and Q-table growth."""
+        timed = sum(self.seconds.values())
+        phases = {}
+        if self.timers and self.calls['action_selection']:
+            for phase in PHASES:
+                phases[phase] = {'seconds': round(self.seconds[phase], 6), 'calls': self.calls[phase],
+                                 'share': self.seconds[phase] / self.loop_seconds if self.loop_seconds else 0.0}
+            other = max(self.loop_seconds - timed, 0.0)
+            phases['other'] = {'seconds': round(other, 6), 'calls': 0,
+                               'share': other / self.loop_seconds if self.loop_seconds else 0.0}
+        sizes = self.q_table_sizes
+        return {
+            'loop_seconds': round(self.loop_seconds, 6),
+            'steps_per_second': steps / self.loop_seconds if self.loop_seconds else None,
+            'phases': phases,
+            'turns': self.turns,
+            'trapped_turns': self.trapped_turns,
+            'invalid_actions': self.invalid_actions,
+            'invalid_action_rate': self.invalid_actions / self.turns if self.turns else None,
+            'q_table_states': sizes[-1] if sizes else None,
+            'q_table_states_per_1k_steps': 1000 * sizes[-1] / steps if sizes and steps else None,
+        }
+
+    def save(self, summary, sink=None):
+        """
+        Writes the summary, the per-run Q-table sizes and the profile to `path` (JSON, through the
+        ResultsSink if given); returns the files.
+        """
+        report = {**summary, 'q_table_states_per_run': self.q_table_sizes}
+        files = [self.path]
+        if self.profiler == 'cprofile':
+            import marshal
+            import pstats
+            stats = pstats.Stats(self._profile)
+            profile_path = os.path.splitext(self.path)[0] + '.prof'
+            write_data(profile_path, marshal.dumps(stats.stats), sink) # dump_stats' format (snakeviz / pstats)
+            files.append(profile_path)
+            rows = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:self.top]
+            report['profile'] = [{'function': f"{os.path.basename(f)}:{line}({fn})", 'calls': nc,
+                                  'self_seconds': tt, 'cumulative_seconds': ct}
+                                 for (f, line, fn), (cc, nc, tt, ct, _) in rows]
+        elif self.profiler == 'sampling':
+            report['profile'] = self._profile.report(self.top)
+        write_json(self.path, report, sink, indent=1)
+        return files
@@ -3,16 +3,57 @@
 # It defines various experiment configurations and executes them.
 
 import os
-import sys
+import argparse
 import datetime
 import random
-from logger import Logger
+import traceback
+from event_log import EventLog, LEVELS
+from results_sink import ResultsSink
 from experiment import ExperimentRunner
 
-def main():
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run the PD-World experiment suite.")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Number of worker processes (1 = run serially in this process).")
+    parser.add_argument('--seed', type=int, default=None,
+                        help="Root seed used to derive each experiment's seed.")
+    parser.add_argument('--log-level', default='INFO', choices=list(LEVELS),
+                        help="Lowest event level written to the log (DEBUG adds one event per terminal state).")
+    parser.add_argument('--plot-workers', type=int, default=1,
+                        help="Background processes drawing figures while training continues (0 = draw inline).")
+    parser.add_argument('--no-plots', action='store_true',
+                        help="Skip all figures (matplotlib is never imported).")
+    parser.add_argument('--replicates', type=int, default=0,
+                        help="Run every experiment across this many seeds (derived from --seed) and plot mean/quantile bands.")
+    parser.add_argument('--config', action='append', default=[], metavar='FILE',
+                        help="Load experiments from a .json/.toml/.yaml file instead of the built-in list (repeatable).")
+    parser.add_argument('--only', action='append', default=[], metavar='GLOB',
+                        help="Run only experiments whose name matches this glob (repeatable).")
+    parser.add_argument('--exclude', action='append', default=[], metavar='GLOB',
+                        help="Skip experiments whose name matches this glob (repeatable).")
+    parser.add_argument('--full-budget', action='store_true',
+                        help="Train every experiment for its whole total_steps: no early stop or dp_baseline epsilon "
+                             "stop, and convergence is only recorded.")
+    parser.add_argument('--sync-writes', action='store_true',
+                        help="Write logs, metrics and checkpoints in the experiment thread instead of a background writer.")
+    parser.add_argument('--list', action='store_true',
+                        help="Validate and print the selected experiment names, then exit.")
+    return parser.parse_args(argv)
+
+def full_budget(config):
+    """The config without its stopping rules: no early stop or near-optimal stop, convergence only recorded."""
+    config = {k: v for k, v in config.items() if k != 'early_stop'}
+    if config.get('convergence'):
+        config['convergence'] = {**config['convergence'], "stop": False}
+    if isinstance(config.get('dp_baseline'), dict) and 'epsilon' in config['dp_baseline']:
+        config['dp_baseline'] = {k: v for k, v in config['dp_baseline'].items() if k != 'epsilon'}
+    return config
+
+def main(args, event_log, sink=None):
     """
     Defines all experiment configurations and runs them.
-    You can comment/uncomment experiments to run them selectively.
+    --config loads them from experiment files instead; --only / --exclude select them by name.
+    sink is the ResultsSink that writes the experiments' files in the background (None: write them inline).
     """
     
     # --- Base Parameters ---
@@ -91,6 +132,7 @@ def main():
         "learning_rate": default_lr,
         "discount_factor": discount_factor,
         "policy_schedule": [(500, 'PRANDOM'), (total_steps - 500, 'PEXPLOIT')],
+        "world_change": {"after_terminal_states": 3, "pickup_locs": {(1, 2): 5, (4, 4): 5}},
         "visualize_paths": False 
     }
 
@@ -106,44 +148,111 @@ def main():
         exp_4,
         
         # --- Run 2 ---
-        {**exp_1a, "name": "Exp_1a_PRANDOM_Run2", "visualize_paths": True},
-        {**exp_1b, "name": "Exp_1b_PGREEDY_Run2", "visualize_paths": True},
-        {**exp_1c, "name": "Exp_1c_PEXPLOIT_Run2", "visualize_paths": True},
-        {**exp_2, "name": "Exp_2_SARSA_Run2", "visualize_paths": True},
-        {**exp_3_low_lr, "name": "Exp_3_PEXPLOIT_LR_015_Run2", "visualize_paths": True},
-        {**exp_3_high_lr, "name": "Exp_3_PEXPLOIT_LR_045_Run2", "visualize_paths": True},
-        {**exp_4, "name": "Exp_4_Adaptability_Run2", "visualize_paths": True},
+        {**exp_1a, "name": "Exp_1a_PRANDOM_Run2", "visualize_paths": True, "repeat_of": exp_1a["name"]},
+        {**exp_1b, "name": "Exp_1b_PGREEDY_Run2", "visualize_paths": True, "repeat_of": exp_1b["name"]},
+        {**exp_1c, "name": "Exp_1c_PEXPLOIT_Run2", "visualize_paths": True, "repeat_of": exp_1c["name"]},
+        {**exp_2, "name": "Exp_2_SARSA_Run2", "visualize_paths": True, "repeat_of": exp_2["name"]},
+        {**exp_3_low_lr, "name": "Exp_3_PEXPLOIT_LR_015_Run2", "visualize_paths": True, "repeat_of": exp_3_low_lr["name"]},
+        {**exp_3_high_lr, "name": "Exp_3_PEXPLOIT_LR_045_Run2", "visualize_paths": True, "repeat_of": exp_3_high_lr["name"]},
+        {**exp_4, "name": "Exp_4_Adaptability_Run2", "visualize_paths": True, "repeat_of": exp_4["name"]},
     ]
     
   
 
-    for config in experiments_to_run:
-        random.seed(random.randint(0, 100000)) 
-        runner = ExperimentRunner(config)
-        runner.run()
+    if args.config:
+        # Experiment files are read lazily: configs are validated and handed on one at a time
+        from config_loader import iter_configs
+        experiments_to_run = iter_configs(args.config, args.only, args.exclude)
+    elif args.only or args.exclude:
+        from config_loader import name_selected
+        experiments_to_run = [c for c in experiments_to_run if name_selected(c['name'], args.only, args.exclude)]
+
+    if args.list:
+        for config in experiments_to_run:
+            print(config['name'])
+        return
+
+    if args.no_plots:
+        experiments_to_run = ({**config, "plots": False} for config in experiments_to_run)
+
+    if args.full_budget: # reproduces fixed-budget results; the summaries still say where convergence was reached
+        experiments_to_run = (full_budget(config) for config in experiments_to_run)
+
+    if args.replicates:
+        from replicate import replicate_experiment
+        # Replicates replace the hand-written "Run2" copies (marked with repeat_of)
+        renderer = None
+        if not args.no_plots:
+            from plot_renderer import PlotRenderer
+            renderer = PlotRenderer(workers=args.plot_workers, cache_file=os.path.join('results', '.plot_cache.json'))
+        try:
+            for config in experiments_to_run:
+                if config.get('repeat_of'):
+                    continue
+                bands, summaries = replicate_experiment(config, args.replicates, root_seed=args.seed,
+                                                        workers=args.workers, log=event_log,
+                                                        renderer=renderer, log_level=args.log_level)
+                steps = bands['steps_per_run']
+                final_mean = steps['mean'][-1] if len(steps['mean']) else float('nan')
+                print(f"Finished {config['name']} x {args.replicates} seeds: "
+                      f"{sum('error' in s for s in summaries)} failed, mean steps of the last run reached {final_mean:.1f}")
+        finally:
+            if renderer is not None:
+                renderer.close()
+        return
+
+    if args.workers > 1:
+        from scheduler import run_experiments
+        # Each job gets its own seed and log file; results arrive as jobs finish
+        for result in run_experiments(experiments_to_run, max_workers=args.workers, root_seed=args.seed,
+                                      log_level=args.log_level):
+            if 'error' in result:
+                event_log.emit('job_failed', 'ERROR', experiment=result['name'], error=result['error'])
+                print(f"Experiment {result['name']} FAILED: {result['error']}")
+            else:
+                event_log.emit('job_finished', experiment=result['name'], seed=result['seed'],
+                               elapsed_seconds=result['elapsed_seconds'],
+                               terminal_states=result['terminal_states'], log_file=result['log_file'])
+                print(f"Finished {result['name']} (seed {result['seed']}) in {result['elapsed_seconds']:.1f}s: "
+                      f"{result['terminal_states']} terminal states, log in '{result['log_file']}'")
+        return
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    # Figures unchanged since the last session (same Q-table hash) are not redrawn
+    renderer = None
+    if not args.no_plots:
+        from plot_renderer import PlotRenderer
+        renderer = PlotRenderer(workers=args.plot_workers, cache_file=os.path.join('results', '.plot_cache.json'))
+    try:
+        for config in experiments_to_run:
+            random.seed(random.randint(0, 100000)) 
+            runner = ExperimentRunner(config, event_log=event_log, renderer=renderer, sink=sink)
+            runner.run()
+            print(f"Finished {config['name']}: {int(runner.terminal_states_reached)} terminal states")
+    finally:
+        if renderer is not None:
+            renderer.close()
 
 if __name__ == "__main__":
+    args = parse_args()
     os.makedirs('results', exist_ok=True)
     
     timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-    log_filename = os.path.join('results', f"simulation_log_{timestamp}.txt")
-    
-    # Store the original stdout
-    original_stdout = sys.stdout
+    log_filename = os.path.join('results', f"simulation_log_{timestamp}.jsonl")
     
-    logger = Logger(log_filename)
-    sys.stdout = logger
-    sys.stderr = logger
-    
-    try:
-        main()
-    except Exception as e:
-        print("\n" + "="*50)
-        print(f"AN ERROR OCCURRED: {e}")
-        import traceback
-        traceback.print_exc()
-        print("="*50)
-    finally:
-        sys.stdout = original_stdout
-        logger.close()
-        print(f"\nAll simulation output saved to '{log_filename}'")
\ No newline at end of file
+    # Structured event log (JSON Lines); stdout/stderr are left alone. Log batches, metrics and
+    # checkpoints are written by a background thread; leaving the block waits for all of them
+    sink = None if args.sync_writes else ResultsSink()
+    with EventLog(log_filename, level=args.log_level, sink=sink) as event_log:
+        try:
+            main(args, event_log, sink)
+        except Exception as e:
+            event_log.emit('error', 'ERROR', error=repr(e), traceback=traceback.format_exc())
+            print("\n" + "="*50)
+            print(f"AN ERROR OCCURRED: {e}")
+            traceback.print_exc()
+            print("="*50)
+    if sink is not None:
+        sink.close() # flush barrier: every queued result file is in place
+    print(f"\nAll simulation events saved to '{log_filename}'")
@@ -0,0 +1,210 @@
+# this is discover-paths-rl/metrics.py
+# this file contains the MetricsRecorder class, which keeps per-step and
+# per-run statistics in chunked NumPy tables and saves them as NPZ/Parquet/Arrow
+
+import os
+import numpy as np
+from results_sink import atomic_write, write_npz
+
+try:
+    import pyarrow # optional, only needed for Parquet / Arrow output
+    ARROW_AVAILABLE = True
+except ImportError:
+    ARROW_AVAILABLE = False
+
+CHUNK_SIZE = 65536
+
+# One row per sampled step (positions and carried blocks after the action)
+STEP_DTYPE = np.dtype([
+    ('step', np.int64), ('agent', np.int8), ('reward', np.int16),
+    ('f_x', np.int16), ('f_y', np.int16), ('f_has_block', np.bool_),
+    ('m_x', np.int16), ('m_y', np.int16), ('m_has_block', np.bool_),
+    ('td_error', np.float64),
+])
+
+# One row per terminal state
+RUN_DTYPE = np.dtype([
+    ('run', np.int64), ('end_step', np.int64), ('steps', np.int64),
+    ('f_reward', np.int64), ('m_reward', np.int64), ('reward', np.int64), ('mean_distance', np.float64),
+])
+
+SAMPLING_MODES = ('step', 'every_k', 'run')
+FORMATS = {'.npz': 'npz', '.parquet': 'parquet', '.arrow': 'arrow', '.feather': 'arrow'}
+
+class ChunkedTable:
+    """
+    Append-only table of structured rows stored in fixed-size NumPy chunks,
+    so growing it never copies what is already recorded. to_array() concatenates
+    the chunks once and keeps the (read-only) result until the next append.
+    """
+    def __init__(self, dtype, chunk_size=CHUNK_SIZE):
+        self.dtype = np.dtype(dtype)
+        self.chunk_size = chunk_size
+        self._chunks = [] # full chunks
+        self._current = np.empty(chunk_size, dtype=self.dtype)
+        self._n = 0 # rows used in _current
+        self._array = None # to_array() since the last append
+
+    def append(self, row):
+        """Appends one row given as a tuple in dtype field order."""
+        self._array = None
+        if self._n == self.chunk_size:
+            self._chunks.append(self._current)
+            self._current = np.empty(self.chunk_size, dtype=self.dtype)
+            self._n = 0
+        self._current[self._n] = row
+        self._n += 1
+
+    def extend(self, rows):
+        """Appends a structured array of rows."""
+        rows = np.asarray(rows, dtype=self.dtype)
+        self._array = None
+        start = 0
+        while start < len(rows):
+            if self._n == self.chunk_size:
+                self._chunks.append(self._current)
+                self._current = np.empty(self.chunk_size, dtype=self.dtype)
+                self._n = 0
+            take = min(self.chunk_size - self._n, len(rows) - start)
+            self._current[self._n:self._n + take] = rows[start:start + take]
+            self._n += take
+            start += take
+
+    def __len__(self):
+        return len(self._chunks) * self.chunk_size + self._n
+
+    def to_array(self):
+        """Returns all rows as one structured array (read-only, shared until the next append)."""
+        if self._array is None:
+            self._array = np.concatenate(self._chunks + [self._current[:self._n]])
+            self._array.flags.writeable = False
+        return self._array
+
+    def column(self, name):
+        return self.to_array()[name]
+
+class MetricsRecorder:
+    """
+    Records the stats of one experiment:
+      * runs: one row per terminal state (always recorded)
+      * steps: sampled per-step rows, depending on `sampling`:
+          'step'    - every step
+          'every_k' - every `every` steps
+          'run'     - no per-step rows, only the run table
+      * the running Manhattan distance total (sampled after M's move, as before)
+    """
+    def __init__(self, sampling='run', every=1, chunk_size=CHUNK_SIZE):
+        if sampling not in SAMPLING_MODES:
+            raise ValueError(f"Unknown metrics sampling: {sampling} (expected one of {SAMPLING_MODES})")
+        if sampling == 'every_k' and every < 1:
+            raise ValueError(f"metrics 'every' must be >= 1, got {every}")
+        self.sampling = sampling
+        # Record a step row when step % step_interval == 0 (0 = never)
+        self.step_interval = {'step': 1, 'every_k': every, 'run': 0}[sampling]
+        self.steps = ChunkedTable(STEP_DTYPE, chunk_size)
+        self.runs = ChunkedTable(RUN_DTYPE, min(chunk_size, 4096))
+        self.distance_sum = 0
+        self.distance_count = 0
+        self._last_totals = () # cumulative rewards per agent at the end of the previous run
+        self._last_distance = (0, 0) # distance_sum, distance_count at the end of the previous run
+
+    @classmethod
+    def from_config(cls, metrics_config):
+        """Builds a recorder from an experiment's "metrics" dict (None = per-run only)."""
+        metrics_config = metrics_config or {}
+        return cls(metrics_config.get('sampling', 'run'), metrics_config.get('every', 1))
+
+    @property
+    def num_runs(self):
+        return len(self.runs)
+
+    def record_step(self, step, agent_turn, reward, agent_f, agent_m, td_error):
+        """Records one step row (call only when step % step_interval == 0)."""
+        self.steps.append((step, agent_turn, reward, agent_f.x, agent_f.y, agent_f.has_block,
+                           agent_m.x, agent_m.y, agent_m.has_block, td_error))
+
+    def add_distance(self, distance):
+        self.distance_sum += distance
+        self.distance_count += 1
+
+    def record_run(self, end_step, steps, reward_totals):
+        """
+        Records a finished run. reward_totals are the agents' cumulative rewards (in agent order);
+        the row stores this run's share for F, M and all agents together, and the mean Manhattan
+        distance over the distance samples taken during the run.
+        """
+        last = self._last_totals
+        shares = [total - (last[i] if i < len(last) else 0) for i, total in enumerate(reward_totals)]
+        last_sum, last_count = self._last_distance
+        count = self.distance_count - last_count
+        mean_distance = (self.distance_sum - last_sum) / count if count else np.nan
+        self.runs.append((len(self.runs), end_step, steps, shares[0], shares[1], sum(shares), mean_distance))
+        self._last_totals = tuple(reward_totals)
+        self._last_distance = (self.distance_sum, self.distance_count)
+
+    def state(self):
+        """The running totals a resumed recorder continues from (the run table is saved separately)."""
+        return {'distance_sum': self.distance_sum, 'distance_count': self.distance_count,
+                'last_totals': list(self._last_totals), 'last_distance': list(self._last_distance)}
+
+    def load_state(self, state, runs):
+        """Continues from a state() and the run table recorded so far (sampled step rows start empty)."""
+        self.runs.extend(runs)
+        self.distance_sum = state['distance_sum']
+        self.distance_count = state['distance_count']
+        self._last_totals = tuple(state['last_totals'])
+        self._last_distance = tuple(state['last_distance'])
+
+    def mean_distance(self):
+        return self.distance_sum / self.distance_count if self.distance_count else None
+
+    def tables(self):
+        """{'steps': structured array, 'runs': structured array}"""
+        return {'steps': self.steps.to_array(), 'runs': self.runs.to_array()}
+
+    def save(self, path, sink=None):
+        """
+        Saves both tables. The format follows the extension:
+          .npz               - one compressed file with steps/<column> and runs/<column> arrays
+          .parquet / .arrow  - <name>_steps.<ext> and <name>_runs.<ext> (needs pyarrow)
+        Files are written atomically, in the background if a ResultsSink is given.
+        Returns the list of files written.
+        """
+        stem, ext = os.path.splitext(path)
+        fmt = FORMATS.get(ext.lower())
+        if fmt is None:
+            raise ValueError(f"Unknown metrics format '{ext}' (expected one of {sorted(FORMATS)})")
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tables = self.tables()
+
+        if fmt == 'npz':
+            arrays = {f"{table}/{name}": rows[name] for table, rows in tables.items() for name in rows.dtype.names}
+            return [write_npz(path, arrays, sink)]
+
+        if not ARROW_AVAILABLE:
+            raise ImportError(f"Saving metrics as {fmt} requires pyarrow")
+        import pyarrow.parquet
+        import pyarrow.feather
+        files = []
+        for table, rows in tables.items():
+            arrow_table = pyarrow.table({name: rows[name] for name in rows.dtype.names})
+            filename = f"{stem}_{table}{ext}"
+            if fmt == 'parquet':
+                write = lambda tmp_path, t=arrow_table: pyarrow.parquet.write_table(t, tmp_path)
+            else:
+                write = lambda tmp_path, t=arrow_table: pyarrow.feather.write_feather(t, tmp_path)
+            if sink is not None:
+                sink.submit(filename, write, rows.nbytes)
+            else:
+                atomic_write(filename, write)
+            files.append(filename)
+        return files
+
+def load_metrics(path):
+    """Loads an .npz saved by MetricsRecorder.save into {'steps': {column: array}, 'runs': {...}}."""
+    tables = {'steps': {}, 'runs': {}}
+    with np.load(path) as data:
+        for key in data.files:
+            table, name = key.split('/', 1)
+            tables[table][name] = data[key]
+    return tables
@@ -0,0 +1,99 @@
+# this is discover-paths-rl/multi_agent.py
+# this file contains the N-agent options: turn orders, state encodings
+# and the view of the other agents each controller builds its state from
+
+TURN_ORDERS = ('round_robin', 'random', 'simultaneous')
+STATE_ENCODINGS = ('joint', 'nearest_k', 'occupancy')
+
+# The 8 cells around an agent, in the bit order of the occupancy encoding
+NEIGHBOUR_OFFSETS = [(-1, -1), (0, -1), (1, -1), (-1, 0), (1, 0), (-1, 1), (0, 1), (1, 1)]
+
+def parse_state_encoding(spec):
+    """
+    "joint" | "nearest_k" | "occupancy", or {"type": "nearest_k", "k": 2}.
+    Returns (encoding, k). Raises ValueError for unknown encodings.
+    """
+    if isinstance(spec, dict):
+        encoding, k = spec.get('type', 'joint'), spec.get('k', 1)
+    else:
+        encoding, k = spec, 1
+    if encoding not in STATE_ENCODINGS:
+        raise ValueError(f"Unknown state encoding: {encoding} (expected one of {STATE_ENCODINGS})")
+    if k < 1:
+        raise ValueError(f"nearest_k needs k >= 1, got {k}")
+    return encoding, k
+
+class AgentView:
+    """
+    Where the controllers see the other agents. Normally that is where they are; with
+    simultaneous turns, freeze() fixes the positions (and the world's visible occupancy)
+    at the start of a round, so every agent decides on the same snapshot. The world offers
+    and checks moves against that snapshot alike: a cell held at the start of the round stays
+    blocked for the whole round, and when two agents move into the same free cell the first
+    in agent order gets it and the other stays put (-1, see PDWorld.apply_action).
+    """
+    def __init__(self, agents, world):
+        self.agents = agents
+        self.world = world
+        self.frozen = None # [(x, y), ...] while frozen
+
+    def freeze(self):
+        self.frozen = [(a.x, a.y) for a in self.agents]
+        self.world.visible_occupied = set(self.frozen)
+
+    def positions(self):
+        return self.frozen if self.frozen is not None else [(a.x, a.y) for a in self.agents]
+
+    def occupied(self):
+        return self.world.visible_occupied
+
+def state_encoder(encoding, index, view, k=1):
+    """
+    Returns a function building agent `index`'s state tuple (x, y, has_block, ...):
+      joint     - every other agent's (x, y), in agent order (2 agents: the original 5-tuple)
+      nearest_k - the k nearest other agents' (x, y) by Manhattan distance (ties by agent order),
+                  padded with (-1, -1) when there are fewer than k others
+      occupancy - one bitmask of which of the 8 surrounding cells hold another agent
+                  (the table stays W*H*2*256 states however many agents there are)
+    """
+    agent = view.agents[index]
+    others = [j for j in range(len(view.agents)) if j != index]
+
+    if encoding == 'joint':
+        def encode():
+            positions = view.positions()
+            state = [agent.x, agent.y, agent.has_block]
+            for j in others:
+                state += positions[j]
+            return tuple(state)
+    elif encoding == 'nearest_k':
+        padding = [-1, -1] * max(0, k - len(others))
+        def encode():
+            positions = view.positions()
+            x, y = agent.x, agent.y
+            nearest = sorted(others, key=lambda j: (abs(positions[j][0] - x) + abs(positions[j][1] - y), j))[:k]
+            state = [x, y, agent.has_block]
+            for j in nearest:
+                state += positions[j]
+            return tuple(state + padding)
+    elif encoding == 'occupancy':
+        def encode():
+            occupied = view.occupied()
+            x, y = agent.x, agent.y
+            mask = 0
+            for bit, (dx, dy) in enumerate(NEIGHBOUR_OFFSETS):
+                if (x + dx, y + dy) in occupied:
+                    mask |= 1 << bit
+            return (x, y, agent.has_block, mask)
+    else:
+        raise ValueError(f"Unknown state encoding: {encoding}")
+    return encode
+
+def mean_pairwise_distance(agents):
+    """Mean Manhattan distance over all pairs of agents (the distance between them for 2 agents)."""
+    total = pairs = 0
+    for i, a in enumerate(agents):
+        for b in agents[i + 1:]:
+            total += abs(a.x - b.x) + abs(a.y - b.y)
+            pairs += 1
+    return total / pairs
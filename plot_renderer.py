@@ -0,0 +1,178 @@
+# this is discover-paths-rl/plot_renderer.py
+# this file computes the greedy path fields with NumPy and contains the PlotRenderer,
+# which draws figures in a background process and skips figures whose inputs haven't changed
+
+import os
+import json
+import hashlib
+import numpy as np
+from concurrent.futures import Future, wait
+from q_table import sparse_q_arrays
+
+# Arrow (u, v) per movement action, in ACTIONS order (North, South, East, West).
+# v is negated because the y axis is inverted in the plots (0 is at the top)
+ARROW_U = np.array([0, 0, 1, -1])
+ARROW_V = np.array([-1, 1, 0, 0])
+
+def greedy_fields(states, values, width, height, agent_has_block, other_positions, obstacles=()):
+    """
+    Computes the greedy movement arrows for every cell, for each other-agent position, in one pass.
+    states/values are the sparse Q-table arrays (see q_table.sparse_q_arrays).
+    Returns (u, v) arrays of shape (len(other_positions), height, width). As in the original
+    per-cell loop, ties go to the first action in N, S, E, W order and unvisited states
+    (all zeros) point North. Obstacle cells get no arrow.
+    """
+    panel_index = np.full((width, height), -1, dtype=np.int64)
+    for i, (ox, oy) in enumerate(other_positions):
+        panel_index[ox, oy] = i
+    q = np.zeros((len(other_positions), width, height, 4))
+    rows = states[:, 2] == int(agent_has_block)
+    panel = panel_index[states[rows, 3], states[rows, 4]]
+    keep = panel >= 0
+    q[panel[keep], states[rows, 0][keep], states[rows, 1][keep]] = values[rows][keep, :4]
+
+    best = q.argmax(axis=3).transpose(0, 2, 1) # (panels, height, width)
+    u, v = ARROW_U[best].astype(float), ARROW_V[best].astype(float)
+    for x, y in obstacles:
+        u[:, y, x] = v[:, y, x] = 0 # no arrow on an obstacle
+    return u, v
+
+def q_table_key(states, values, *params):
+    """Hash of the Q-table arrays plus the plot parameters, used to skip unchanged figures."""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(np.ascontiguousarray(states).tobytes())
+    digest.update(np.ascontiguousarray(values).tobytes())
+    digest.update(repr(params).encode())
+    return digest.hexdigest()
+
+def _render(kind, args):
+    """Worker entry point: draws one figure with matplotlib and returns its filename."""
+    from visualization import Visualization
+    if kind == 'performance':
+        return Visualization.plot_performance(*args)
+    if kind == 'paths':
+        return Visualization.draw_paths(*args)
+    if kind == 'path_panels':
+        return Visualization.draw_path_panels(*args)
+    raise ValueError(f"Unknown plot kind: {kind}")
+
+def _spec_for_worker(world_spec):
+    """The parts of a world spec the drawing code needs, in a picklable form."""
+    return {key: world_spec[key] for key in ('width', 'height', 'pickup_locs', 'dropoff_locs', 'obstacles')}
+
+class PlotRenderer:
+    """
+    Draws the experiment figures. With workers > 0 the figures are drawn in a background
+    process pool (matplotlib is only imported there) and training continues meanwhile;
+    with workers=0 they are drawn inline. At most max_pending figures wait in the pool; a new one
+    then waits for the oldest, which bounds the memory held by queued inputs. If cache_file is given,
+    a figure whose inputs hash to the same key as last time (and whose file still exists) is not drawn again.
+    Finished figures are reported as plot_saved / plot_skipped / plot_failed events.
+    """
+    def __init__(self, workers=1, cache_file=None, max_pending=16):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.cache_file = cache_file
+        self._executor = None
+        self._pending = [] # (future, log, fields, key)
+        self._cache = {}
+        if cache_file and os.path.exists(cache_file):
+            with open(cache_file, 'r', encoding='utf-8') as f:
+                self._cache = json.load(f)
+
+    def _skip(self, filename, key, log, **fields):
+        """True (and logs plot_skipped) if this exact figure was already drawn to filename."""
+        if self._cache.get(filename) == key and os.path.exists(filename):
+            log.emit('plot_skipped', reason="inputs unchanged", file=filename, **fields)
+            return True
+        return False
+
+    def _submit(self, kind, args, filename, key, log, **fields):
+        fields = {'kind': kind, 'file': filename, **fields}
+        if self.workers > 0:
+            if self._executor is None:
+                from concurrent.futures import ProcessPoolExecutor # only when figures are drawn in the background
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            if len(self._pending) >= self.max_pending: # backpressure: let the oldest figure finish first
+                wait([self._pending[0][0]])
+            future = self._executor.submit(_render, kind, args)
+        else:
+            future = Future()
+            try:
+                future.set_result(_render(kind, args))
+            except Exception as e:
+                future.set_exception(e)
+        self._pending.append((future, log, fields, key))
+        self.collect()
+
+    def collect(self, wait=False):
+        """Reports finished figures (all of them, waiting if needed, when wait=True)."""
+        pending = []
+        for future, log, fields, key in self._pending:
+            if not (wait or future.done()):
+                pending.append((future, log, fields, key))
+                continue
+            try:
+                future.result()
+            except Exception as e: # a broken figure shouldn't stop the experiments
+                log.emit('plot_failed', 'ERROR', error=repr(e), **fields)
+                continue
+            self._cache[fields['file']] = key
+            log.emit('plot_saved', **fields)
+        self._pending = pending
+        if self.cache_file:
+            os.makedirs(os.path.dirname(self.cache_file) or '.', exist_ok=True)
+            with open(self.cache_file, 'w', encoding='utf-8') as f:
+                json.dump(self._cache, f, indent=1)
+
+    def close(self):
+        """Waits for all figures, reports them and stops the worker processes."""
+        self.collect(wait=True)
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def plot_performance(self, steps_per_run, policy_switch_run, title, log, bands=None):
+        filename = os.path.join('results', f'{title}_performance_plot.png')
+        if bands is None:
+            key = q_table_key(np.asarray(steps_per_run), np.empty(0), policy_switch_run, title)
+        else:
+            key = q_table_key(np.asarray(steps_per_run), np.concatenate([bands['mean'], bands['quantiles'].ravel()]),
+                              policy_switch_run, title, bands['replicates'], list(bands['quantile_levels']))
+        if self._skip(filename, key, log, kind='performance'):
+            return
+        self._submit('performance', (list(steps_per_run), policy_switch_run, title, bands), filename, key, log)
+
+    def plot_paths(self, q_table, agent_has_block, other_agent_pos, title, world_spec, log):
+        """The greedy-path figure for one other-agent position (see Visualization.draw_paths)."""
+        states, values = sparse_q_arrays(q_table)
+        filename = os.path.join('results', f'{title}_path_plot.png')
+        key = q_table_key(states, values, agent_has_block, other_agent_pos, title, _spec_for_worker(world_spec))
+        if self._skip(filename, key, log, kind='paths', has_block=agent_has_block):
+            return
+        u, v = greedy_fields(states, values, world_spec['width'], world_spec['height'],
+                             agent_has_block, [other_agent_pos], world_spec['obstacles'])
+        self._submit('paths', (u[0], v[0], title, _spec_for_worker(world_spec)), filename, key, log,
+                     has_block=agent_has_block)
+
+    def plot_path_panels(self, q_table, agent_has_block, title, world_spec, log):
+        """One figure with a panel for every position the other agent can stand on."""
+        states, values = sparse_q_arrays(q_table)
+        filename = os.path.join('results', f'{title}_path_panels.png')
+        key = q_table_key(states, values, agent_has_block, title, _spec_for_worker(world_spec))
+        if self._skip(filename, key, log, kind='path_panels', has_block=agent_has_block):
+            return
+        other_positions = [(x, y) for y in range(world_spec['height']) for x in range(world_spec['width'])
+                           if (x, y) not in world_spec['obstacles']]
+        u, v = greedy_fields(states, values, world_spec['width'], world_spec['height'],
+                             agent_has_block, other_positions, world_spec['obstacles'])
+        for i, (ox, oy) in enumerate(other_positions):
+            u[i, oy, ox] = v[i, oy, ox] = 0 # the agent can't stand on the other agent's cell
+        self._submit('path_panels', (u, v, other_positions, title, _spec_for_worker(world_spec)),
+                     filename, key, log, has_block=agent_has_block)
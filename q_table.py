@@ -0,0 +1,73 @@
+# this is discover-paths-rl/q_table.py
+# this file contains the DenseQTable class, an opt-in array-backed
+# replacement for the dict-of-dicts Q-table used by RLAgentController
+
+import numpy as np
+from constants import GRID_WIDTH, GRID_HEIGHT, ACTIONS, ACTION_INDEX
+
+class DenseQTable:
+    """
+    Stores every Q-value in one float64 array of shape (W, H, 2, W, H, 6),
+    indexed by (x, y, has_block, other_x, other_y, action_index).
+    A parallel boolean array remembers which states have been visited, so the
+    dict form only contains the states the dict-backed table would have created.
+    """
+    def __init__(self, width=GRID_WIDTH, height=GRID_HEIGHT):
+        self.width = width
+        self.height = height
+        self.values = np.zeros((width, height, 2, width, height, len(ACTIONS)), dtype=np.float64)
+        self.visited = np.zeros((width, height, 2, width, height), dtype=bool)
+
+    @staticmethod
+    def index(state):
+        """Converts a state tuple into an array index (has_block must be an int, not a bool)."""
+        x, y, has_block, ox, oy = state
+        return (x, y, int(has_block), ox, oy)
+
+    def row(self, state):
+        """Returns the writable 6-entry view of Q-values for a state and marks it visited."""
+        idx = self.index(state)
+        self.visited[idx] = True
+        return self.values[idx]
+
+    def __len__(self):
+        """Number of visited states (matches len() of the dict form)."""
+        return int(self.visited.sum())
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes + self.visited.nbytes
+
+    def to_dict(self):
+        """Converts to the {state: {action: q_value}} form used by Visualization."""
+        q_table = {}
+        for x, y, b, ox, oy in zip(*np.nonzero(self.visited)):
+            row = self.values[x, y, b, ox, oy]
+            state = (int(x), int(y), bool(b), int(ox), int(oy))
+            q_table[state] = {action: float(row[i]) for i, action in enumerate(ACTIONS)}
+        return q_table
+
+    @classmethod
+    def from_dict(cls, q_table, width=GRID_WIDTH, height=GRID_HEIGHT):
+        """Builds a dense table from the dict form. Missing actions default to 0.0."""
+        dense = cls(width, height)
+        for state, actions in q_table.items():
+            row = dense.row(state)
+            for action, q_val in actions.items():
+                row[ACTION_INDEX[action]] = q_val
+        return dense
+
+def sparse_q_arrays(q_table):
+    """
+    Returns (states (n, state length) int32, values (n, 6) float64) for a dict or DenseQTable:
+    one row per visited state (in insertion / index order), actions in ACTIONS order.
+    States are (x, y, has_block, ...): 5 columns for the joint 2-agent state.
+    """
+    if isinstance(q_table, DenseQTable):
+        idx = np.nonzero(q_table.visited)
+        return np.stack(idx, axis=1).astype(np.int32), q_table.values[idx]
+    state_length = len(next(iter(q_table))) if q_table else 5
+    states = np.array([(x, y, int(b), *rest) for x, y, b, *rest in q_table], dtype=np.int32).reshape(-1, state_length)
+    values = np.array([[actions.get(a, 0.0) for a in ACTIONS] for actions in q_table.values()],
+                      dtype=np.float64).reshape(-1, len(ACTIONS))
+    return states, values
@@ -0,0 +1,148 @@
+# this is discover-paths-rl/replay.py
+# this file contains the experience replay buffer: a ring of past transitions in
+# preallocated NumPy arrays, replayed as vectorized TD updates on a DenseQTable
+
+import numpy as np
+from constants import ACTIONS, ACTION_INDEX
+
+STATE_SIZE = 5 # (x, y, has_block, other_x, other_y)
+
+class ReplayBuffer:
+    """
+    The last `capacity` transitions (s, a, r, s', valid actions in s', a') of one controller.
+    Sampling is uniform, or prioritized by |TD error|**alpha (new transitions get the highest
+    priority seen so far, so each is replayed at least about once).
+    """
+    def __init__(self, capacity, prioritized=False, alpha=0.6, beta=0.4, eps=1e-3):
+        if capacity < 1:
+            raise ValueError(f"Replay capacity must be at least 1, got {capacity}")
+        self.capacity = capacity
+        self.prioritized = prioritized
+        self.alpha = alpha
+        self.beta = beta
+        self.eps = eps
+        self.states = np.zeros((capacity, STATE_SIZE), dtype=np.int32)
+        self.actions = np.zeros(capacity, dtype=np.int8)
+        self.rewards = np.zeros(capacity, dtype=np.float64)
+        self.next_states = np.zeros((capacity, STATE_SIZE), dtype=np.int32)
+        self.next_masks = np.zeros((capacity, len(ACTIONS)), dtype=bool)
+        self.next_actions = np.zeros(capacity, dtype=np.int8) # -1 = no next action (SARSA only)
+        self.priorities = np.zeros(capacity, dtype=np.float64)
+        self.max_priority = 1.0
+        self.size = 0
+        self.pos = 0
+
+    def __len__(self):
+        return self.size
+
+    def add(self, state, action, reward, next_state, next_possible_actions, next_action=None):
+        """Stores one transition, overwriting the oldest once the buffer is full."""
+        i = self.pos
+        self.states[i] = state
+        self.actions[i] = ACTION_INDEX[action]
+        self.rewards[i] = reward
+        self.next_states[i] = next_state
+        mask = self.next_masks[i]
+        mask[:] = False
+        for a in next_possible_actions:
+            mask[ACTION_INDEX[a]] = True
+        self.next_actions[i] = ACTION_INDEX[next_action] if next_action else -1
+        self.priorities[i] = self.max_priority
+        self.pos = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def clear(self):
+        self.size = 0
+        self.pos = 0
+        self.max_priority = 1.0
+
+    def sample(self, batch_size, generator):
+        """
+        Returns (indices, importance weights) for a batch drawn with a NumPy Generator.
+        Uniform sampling gives weights of 1; prioritized sampling gives (N * P(i))**-beta / max.
+        """
+        if not self.prioritized:
+            return generator.integers(0, self.size, batch_size), np.ones(batch_size)
+        p = self.priorities[:self.size] ** self.alpha
+        p /= p.sum()
+        idx = generator.choice(self.size, batch_size, p=p)
+        weights = (self.size * p[idx]) ** -self.beta
+        return idx, weights / weights.max()
+
+    def update_priorities(self, idx, td_errors):
+        priorities = np.abs(td_errors) + self.eps
+        self.priorities[idx] = priorities
+        self.max_priority = max(self.max_priority, float(priorities.max()))
+
+def replay_batch(table, buffer, idx, weights, learning_rate, discount_factor, sarsa=False):
+    """
+    One batched TD update of a DenseQTable from buffer rows idx. Targets are computed from the
+    table before the batch (Q-learning: max over the valid actions in s'; SARSA: the stored a'),
+    and the updates are scattered with np.add.at, so repeated (s, a) pairs all apply.
+    Returns the TD errors.
+    """
+    values = table.values
+    s = tuple(buffer.states[idx].T)
+    a = buffer.actions[idx]
+    s2 = tuple(buffer.next_states[idx].T)
+    next_q = values[s2] # (batch, 6)
+    if sarsa:
+        a2 = buffer.next_actions[idx]
+        next_value = np.where(a2 >= 0, next_q[np.arange(len(idx)), np.maximum(a2, 0)], 0.0)
+    else:
+        mask = buffer.next_masks[idx]
+        next_value = np.where(mask.any(axis=1), np.where(mask, next_q, -np.inf).max(axis=1), 0.0)
+    td_errors = buffer.rewards[idx] + discount_factor * next_value - values[s + (a,)]
+    np.add.at(values, s + (a,), learning_rate * weights * td_errors)
+    return td_errors
+
+class Replay:
+    """
+    Replay for an experiment's controllers (one buffer each) from its "replay" config:
+      {"capacity": 10000, "batch_size": 32, "ratio": 1.0, "prioritized": False,
+       "alpha": 0.6, "beta": 0.4, "clear_on_world_change": False}
+    ratio is the number of replayed transitions per environment step: every time the steps
+    have earned batch_size of them, the acting controller's buffer replays one batch. Steps
+    only earn them once the buffer holds batch_size transitions.
+    """
+    def __init__(self, config, controllers, generator, sarsa=False):
+        self.batch_size = config.get('batch_size', 32)
+        self.ratio = config.get('ratio', 1.0)
+        if self.batch_size < 1 or self.ratio < 0:
+            raise ValueError(f"Invalid replay batch_size {self.batch_size} / ratio {self.ratio}")
+        self.clear_on_world_change = config.get('clear_on_world_change', False)
+        self.controllers = controllers
+        self.buffers = [ReplayBuffer(config.get('capacity', 10000), config.get('prioritized', False),
+                                     config.get('alpha', 0.6), config.get('beta', 0.4))
+                        for _ in controllers]
+        self.generator = generator
+        self.sarsa = sarsa
+        self.credit = [0.0] * len(controllers)
+        self.batches = 0
+
+    def record(self, agent_turn, state, action, reward, next_state, next_possible_actions, next_action=None):
+        """Stores the acting controller's transition and replays a batch when one is due."""
+        buffer = self.buffers[agent_turn]
+        buffer.add(state, action, reward, next_state, next_possible_actions, next_action)
+        if len(buffer) < self.batch_size: # no credit while a batch can't be drawn, so no burst once it can
+            return
+        self.credit[agent_turn] += self.ratio
+        while self.credit[agent_turn] >= self.batch_size:
+            self.credit[agent_turn] -= self.batch_size
+            self._replay(agent_turn)
+
+    def _replay(self, agent_turn):
+        controller, buffer = self.controllers[agent_turn], self.buffers[agent_turn]
+        idx, weights = buffer.sample(self.batch_size, self.generator)
+        td_errors = replay_batch(controller.q_table, buffer, idx, weights,
+                                 controller.learning_rate, controller.discount_factor, self.sarsa)
+        if buffer.prioritized:
+            buffer.update_priorities(idx, td_errors)
+        if controller.argmax_cache is not None: # the batch bypassed _set_q_value
+            controller.argmax_cache.clear()
+        self.batches += 1
+
+    def world_changed(self):
+        if self.clear_on_world_change:
+            for buffer in self.buffers:
+                buffer.clear()
@@ -0,0 +1,111 @@
+# this is discover-paths-rl/replicate.py
+# this file runs one experiment config across many seeds (in parallel through the
+# scheduler) and aggregates the per-run curves into mean / quantile bands with NumPy
+
+import os
+import random
+import warnings
+import numpy as np
+from scheduler import run_experiments
+from event_log import console_log
+
+REPLICATE_CURVES = ('steps_per_run', 'rewards_per_run', 'distance_per_run')
+DEFAULT_QUANTILES = (0.1, 0.5, 0.9)
+
+def replicate_seeds(num_seeds, root_seed=None):
+    """num_seeds distinct seeds derived from root_seed (the same root seed always gives the same seeds)."""
+    return random.Random(root_seed).sample(range(1, 2**31), num_seeds)
+
+def replicate_configs(config, seeds):
+    """One config per seed, named <name>_s<index>. Replicates never draw their own figures."""
+    return [{**config, 'name': f"{config['name']}_s{i:03d}", 'seed': seed, 'plots': False}
+            for i, seed in enumerate(seeds)]
+
+def run_replicates(config, seeds, workers=None, log_dir='results', log_level='INFO'):
+    """
+    Runs the config once per seed and returns the summaries in seed order.
+    A failed replicate is returned as {'name': ..., 'error': ...} (see scheduler.run_experiments).
+    """
+    configs = replicate_configs(config, seeds)
+    order = {c['name']: i for i, c in enumerate(configs)}
+    summaries = [None] * len(configs)
+    for result in run_experiments(configs, max_workers=workers, log_dir=log_dir, log_level=log_level):
+        summaries[order[result['name']]] = result
+    return summaries
+
+def pad_curves(curves):
+    """Stacks curves of different lengths into one (replicates, longest) float array, padded with NaN."""
+    lengths = np.array([len(c) for c in curves], dtype=np.int64)
+    padded = np.full((len(curves), int(lengths.max(initial=0))), np.nan)
+    if padded.size:
+        mask = np.arange(padded.shape[1]) < lengths[:, None]
+        padded[mask] = np.concatenate([np.asarray(c, dtype=np.float64) for c in curves])
+    return padded
+
+def aggregate_curves(curves, quantiles=DEFAULT_QUANTILES, min_replicates=1):
+    """
+    Per-run-index statistics over the replicates' curves. Seeds that finished fewer runs
+    are NaN-padded, so run i is averaged over the seeds that reached it; trailing runs
+    reached by fewer than min_replicates seeds are dropped.
+    Returns {'mean', 'std', 'quantiles' (len(quantiles), runs), 'quantile_levels', 'count', 'replicates'}.
+    """
+    padded = pad_curves(curves)
+    count = np.sum(~np.isnan(padded), axis=0)
+    reached = np.nonzero(count >= max(min_replicates, 1))[0]
+    runs = reached[-1] + 1 if reached.size else 0
+    padded, count = padded[:, :runs], count[:runs]
+    with warnings.catch_warnings(): # a run index without any sample gives NaN, not a warning
+        warnings.simplefilter('ignore', RuntimeWarning)
+        return {
+            'mean': np.nanmean(padded, axis=0),
+            'std': np.nanstd(padded, axis=0),
+            'quantiles': np.nanquantile(padded, quantiles, axis=0).reshape(len(quantiles), -1),
+            'quantile_levels': np.asarray(quantiles, dtype=np.float64),
+            'count': count,
+            'replicates': len(curves),
+        }
+
+def aggregate(summaries, quantiles=DEFAULT_QUANTILES, min_replicates=1):
+    """Bands for every curve in REPLICATE_CURVES, over the replicates that didn't fail."""
+    finished = [s for s in summaries if 'error' not in s]
+    return {curve: aggregate_curves([s[curve] for s in finished], quantiles, min_replicates)
+            for curve in REPLICATE_CURVES}
+
+def save_aggregate(bands, seeds, path):
+    """Saves the bands as one .npz with <curve>/<statistic> arrays plus the seeds."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    arrays = {f"{curve}/{name}": np.asarray(value) for curve, stats in bands.items() for name, value in stats.items()}
+    np.savez_compressed(path, seeds=np.array(seeds, dtype=np.int64), **arrays)
+    return path
+
+def replicate_experiment(config, num_seeds, root_seed=None, workers=None, quantiles=DEFAULT_QUANTILES,
+                         log=None, renderer=None, log_level='INFO'):
+    """
+    Runs a config across num_seeds seeds derived from root_seed, saves the aggregated bands to
+    results/<name>_replicates.npz and draws the steps-per-run bands (unless "plots" is False).
+    Returns (bands, summaries).
+    """
+    name = config['name']
+    log = log if log is not None else console_log()
+    seeds = replicate_seeds(num_seeds, root_seed)
+    summaries = run_replicates(config, seeds, workers, os.path.join('results', f"{name}_replicates"), log_level)
+    bands = aggregate(summaries, quantiles)
+    path = save_aggregate(bands, seeds, os.path.join('results', f"{name}_replicates.npz"))
+
+    failed = [s['name'] for s in summaries if 'error' in s]
+    for s in summaries:
+        if 'error' in s:
+            log.emit('job_failed', 'ERROR', experiment=s['name'], error=s['error'])
+    log.emit('replicates_finished', experiment=name, root_seed=root_seed, seeds=seeds, failed=failed, file=path)
+
+    if config.get('plots', True) and len(failed) < len(summaries):
+        # Switch marker at the median switch run (-1 if any replicate never switched)
+        switch_runs = [s['first_policy_switch_run'] for s in summaries if 'error' not in s]
+        switch_run = -1 if -1 in switch_runs else int(np.median(switch_runs))
+        from plot_renderer import PlotRenderer
+        plots = renderer if renderer is not None else PlotRenderer(workers=0)
+        plots.plot_performance(bands['steps_per_run']['mean'].tolist(), switch_run, f"{name}_replicates",
+                               log, bands=bands['steps_per_run'])
+        if renderer is None:
+            plots.close()
+    return bands, summaries
@@ -0,0 +1,165 @@
+# this is discover-paths-rl/results_sink.py
+# this file contains atomic file writes and the ResultsSink, which writes result
+# files (metrics, checkpoints, logs, instrumentation) on a background thread
+
+import os
+import json
+import queue
+import shutil
+import threading
+import time
+import numpy as np
+
+def atomic_write(path, write):
+    """
+    Calls write(tmp_path) to write a file (or a directory) next to `path`, then moves it into
+    place with os.replace, so a reader sees either the old result or the new one, never half of one.
+    Returns the path.
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    root, ext = os.path.splitext(path)
+    tmp_path = f"{root}.tmp{os.getpid()}-{threading.get_ident()}{ext}" # keeps the extension savefig / savez go by
+    try:
+        write(tmp_path)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.isdir(tmp_path):
+            shutil.rmtree(tmp_path)
+        elif os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return path
+
+def _write_npz(arrays, compressed):
+    save = np.savez_compressed if compressed else np.savez
+    def write(tmp_path):
+        with open(tmp_path, 'wb') as f: # a file object: savez doesn't append another .npz
+            save(f, **arrays)
+    return write
+
+def _write_data(data):
+    """The atomic_write function for a str (UTF-8 text) or bytes."""
+    def write(tmp_path):
+        if isinstance(data, bytes):
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+        else:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(data)
+    return write
+
+class ResultsSink:
+    """
+    Writes result files on one background thread so the experiments don't wait on the disk.
+    Every job is handed its data up front (arrays are copied by the caller's snapshot, text is
+    already serialized) and written with atomic_write, in submission order.
+    Memory is bounded: at most `max_pending` jobs and `max_bytes` of queued data are held, and
+    submitting beyond that blocks until the writer catches up (backpressure). flush() is the
+    barrier: it waits for every queued job and raises the first write error; close() flushes and
+    stops the thread.
+    """
+    def __init__(self, max_pending=32, max_bytes=256 * 2**20):
+        if max_pending < 1 or max_bytes < 1:
+            raise ValueError(f"Invalid results sink bounds: max_pending={max_pending}, max_bytes={max_bytes}")
+        self.max_bytes = max_bytes
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._bytes = 0 # size of the queued jobs' data
+        self._space = threading.Condition()
+        self._errors = []
+        self.written = 0
+        self.blocked_seconds = 0.0 # time submitters spent waiting on backpressure
+        self._thread = threading.Thread(target=self._run, name='results-sink', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                self._queue.task_done()
+                return
+            function, nbytes = job
+            try:
+                function()
+                self.written += 1
+            except Exception as e: # reported by flush(); later jobs still run
+                self._errors.append(e)
+            finally:
+                with self._space:
+                    self._bytes -= nbytes
+                    self._space.notify_all()
+                self._queue.task_done()
+
+    def _put(self, function, nbytes):
+        if not self._thread.is_alive():
+            raise ValueError("The results sink is closed")
+        start = time.perf_counter()
+        with self._space:
+            # One job larger than max_bytes still goes through, once the queue is empty
+            while self._bytes and self._bytes + nbytes > self.max_bytes:
+                self._space.wait()
+            self._bytes += nbytes
+        self._queue.put((function, nbytes)) # blocks while max_pending jobs are queued
+        self.blocked_seconds += time.perf_counter() - start
+
+    def submit(self, path, write, nbytes=0):
+        """Queues atomic_write(path, write); write(tmp_path) must only use data it already holds."""
+        self._put(lambda: atomic_write(path, write), nbytes)
+        return path
+
+    def write_npz(self, path, arrays, compressed=True):
+        return self.submit(path, _write_npz(arrays, compressed), sum(np.asarray(a).nbytes for a in arrays.values()))
+
+    def write_data(self, path, data):
+        """Queues a str (written as UTF-8) or bytes."""
+        return self.submit(path, _write_data(data), len(data))
+
+    def write_json(self, path, data, **kwargs):
+        return self.write_data(path, json.dumps(data, **kwargs))
+
+    def append(self, file, text):
+        """Queues file.write(text) + flush for an open file (a log), in order with the other jobs."""
+        def write():
+            file.write(text)
+            file.flush()
+        self._put(write, len(text))
+
+    def flush(self):
+        """Waits until every queued job is written; raises the first error since the last flush."""
+        self._queue.join()
+        if self._errors:
+            errors, self._errors = self._errors, []
+            raise errors[0]
+
+    def close(self):
+        """Flushes, then stops the writer thread."""
+        if not self._thread.is_alive():
+            return
+        try:
+            self.flush()
+        finally:
+            self._queue.put(None)
+            self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def write_npz(path, arrays, sink=None, compressed=True):
+    """Writes arrays to an .npz file atomically, in the background if a ResultsSink is given."""
+    if sink is not None:
+        return sink.write_npz(path, arrays, compressed)
+    return atomic_write(path, _write_npz(arrays, compressed))
+
+def write_data(path, data, sink=None):
+    """Writes a str or bytes atomically, in the background if a ResultsSink is given."""
+    if sink is not None:
+        return sink.write_data(path, data)
+    return atomic_write(path, _write_data(data))
+
+def write_json(path, data, sink=None, **kwargs):
+    """Writes JSON atomically, in the background if a ResultsSink is given."""
+    return write_data(path, json.dumps(data, **kwargs), sink)
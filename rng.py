@@ -0,0 +1,80 @@
+# this is discover-paths-rl/rng.py
+# this file contains RandomStream, the random number stream each controller owns
+# (instead of sharing the module-level `random` generator)
+
+import numpy as np
+
+BLOCK_SIZE = 4096
+
+def stream_generator(seed, stream=0, position=0):
+    """A NumPy Generator for stream `stream` of `seed`, advanced past the first `position` uniforms."""
+    bit_generator = np.random.PCG64(np.random.SeedSequence(seed, spawn_key=(stream,)))
+    bit_generator.advance(position) # random() uses exactly one 64-bit output per draw
+    return np.random.Generator(bit_generator)
+
+class RandomStream:
+    """
+    Uniform draws from a PCG64 stream identified by (seed, stream). Uniforms are drawn
+    from NumPy in blocks of block_size, so a draw is a list lookup rather than a
+    generator call. Every draw (random, below, choice) consumes exactly one uniform, so
+    the stream's state is just its position: state() / seek() save and restore it exactly,
+    and the compiled backend continues the same stream with stream_generator().
+    """
+    def __init__(self, seed, stream=0, block_size=BLOCK_SIZE):
+        self.seed = seed
+        self.stream = stream
+        self.block_size = block_size
+        self.seek(0)
+
+    @property
+    def position(self):
+        """Number of uniforms consumed so far."""
+        return self._block_start + self._i
+
+    def seek(self, position):
+        """Moves the stream so the next draw is uniform number `position`."""
+        self._generator = stream_generator(self.seed, self.stream, position)
+        self._block = []
+        self._block_start = position
+        self._i = 0
+
+    def _refill(self):
+        self._block_start += len(self._block)
+        self._block = self._generator.random(self.block_size).tolist()
+        self._i = 0
+
+    def random(self):
+        """Same as random.random()."""
+        i = self._i
+        if i == len(self._block):
+            self._refill()
+            i = 0
+        self._i = i + 1
+        return self._block[i]
+
+    def below(self, n):
+        """A random index in range(n)."""
+        return min(int(self.random() * n), n - 1)
+
+    def choice(self, seq):
+        return seq[self.below(len(seq))]
+
+    def sample(self, population, k):
+        """k distinct elements of population (partial Fisher-Yates, k uniforms)."""
+        population = list(population)
+        if not 0 <= k <= len(population):
+            raise ValueError(f"Sample larger than population or negative: {k}")
+        for i in range(k):
+            j = i + self.below(len(population) - i)
+            population[i], population[j] = population[j], population[i]
+        return population[:k]
+
+    def state(self):
+        """JSON-compatible state (see from_state)."""
+        return {'seed': self.seed, 'stream': self.stream, 'position': self.position}
+
+    @classmethod
+    def from_state(cls, state):
+        rng = cls(state['seed'], state['stream'])
+        rng.seek(state['position'])
+        return rng
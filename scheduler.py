@@ -0,0 +1,78 @@
+# this is discover-paths-rl/scheduler.py
+# this file contains the parallel experiment scheduler
+# which spreads experiment configs across a process pool
+
+import os
+import time
+import random
+import itertools
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+def _run_job(config, seed, log_filename, log_level='INFO'):
+    """
+    Runs one experiment inside a worker process.
+    Each job seeds its own random stream and writes its own event log,
+    so jobs never share a log file or RNG state.
+    """
+    from event_log import EventLog
+    from experiment import ExperimentRunner
+
+    start = time.perf_counter()
+    with EventLog(log_filename, level=log_level) as event_log:
+        random.seed(seed)
+        event_log.emit('job_started', experiment=config['name'], seed=seed)
+        runner = ExperimentRunner(config, event_log=event_log)
+        runner.run()
+        result = runner.summary()
+    result['seed'] = seed
+    result['log_file'] = log_filename
+    result['elapsed_seconds'] = time.perf_counter() - start
+    return result
+
+def iter_job_seeds(root_seed=None):
+    """Endless stream of job seeds derived from a root seed (or from the global stream if None)."""
+    rng = random.Random(root_seed) if root_seed is not None else random
+    while True:
+        yield rng.randint(0, 100000)
+
+def job_seeds(num_jobs, root_seed=None):
+    """Derives one seed per job from a root seed (or from the global stream if None)."""
+    return list(itertools.islice(iter_job_seeds(root_seed), num_jobs))
+
+def run_experiments(configs, max_workers=None, root_seed=None, log_dir='results', log_level='INFO', max_pending=None):
+    """
+    Runs the configs on a ProcessPoolExecutor and yields each job's summary dict
+    as soon as that job finishes (completion order, not submission order).
+    configs can be any iterable (e.g. a config_loader generator): it is consumed lazily,
+    keeping at most max_pending jobs (default: twice the workers) submitted at a time.
+    A config's own "seed" key wins over the derived seed, and takes none from the derived
+    sequence: the n-th config without a seed always gets the n-th derived seed. A job that raises
+    yields {'name': ..., 'error': ...} instead of a summary.
+    Each job writes a JSON Lines event log (see event_log.py) to log_dir.
+    """
+    configs = iter(configs)
+    seeds = iter_job_seeds(root_seed)
+    os.makedirs(log_dir, exist_ok=True)
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        max_pending = max_pending or 2 * (max_workers or os.cpu_count() or 1)
+        futures = {}
+        exhausted = False
+        while futures or not exhausted:
+            while not exhausted and len(futures) < max_pending:
+                config = next(configs, None)
+                if config is None:
+                    exhausted = True
+                    break
+                seed = config['seed'] if 'seed' in config else next(seeds)
+                log_filename = os.path.join(log_dir, f"{config['name']}_seed{seed}_log.jsonl")
+                futures[executor.submit(_run_job, config, seed, log_filename, log_level)] = config['name']
+            if not futures:
+                break
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = futures.pop(future)
+                try:
+                    yield future.result()
+                except Exception as e: # one failed job shouldn't stop the others
+                    yield {'name': name, 'error': repr(e)}
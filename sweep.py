@@ -0,0 +1,212 @@
+# this is discover-paths-rl/sweep.py
+# this file contains the hyperparameter sweep: it expands a search space into
+# ExperimentRunner configs (grid, random or Latin hypercube samples), runs them
+# concurrently through the scheduler with optional successive halving, and
+# aggregates the results into one table
+#
+# Usage:
+#   python sweep.py my_sweep.json --workers 4 --seed 7
+
+import os
+import csv
+import json
+import math
+import random
+import argparse
+import itertools
+from scheduler import run_experiments, job_seeds
+
+SWEEP_METHODS = ('grid', 'random', 'lhs')
+
+def _dimension_value(dim, u):
+    """
+    Maps u in [0, 1) to a value of one search dimension:
+      [a, b, c]                                - one of the listed values
+      {"low": lo, "high": hi}                  - uniform in [lo, hi)
+      {"low": lo, "high": hi, "log": true}     - log-uniform
+      {"low": lo, "high": hi, "int": true}     - rounded to an int
+    """
+    if isinstance(dim, (list, tuple)):
+        return dim[min(int(u * len(dim)), len(dim) - 1)]
+    low, high = dim['low'], dim['high']
+    if dim.get('log'):
+        value = math.exp(math.log(low) + u * (math.log(high) - math.log(low)))
+    else:
+        value = low + u * (high - low)
+    return int(round(value)) if dim.get('int') else value
+
+def expand_grid(space):
+    """Every combination of the listed values (all dimensions must be lists)."""
+    for key, dim in space.items():
+        if not isinstance(dim, (list, tuple)):
+            raise ValueError(f"Grid sweeps need a list of values for '{key}', got {dim}")
+    keys = list(space)
+    return [dict(zip(keys, values)) for values in itertools.product(*(space[k] for k in keys))]
+
+def sample_random(space, samples, rng):
+    """`samples` independent random points."""
+    return [{key: _dimension_value(dim, rng.random()) for key, dim in space.items()} for _ in range(samples)]
+
+def sample_lhs(space, samples, rng):
+    """
+    Latin hypercube: each dimension is cut into `samples` equal strata and
+    every stratum is used exactly once, in a random pairing across dimensions.
+    """
+    points = [{} for _ in range(samples)]
+    for key, dim in space.items():
+        strata = rng.sample(range(samples), samples)
+        for point, stratum in zip(points, strata):
+            point[key] = _dimension_value(dim, (stratum + rng.random()) / samples)
+    return points
+
+def expand_space(space, method='grid', samples=10, seed=None):
+    """Returns the list of parameter dicts for a sweep."""
+    if method not in SWEEP_METHODS:
+        raise ValueError(f"Unknown sweep method: {method} (expected one of {SWEEP_METHODS})")
+    if method == 'grid':
+        return expand_grid(space)
+    rng = random.Random(seed)
+    return sample_random(space, samples, rng) if method == 'random' else sample_lhs(space, samples, rng)
+
+def apply_params(base, params, name):
+    """
+    Builds one trial config. Keys are copied into the config, except
+    "policy_switch_step", which moves the switch between the first and last
+    policy of the base schedule.
+    """
+    config = {**base, 'name': name}
+    for key, value in params.items():
+        if key == 'policy_switch_step':
+            first, last = base['policy_schedule'][0][1], base['policy_schedule'][-1][1]
+            config['policy_schedule'] = [(int(value), first), (base['total_steps'] - int(value), last)]
+        else:
+            config[key] = value
+    return config
+
+def halving_budgets(total_steps, halving):
+    """Cumulative step budgets per rung: min_steps, min_steps*eta, ... capped at total_steps."""
+    if not halving:
+        return [total_steps]
+    budget, eta = halving['min_steps'], halving.get('eta', 3)
+    if budget < 1 or eta < 2:
+        raise ValueError(f"Successive halving needs min_steps >= 1 and eta >= 2, got {halving}")
+    budgets = []
+    while budget < total_steps:
+        budgets.append(budget)
+        budget *= eta
+    return budgets + [total_steps]
+
+def trial_score(steps_per_run, window):
+    """Mean steps of the last `window` runs (lower is better; inf with no finished run)."""
+    recent = steps_per_run[-window:]
+    return sum(recent) / len(recent) if recent else float('inf')
+
+def run_sweep(sweep, workers=None, root_seed=None, out_dir='results'):
+    """
+    Runs a sweep definition:
+        {"name": "lr_gamma", "base": {...experiment config...},
+         "space": {"learning_rate": {"low": 0.05, "high": 0.6}, "discount_factor": [0.3, 0.5, 0.7]},
+         "method": "lhs", "samples": 12, "seed": 1,
+         "halving": {"min_steps": 1000, "eta": 3}, "score_window": 5}
+    With "halving", every trial first trains for min_steps. The best 1/eta of the
+    trials (by trial_score) then resume from their checkpoints (restore="all", so the
+    run and its stop state carry on) up to eta times as many steps, and so on up to the
+    base total_steps. Trials that stopped on their own (early_stop, convergence,
+    dp_baseline epsilon) are final: they keep their score and are not resumed.
+    Returns the result rows (best first) and writes
+    them to <out_dir>/sweep_<name>/results.csv.
+    """
+    name = sweep.get('name', 'sweep')
+    base = {'plots': False, **sweep['base']}
+    window = sweep.get('score_window', 5)
+    halving = sweep.get('halving')
+    eta = halving.get('eta', 3) if halving else None
+    sweep_dir = os.path.join(out_dir, f"sweep_{name}")
+    os.makedirs(sweep_dir, exist_ok=True)
+
+    points = expand_space(sweep['space'], sweep.get('method', 'grid'), sweep.get('samples', 10), sweep.get('seed'))
+    trials = [apply_params(base, params, f"{name}_t{i:03d}") for i, params in enumerate(points)]
+    for trial, seed in zip(trials, job_seeds(len(trials), root_seed)):
+        trial.setdefault('seed', seed)
+    rows = {trial['name']: {'trial': trial['name'], **points[i], 'score': float('inf'), 'rung': 0,
+                            'steps_trained': 0, 'terminal_states': 0, 'avg_steps_per_run': None,
+                            'stop_reason': None, 'seed': trial['seed'], 'elapsed_seconds': 0.0, 'error': None}
+            for i, trial in enumerate(trials)}
+
+    budgets = halving_budgets(base['total_steps'], halving)
+    active = trials
+    done_steps = 0
+    for rung, budget in enumerate(budgets):
+        configs = []
+        for trial in active:
+            config = {**trial, 'total_steps': budget} # a resumed trial continues from done_steps
+            if halving:
+                checkpoint = os.path.join(sweep_dir, f"{trial['name']}_checkpoint.npz")
+                config['checkpoint_path'] = checkpoint
+                if done_steps:
+                    config['warm_start'] = {'path': checkpoint, 'restore': 'all'}
+            configs.append(config)
+
+        log_dir = os.path.join(sweep_dir, f"rung{rung}")
+        for result in run_experiments(configs, max_workers=workers, log_dir=log_dir):
+            row = rows[result['name']]
+            row['rung'] = rung
+            if 'error' in result:
+                row['error'] = result['error']
+                continue
+            runs = result['steps_per_run'] # a resumed trial's run table includes the earlier rungs
+            row['score'] = trial_score(runs, window)
+            row['steps_trained'] += result['steps_trained']
+            row['terminal_states'] = len(runs)
+            row['avg_steps_per_run'] = sum(runs) / len(runs) if runs else None
+            row['stop_reason'] = result['stop_reason']
+            row['elapsed_seconds'] += result['elapsed_seconds']
+
+        # Promote the best 1/eta of the trials that ran out of budget (the others are finished)
+        alive = [t for t in active if rows[t['name']]['error'] is None and rows[t['name']]['stop_reason'] == 'budget']
+        alive.sort(key=lambda t: rows[t['name']]['score'])
+        if rung < len(budgets) - 1:
+            for t in alive[max(1, math.ceil(len(alive) / eta)):]:
+                rows[t['name']]['stop_reason'] = 'halving'
+            alive = alive[:max(1, math.ceil(len(alive) / eta))]
+        active = alive
+        done_steps = budget
+        if not active:
+            break
+
+    table = sorted(rows.values(), key=lambda r: r['score'])
+    write_table(table, os.path.join(sweep_dir, 'results.csv'))
+    return table
+
+def write_table(rows, filename):
+    """Writes the sweep rows as CSV (one column per parameter and result field)."""
+    columns = []
+    for row in rows:
+        columns += [c for c in row if c not in columns]
+    with open(filename, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(rows)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run a hyperparameter sweep over ExperimentRunner configs.")
+    parser.add_argument('sweep_file', help="JSON sweep definition (see run_sweep).")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: one per CPU).")
+    parser.add_argument('--seed', type=int, default=None, help="Root seed for the trial seeds.")
+    parser.add_argument('--out-dir', default='results', help="Directory for logs, checkpoints and the results table.")
+    return parser.parse_args()
+
+def main(args):
+    with open(args.sweep_file, 'r', encoding='utf-8') as f:
+        sweep = json.load(f)
+    table = run_sweep(sweep, workers=args.workers, root_seed=args.seed, out_dir=args.out_dir)
+    params = list(sweep['space'])
+    print(f"{'trial':<20} " + " ".join(f"{p:>18}" for p in params) + f" {'score':>8} {'steps':>7} {'stop':>10}")
+    for row in table:
+        values = " ".join(f"{row[p]:>18.4g}" if isinstance(row[p], float) else f"{str(row[p]):>18}" for p in params)
+        print(f"{row['trial']:<20} {values} {row['score']:>8.1f} {row['steps_trained']:>7} {str(row['stop_reason']):>10}"
+              + (f"  {row['error']}" if row['error'] else ""))
+    print(f"\nSweep results saved to '{os.path.join(args.out_dir, 'sweep_' + sweep.get('name', 'sweep'), 'results.csv')}'")
+
+if __name__ == "__main__":
+    main(parse_args())
@@ -0,0 +1,7 @@
+# this is discover-paths-rl/tests/conftest.py
+# this file puts the repository root on sys.path so the tests can import its flat modules
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
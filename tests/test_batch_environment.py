@@ -0,0 +1,51 @@
+# this is discover-paths-rl/tests/test_batch_environment.py
+# this file checks BatchPDWorld step by step against independent PDWorlds
+
+import numpy as np
+import pytest
+from constants import ACTIONS, DEFAULT_PICKUP_LOCS, DEFAULT_DROPOFF_LOCS, AGENT_F_START, AGENT_M_START
+from environment import PDWorld
+from agent import Agent
+from batch_environment import BatchPDWorld
+
+OBSTACLE_WORLD = {"pickup_locs": {(0, 4): 3, (3, 1): 2}, "dropoff_locs": {(0, 0): 0, (4, 4): 0, (2, 4): 0},
+                  "obstacles": [(2, 2), (1, 3)], "dropoff_capacity": {(0, 0): 2}}
+
+@pytest.mark.parametrize('world, n_steps', [
+    ({"pickup_locs": DEFAULT_PICKUP_LOCS, "dropoff_locs": DEFAULT_DROPOFF_LOCS}, 20000),
+    (OBSTACLE_WORLD, 5000),
+], ids=['default', 'obstacles_capacity'])
+def test_batch_matches_pdworld(world, n_steps):
+    n_worlds = 64
+    rng = np.random.default_rng(0)
+    starts = [AGENT_F_START, AGENT_M_START]
+    batch = BatchPDWorld(n_worlds, world['pickup_locs'], world['dropoff_locs'], agent_starts=starts,
+                         obstacles=world.get('obstacles'), dropoff_capacity=world.get('dropoff_capacity'))
+    worlds = [PDWorld(world['pickup_locs'], world['dropoff_locs'], obstacles=world.get('obstacles'),
+                      dropoff_capacity=world.get('dropoff_capacity')) for _ in range(n_worlds)]
+    agents = [[Agent('F', **AGENT_F_START), Agent('M', **AGENT_M_START)] for _ in range(n_worlds)]
+    terminals = 0
+    for step in range(n_steps):
+        turn = step % 2
+        mask = batch.valid_action_mask(turn)
+        # Mostly valid actions (so runs finish), with invalid ones mixed in
+        random_actions = rng.integers(0, len(ACTIONS), n_worlds)
+        valid_actions = (rng.random(mask.shape) * mask).argmax(axis=1)
+        actions = np.where(rng.random(n_worlds) < 0.2, random_actions, valid_actions)
+        rewards, terminal = batch.step(turn, actions)
+        masks, actions, rewards, terminal = mask.tolist(), actions.tolist(), rewards.tolist(), terminal.tolist()
+        positions, has_block = batch.agent_pos.tolist(), batch.has_block.tolist()
+        for w in range(n_worlds):
+            mover, other = agents[w][turn], agents[w][1 - turn]
+            possible = worlds[w].get_possible_actions(mover, other)
+            assert masks[w] == [a in possible for a in ACTIONS]
+            assert worlds[w].apply_action(mover, other, ACTIONS[actions[w]]) == rewards[w]
+            assert worlds[w].is_terminal_state() == terminal[w]
+            if terminal[w]:
+                terminals += 1
+                worlds[w].reset()
+                for agent, start in zip(agents[w], starts):
+                    agent.reset(**start)
+            assert [[a.x, a.y] for a in agents[w]] == positions[w]
+            assert [a.has_block for a in agents[w]] == has_block[w]
+    assert terminals > 0
@@ -0,0 +1,125 @@
+# this is discover-paths-rl/tests/test_checkpoint_resume.py
+# this file checks that a run split at a checkpoint and resumed with restore="all"
+# ends exactly like the same run trained without the split
+
+import shutil
+import pytest
+from event_log import EventLog
+from experiment import ExperimentRunner
+from q_table import sparse_q_arrays
+from checkpoint import load_checkpoint
+
+BASE = {
+    "name": "resume", "total_steps": 8000, "seed": 11, "learning_rate": 0.3, "discount_factor": 0.5,
+    "policy_schedule": [(500, 'PRANDOM'), (7500, 'PEXPLOIT')], "plots": False,
+}
+WORLD_CHANGE = {"after_terminal_states": 50, "pickup_locs": {(1, 2): 5, (4, 4): 5}}
+THREE_AGENTS = {"agents": [{"name": "F", "x": 0, "y": 4}, {"name": "M", "x": 2, "y": 2},
+                           {"name": "G", "x": 4, "y": 0}]}
+
+def train(config):
+    runner = ExperimentRunner(config, EventLog())
+    runner.train()
+    return runner
+
+def final_state(runner):
+    """Everything the two runs must agree on once training is over."""
+    tables = []
+    for controller in runner.controllers:
+        states, values = sparse_q_arrays(controller.q_table)
+        tables.append({tuple(s): tuple(v) for s, v in zip(states.tolist(), values.tolist())})
+    return {
+        'q_tables': tables,
+        'terminal_states': runner.terminal_states_reached,
+        'total_rewards': dict(runner.total_rewards),
+        'steps_per_run': runner.steps_per_run,
+        'terminal_steps': runner.terminal_steps,
+        'rewards_per_run': runner.metrics.runs.column('reward').tolist(),
+        'first_policy_switch_run': runner.first_policy_switch_run,
+        'pickup_locs': dict(runner.world.pickup_locs),
+        'agents': [(a.x, a.y, a.has_block) for a in runner.agents],
+        'rng': [c.rng.state() for c in runner.controllers] + [runner.turn_rng.state()],
+    }
+
+@pytest.mark.parametrize('split', [300, 4001])
+@pytest.mark.parametrize('extra', [
+    {"algorithm": 'Q_LEARNING', "world_change": WORLD_CHANGE},
+    {"algorithm": 'SARSA'},
+    {"algorithm": 'SARSA', "dense_q_table": True, "world_change": WORLD_CHANGE},
+    {"algorithm": 'N_STEP_SARSA', "n_step": 3},
+    {"algorithm": 'SARSA_LAMBDA', "lambda": 0.5},
+    {"algorithm": 'Q_LAMBDA', "lambda": 0.5},
+    {"algorithm": 'Q_LEARNING', "world": THREE_AGENTS, "turn_order": 'random'},
+    {"algorithm": 'Q_LEARNING', "world": THREE_AGENTS, "turn_order": 'simultaneous'},
+], ids=['q_learning_world_change', 'sarsa', 'sarsa_dense_world_change', 'n_step_sarsa',
+        'sarsa_lambda', 'q_lambda', 'random_turns', 'simultaneous_turns'])
+def test_split_run_matches_uninterrupted(tmp_path, extra, split):
+    config = {**BASE, **extra}
+    checkpoint = str(tmp_path / 'split.npz')
+    full = train(config)
+    train({**config, "total_steps": split, "checkpoint_path": checkpoint})
+    resumed = train({**config, "warm_start": {"path": checkpoint, "restore": 'all'}})
+    assert resumed.steps_trained == config['total_steps'] - split
+    assert final_state(resumed) == final_state(full)
+
+def test_world_change_fires_once_after_resume(tmp_path):
+    config = {**BASE, "algorithm": 'Q_LEARNING', "world_change": WORLD_CHANGE}
+    checkpoint = str(tmp_path / 'split.npz')
+    first = train({**config, "total_steps": 300, "checkpoint_path": checkpoint})
+    assert 0 < first.terminal_states_reached < WORLD_CHANGE['after_terminal_states']
+    resumed = train({**config, "warm_start": {"path": checkpoint, "restore": 'all'}})
+    assert resumed.world_changed
+    assert set(resumed.world.initial_pickup_locs) == set(WORLD_CHANGE['pickup_locs'])
+
+def test_periodic_checkpoint_resume(tmp_path):
+    # A checkpoint saved inside the loop (checkpoint_every) resumes like the one saved at the end
+    config = {**BASE, "algorithm": 'SARSA', "world_change": WORLD_CHANGE}
+    checkpoint, copy = str(tmp_path / 'every.npz'), str(tmp_path / 'at_3000.npz')
+    runner = ExperimentRunner({**config, "checkpoint_every": 3000, "checkpoint_path": checkpoint}, EventLog())
+    def save_checkpoint(step):
+        ExperimentRunner.save_checkpoint(runner, step)
+        if step == 3000:
+            shutil.copy(checkpoint, copy)
+    runner.save_checkpoint = save_checkpoint
+    runner.train()
+    assert final_state(runner) == final_state(train(config))
+    resumed = train({**config, "warm_start": {"path": copy, "restore": 'all'}})
+    assert resumed.start_step == 3000
+    assert final_state(resumed) == final_state(runner)
+
+def test_restore_all_needs_run_state(tmp_path):
+    checkpoint = str(tmp_path / 'q.npz')
+    runner = train({**BASE, "algorithm": 'Q_LEARNING', "total_steps": 100, "checkpoint_path": checkpoint})
+    resumed = ExperimentRunner({**BASE, "algorithm": 'Q_LEARNING',
+                                "warm_start": {"path": checkpoint, "restore": 'q_tables'}}, EventLog())
+    assert resumed.start_step == 0 and resumed.terminal_states_reached == 0
+    assert len(resumed.controller_f.q_table) == len(runner.controller_f.q_table)
+
+@pytest.mark.parametrize('algorithm', ['Q_LEARNING', 'SARSA'])
+def test_numba_checkpoint_resumes_in_python(tmp_path, algorithm):
+    pytest.importorskip('numba')
+    config = {**BASE, "algorithm": algorithm, "dense_q_table": True, "world_change": WORLD_CHANGE}
+    checkpoint = str(tmp_path / 'split.npz')
+    full = train(config)
+    train({**config, "backend": 'numba', "total_steps": 4001, "checkpoint_path": checkpoint})
+    resumed = train({**config, "backend": 'numba', "warm_start": {"path": checkpoint, "restore": 'all'}})
+    assert final_state(resumed) == final_state(full)
+
+def test_final_checkpoint_step_after_early_stop(tmp_path):
+    checkpoint = str(tmp_path / 'stopped.npz')
+    runner = train({**BASE, "algorithm": 'SARSA', "early_stop": {"patience": 3, "window": 3},
+                    "checkpoint_path": checkpoint})
+    assert runner.stop_reason == 'early_stop' and runner.steps_trained < BASE['total_steps']
+    assert load_checkpoint(checkpoint)['meta']['step'] == runner.steps_trained
+
+def test_early_stop_state_carries_over(tmp_path):
+    config = {**BASE, "algorithm": 'SARSA', "early_stop": {"patience": 8, "window": 5, "min_delta": 2.0}}
+    checkpoint = str(tmp_path / 'split.npz')
+    full = train(config)
+    assert full.stop_reason == 'early_stop'
+    split = full.start_step + full.steps_trained - 500
+    train({**config, "total_steps": split, "checkpoint_path": checkpoint})
+    resumed = train({**config, "warm_start": {"path": checkpoint, "restore": 'all'}})
+    assert resumed.stop_reason == 'early_stop'
+    assert split + resumed.steps_trained == full.steps_trained
+    assert final_state(resumed) == final_state(full)
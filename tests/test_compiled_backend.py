@@ -0,0 +1,72 @@
+# this is discover-paths-rl/tests/test_compiled_backend.py
+# this file checks the numba backend against the Python loop
+
+import pytest
+import numpy as np
+from event_log import EventLog
+from experiment import ExperimentRunner
+from q_table import sparse_q_arrays
+
+pytest.importorskip('numba')
+import compiled_backend
+
+BASE = {"name": "numba", "total_steps": 20000, "seed": 5, "learning_rate": 0.3, "discount_factor": 0.5,
+        "policy_schedule": [(500, 'PRANDOM'), (19500, 'PEXPLOIT')], "plots": False}
+
+def train(config):
+    runner = ExperimentRunner(config, EventLog())
+    runner.train()
+    return runner
+
+def results(runner):
+    """What the Python loop and the kernel must agree on bit for bit."""
+    tables = []
+    for controller in runner.controllers:
+        states, values = sparse_q_arrays(controller.q_table)
+        order = np.lexsort(states.T[::-1])
+        tables.append((states[order].tolist(), values[order].tolist()))
+    return {
+        'q_tables': tables,
+        'runs': runner.metrics.runs.to_array().tolist(),
+        'steps': runner.metrics.steps.to_array().tolist(),
+        'distance': (runner.metrics.distance_sum, runner.metrics.distance_count),
+        'total_rewards': dict(runner.total_rewards),
+        'terminal_states': runner.terminal_states_reached,
+        'first_policy_switch_run': runner.first_policy_switch_run,
+        'steps_trained': runner.steps_trained,
+        'stop_reason': runner.stop_reason,
+        'pickup_locs': dict(runner.world.pickup_locs),
+        'agents': [(a.x, a.y, a.has_block) for a in runner.agents],
+        'rng': [c.rng.state() for c in runner.controllers],
+    }
+
+@pytest.mark.parametrize('algorithm', ['Q_LEARNING', 'SARSA'])
+@pytest.mark.parametrize('extra', [
+    {},
+    {"dense_q_table": True, "metrics": {"sampling": 'every_k', "every": 7}},
+    {"world_change": {"after_terminal_states": 10, "pickup_locs": {(1, 2): 5, (4, 4): 5}}},
+    {"early_stop": {"patience": 8, "window": 5, "min_delta": 2.0}},
+    {"policy_schedule": [(500, 'PRANDOM'), (4000, 'PGREEDY'), (15500, 'PEXPLOIT')]},
+], ids=['dict', 'dense_sampled', 'world_change', 'early_stop', 'pgreedy'])
+def test_numba_matches_python_exactly(algorithm, extra):
+    config = {**BASE, "algorithm": algorithm, **extra}
+    python = train(config)
+    compiled = train({**config, "backend": 'numba'})
+    assert compiled.learner is None # the kernel ran, not the fallback
+    assert results(compiled) == results(python)
+
+def test_dense_tables_are_updated_in_place():
+    runner = ExperimentRunner({**BASE, "algorithm": 'Q_LEARNING', "dense_q_table": True, "backend": 'numba'},
+                              EventLog())
+    values = [c.q_table.values for c in runner.controllers]
+    runner.train()
+    assert all(c.q_table.values is v for c, v in zip(runner.controllers, values))
+    assert all(len(c.q_table) for c in runner.controllers)
+
+def test_large_dict_tables_are_refused(monkeypatch):
+    monkeypatch.setattr(compiled_backend, 'MAX_CONVERTED_BYTES', 1000)
+    runner = ExperimentRunner({**BASE, "algorithm": 'Q_LEARNING', "backend": 'numba'}, EventLog())
+    with pytest.raises(ValueError, match="dense_q_table"):
+        runner.train()
+    runner = train({**BASE, "algorithm": 'Q_LEARNING', "backend": 'numba', "dense_q_table": True})
+    assert runner.terminal_states_reached == len(runner.steps_per_run) > 0
@@ -0,0 +1,62 @@
+# this is discover-paths-rl/tests/test_config_loader.py
+# this file checks the experiments file and the validation of world_change
+
+import os
+import pytest
+from config_loader import iter_configs, validate_config
+from experiment import ExperimentRunner
+from event_log import EventLog
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BASE = {"name": "wc", "total_steps": 100, "algorithm": 'Q_LEARNING', "learning_rate": 0.3,
+        "discount_factor": 0.5, "policy_schedule": [[100, 'PRANDOM']]}
+
+def test_experiments_file_repeats_every_run_with_path_plots():
+    configs = {c['name']: c for c in iter_configs(os.path.join(ROOT, 'experiments.toml'))}
+    first = [name for name in configs if '_Run2' not in name]
+    assert len(configs) == 2 * len(first) == 14
+    for name in first:
+        base, _, matrix = name.partition('__')
+        run2 = configs[f"{base}_Run2{'__' if matrix else ''}{matrix}"]
+        assert not configs[name]['visualize_paths'] and run2['visualize_paths']
+        assert run2['repeat_of'] == base and 'repeat_of' not in configs[name]
+        assert {**configs[name], 'name': None, 'visualize_paths': None, 'repeat_of': None} == \
+               {**run2, 'name': None, 'visualize_paths': None, 'repeat_of': None}
+
+@pytest.mark.parametrize('pickup_locs, message', [
+    ([[5, 0, 5]], "outside the 5x5 grid"),
+    ([[1, 2, 5], [-1, 4, 5]], "outside the 5x5 grid"),
+    ([[1, 1, 5]], "on an obstacle"),
+])
+def test_world_change_cells_are_validated(pickup_locs, message):
+    config = {**BASE, "world": {"obstacles": [[1, 1]]},
+              "world_change": {"after_terminal_states": 1, "pickup_locs": pickup_locs}}
+    with pytest.raises(ValueError, match=message):
+        validate_config(config)
+    with pytest.raises(ValueError, match=message):
+        ExperimentRunner({**config, "policy_schedule": [(100, 'PRANDOM')]}, EventLog())
+
+def test_world_change_on_a_larger_grid_is_valid():
+    validate_config({**BASE, "world": {"width": 8, "height": 8},
+                     "world_change": {"after_terminal_states": 1, "pickup_locs": [[7, 7, 5]]}})
+
+@pytest.mark.parametrize('changes, message', [
+    ({"learning_rate": "0.3"}, "learning_rate must be a number"),
+    ({"discount_factor": None}, "discount_factor must be a number"),
+    ({"learning_rate": True}, "learning_rate must be a number"),
+    ({"total_steps": True}, "total_steps must be a positive integer"),
+    ({"total_steps": 10.0}, "total_steps must be a positive integer"),
+    ({"policy_schedule": "PRANDOM"}, "policy_schedule must be a non-empty list"),
+    ({"policy_schedule": [100]}, "policy_schedule entries"),
+    ({"policy_schedule": [[100, 'PRANDOM', 1]]}, "policy_schedule entries"),
+    ({"policy_schedule": [[True, 'PRANDOM']]}, "policy_schedule entries"),
+    ({"world": {"obstacles": [[0, 0]]}}, "Dropoff cell \\(0, 0\\) is on an obstacle"),
+    ({"world": {"agents": [{"name": "F", "x": 9, "y": 0}, {"name": "M", "x": 4, "y": 2}]}}, "outside the 5x5 grid"),
+    ({"world": {"obstacles": [[1]]}}, "invalid world"),
+    ({"world_file": "no_such_world.json"}, "invalid world"),
+    ({"world_change": {"after_terminal_states": 1, "pickup_locs": [[1]]}}, "pickup_locs are"),
+])
+def test_invalid_values_raise_value_error(changes, message):
+    with pytest.raises(ValueError, match=message):
+        validate_config({**BASE, **changes})
@@ -0,0 +1,92 @@
+# this is discover-paths-rl/tests/test_dp_solver.py
+# this file checks the DP baseline against a plain breadth-first search of the default world
+
+from collections import deque
+import pytest
+from world_config import world_spec_from_config
+from dp_solver import solve
+from event_log import EventLog
+from experiment import ExperimentRunner
+
+MOVES = [(0, -1), (0, 1), (1, 0), (-1, 0)]
+
+def bfs_optimal_steps(spec, turn):
+    """
+    Fewest steps to deliver every block, searching (turn, agents, stock, delivered) states one step
+    at a time. An agent without a valid action passes, which costs a step like in the engine.
+    """
+    width, height, obstacles = spec['width'], spec['height'], spec['obstacles']
+    pickups = list(spec['pickup_locs'])
+    dropoffs = set(spec['dropoff_locs'])
+    total = sum(spec['pickup_locs'].values())
+    agents = tuple((a['x'], a['y'], a['has_block']) for a in spec['agents'])
+    start = (turn, agents, tuple(spec['pickup_locs'][c] for c in pickups), 0)
+    distance = {start: 0}
+    queue = deque([start])
+    while queue:
+        state = queue.popleft()
+        turn, agents, stock, delivered = state
+        if delivered == total:
+            return distance[state]
+        (x, y, has_block), (ox, oy, _) = agents[turn], agents[1 - turn]
+        # Pickup / Dropoff take precedence over moving (as in choose_action)
+        if not has_block and (x, y) in pickups and stock[pickups.index((x, y))] > 0:
+            i = pickups.index((x, y))
+            successors = [((x, y, True), stock[:i] + (stock[i] - 1,) + stock[i + 1:], delivered)]
+        elif has_block and (x, y) in dropoffs:
+            successors = [((x, y, False), stock, delivered + 1)]
+        else:
+            successors = [((x + dx, y + dy, has_block), stock, delivered) for dx, dy in MOVES
+                          if 0 <= x + dx < width and 0 <= y + dy < height and (x + dx, y + dy) != (ox, oy)
+                          and (x + dx, y + dy) not in obstacles]
+            if not successors: # trapped: the turn passes
+                successors = [((x, y, has_block), stock, delivered)]
+        for agent, new_stock, new_delivered in successors:
+            moved = (agent, agents[1]) if turn == 0 else (agents[0], agent)
+            following = (1 - turn, moved, new_stock, new_delivered)
+            if following not in distance:
+                distance[following] = distance[state] + 1
+                queue.append(following)
+    return float('inf')
+
+@pytest.fixture(scope='module')
+def default_solution():
+    return solve(world_spec_from_config({'name': 'dp'}))
+
+def test_default_world_optimum(default_solution):
+    assert default_solution.optimal_steps(0) == 42
+    assert default_solution.optimal_steps(1) == 41
+
+@pytest.mark.parametrize('turn', [0, 1])
+def test_optimum_matches_breadth_first_search(default_solution, turn):
+    spec = world_spec_from_config({'name': 'dp'})
+    assert default_solution.optimal_steps(turn) == bfs_optimal_steps(spec, turn)
+
+def test_small_world_matches_breadth_first_search():
+    spec = world_spec_from_config({'name': 'dp', 'world': {
+        'width': 4, 'height': 3, 'pickups': [[3, 0, 2]], 'dropoffs': [[0, 2]],
+        'agents': [{'name': 'F', 'x': 0, 'y': 0}, {'name': 'M', 'x': 3, 'y': 2}]}})
+    solution = solve(spec)
+    for turn in (0, 1):
+        assert solution.optimal_steps(turn) == bfs_optimal_steps(spec, turn)
+
+def test_a_trapped_turn_costs_a_step():
+    # F starts in a corner between an obstacle and M, so with F moving first its turn passes
+    spec = world_spec_from_config({'name': 'dp', 'world': {
+        'width': 3, 'height': 2, 'pickups': [[2, 1, 1]], 'dropoffs': [[0, 0]], 'obstacles': [[0, 1]],
+        'agents': [{'name': 'F', 'x': 0, 'y': 0}, {'name': 'M', 'x': 1, 'y': 0}]}})
+    solution = solve(spec)
+    assert solution.optimal_steps(0) == bfs_optimal_steps(spec, 0) == solution.optimal_steps(1) + 1
+
+def test_regret_is_never_negative_and_the_solve_is_lazy():
+    config = {'name': 'dp', 'total_steps': 4000, 'seed': 2, 'algorithm': 'Q_LEARNING', 'learning_rate': 0.3,
+              'discount_factor': 0.5, 'policy_schedule': [(4000, 'PRANDOM')], 'plots': False, 'dp_baseline': True,
+              'world': {'width': 3, 'height': 2, 'pickups': [[2, 1, 2]], 'dropoffs': [[0, 0]], 'obstacles': [[0, 1]],
+                        'agents': [{'name': 'F', 'x': 0, 'y': 0}, {'name': 'M', 'x': 1, 'y': 0}]}}
+    runner = ExperimentRunner(config, EventLog())
+    assert runner.dp_solutions == {} # nothing solved until the baseline is asked for
+    runner.train()
+    regret = runner.regret_per_run()
+    assert regret and min(regret) >= 0
+    summary = runner.summary()
+    assert summary['optimal_steps'] == runner.dp_solution(0).optimal_steps(0) and summary['greedy_regret'] >= 0
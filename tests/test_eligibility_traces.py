@@ -0,0 +1,45 @@
+# this is discover-paths-rl/tests/test_eligibility_traces.py
+# this file checks the eligibility-trace learners and their sparse trace store
+
+import pytest
+from event_log import EventLog
+from experiment import ExperimentRunner
+from agent import EligibilityTraces
+from q_table import sparse_q_arrays
+
+BASE = {"name": "traces", "total_steps": 20000, "seed": 9, "learning_rate": 0.3, "discount_factor": 0.5,
+        "policy_schedule": [(500, 'PRANDOM'), (19500, 'PEXPLOIT')], "plots": False}
+
+def train(config):
+    runner = ExperimentRunner(config, EventLog())
+    runner.train()
+    return runner
+
+def results(runner):
+    tables = [sparse_q_arrays(c.q_table) for c in runner.controllers] # compared as dicts: insertion order differs
+    return ([dict(zip(map(tuple, s.tolist()), map(tuple, v.tolist()))) for s, v in tables], runner.steps_per_run,
+            dict(runner.total_rewards),
+            [c.rng.state() for c in runner.controllers])
+
+@pytest.mark.parametrize('dense', [False, True])
+def test_sarsa_lambda_zero_is_sarsa(dense):
+    sarsa = train({**BASE, "algorithm": 'SARSA', "dense_q_table": dense})
+    sarsa_lambda = train({**BASE, "algorithm": 'SARSA_LAMBDA', "lambda": 0.0, "dense_q_table": dense})
+    assert results(sarsa_lambda) == results(sarsa)
+
+def test_traces_stay_bounded():
+    runner = train({**BASE, "algorithm": 'SARSA_LAMBDA', "lambda": 0.95, "trace_threshold": 1e-6, "max_traces": 20})
+    assert all(len(c.traces) <= 20 for c in runner.controllers)
+    assert runner.terminal_states_reached > 0
+
+def test_traces_replace_and_drop_the_oldest():
+    traces = EligibilityTraces(decay=0.5, max_size=2)
+    traces.visit('a', 'North')
+    traces.traces[('a', 'North')] = 0.25
+    traces.visit('b', 'South')
+    traces.visit('a', 'North') # replacing: back to 1 and moved to the back
+    assert list(traces.traces.items()) == [(('b', 'South'), 1.0), (('a', 'North'), 1.0)]
+    traces.visit('c', 'East')
+    assert list(traces.traces) == [('a', 'North'), ('c', 'East')]
+    with pytest.raises(ValueError):
+        EligibilityTraces(decay=0.5, max_size=0)
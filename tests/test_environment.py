@@ -0,0 +1,97 @@
+# this is discover-paths-rl/tests/test_environment.py
+# this file checks PDWorld's lookup tables against the original rule code
+
+import random
+import pytest
+from constants import ACTIONS, DEFAULT_PICKUP_LOCS, DEFAULT_DROPOFF_LOCS, AGENT_F_START, AGENT_M_START
+from environment import PDWorld
+from batch_environment import BatchPDWorld
+from agent import Agent
+
+def original_possible_actions(world, agent, other_agent):
+    """PDWorld.get_possible_actions before the lookup tables."""
+    possible = []
+    for action, (dx, dy) in {'North': (0, -1), 'South': (0, 1), 'East': (1, 0), 'West': (-1, 0)}.items():
+        next_x, next_y = agent.x + dx, agent.y + dy
+        if 0 <= next_x < world.width and 0 <= next_y < world.height and (next_x, next_y) != (other_agent.x, other_agent.y):
+            possible.append(action)
+    agent_pos = (agent.x, agent.y)
+    if not agent.has_block and world.pickup_locs.get(agent_pos, 0) > 0:
+        possible.append('Pickup')
+    if agent.has_block and agent_pos in world.dropoff_locs:
+        possible.append('Dropoff')
+    return possible
+
+def original_apply_action(world, agent, other_agent, action):
+    """PDWorld.apply_action before the lookup tables (same rewards and effects)."""
+    agent_pos = (agent.x, agent.y)
+    if action == 'Pickup':
+        if not agent.has_block and world.pickup_locs.get(agent_pos, 0) > 0:
+            agent.has_block = True
+            world.pickup_locs[agent_pos] -= 1
+            return 13
+        return -10
+    if action == 'Dropoff':
+        if agent.has_block and agent_pos in world.dropoff_locs:
+            agent.has_block = False
+            world.dropoff_locs[agent_pos] += 1
+            world.total_blocks_delivered += 1
+            return 13
+        return -10
+    dx, dy = {'North': (0, -1), 'South': (0, 1), 'East': (1, 0), 'West': (-1, 0)}[action]
+    new_x, new_y = agent.x + dx, agent.y + dy
+    if not (0 <= new_x < world.width and 0 <= new_y < world.height) or (new_x, new_y) == (other_agent.x, other_agent.y):
+        return -10
+    agent.x, agent.y = new_x, new_y
+    return -1
+
+def test_lookup_tables_match_original_rules():
+    rng = random.Random(4)
+    worlds = [PDWorld(DEFAULT_PICKUP_LOCS, DEFAULT_DROPOFF_LOCS) for _ in range(2)]
+    agents = [[Agent('F', **AGENT_F_START), Agent('M', **AGENT_M_START)] for _ in range(2)]
+    table_world, original_world = worlds
+    terminals = 0
+    for step in range(300000):
+        turn = step % 2
+        (mover, other), (original_mover, original_other) = [(a[turn], a[1 - turn]) for a in agents]
+        possible = table_world.get_possible_actions(mover, other)
+        assert possible == original_possible_actions(original_world, original_mover, original_other)
+        # Mostly valid actions so runs finish (and pickup cells run out), with invalid ones mixed in
+        action = rng.choice(ACTIONS) if rng.random() < 0.2 or not possible else rng.choice(possible)
+        assert (table_world.apply_action(mover, other, action)
+                == original_apply_action(original_world, original_mover, original_other, action))
+        assert table_world.pickup_locs == original_world.pickup_locs
+        assert table_world.dropoff_locs == original_world.dropoff_locs
+        assert [(a.x, a.y, a.has_block) for a in agents[0]] == [(a.x, a.y, a.has_block) for a in agents[1]]
+        if table_world.is_terminal_state():
+            assert original_world.total_blocks_delivered == original_world.total_blocks_at_start
+            terminals += 1
+            for world, pair in zip(worlds, agents):
+                world.reset()
+                for agent, start in zip(pair, (AGENT_F_START, AGENT_M_START)):
+                    agent.reset(**start)
+    assert terminals > 0
+
+def test_tables_follow_world_change():
+    world = PDWorld(DEFAULT_PICKUP_LOCS, DEFAULT_DROPOFF_LOCS)
+    agent, other = Agent('F', 1, 4), Agent('M', 4, 4)
+    assert 'Pickup' not in world.get_possible_actions(agent, other)
+    world.change_pickup_locations({(1, 4): 1, (4, 0): 5})
+    assert 'Pickup' in world.get_possible_actions(agent, other)
+    assert world.apply_action(agent, other, 'Pickup') == 13
+    agent.has_block = False # out of stock now
+    assert 'Pickup' not in world.get_possible_actions(agent, other)
+    assert world.apply_action(agent, other, 'Pickup') == -10
+
+def test_unknown_action_raises():
+    world = PDWorld()
+    agent, other = Agent('F', **AGENT_F_START), Agent('M', **AGENT_M_START)
+    with pytest.raises(ValueError, match="Unknown action"):
+        world.apply_action(agent, other, 'Jump')
+    assert world.apply_action(agent, other, 'Dropoff') == -10
+
+@pytest.mark.parametrize('world_class', [PDWorld, lambda **kwargs: BatchPDWorld(2, **kwargs)])
+@pytest.mark.parametrize('width, height', [(0, 5), (5, 0), (-1, 3)])
+def test_empty_grid_is_rejected(world_class, width, height):
+    with pytest.raises(ValueError, match="Invalid grid size"):
+        world_class(width=width, height=height)
@@ -0,0 +1,36 @@
+# this is discover-paths-rl/tests/test_main.py
+# this file checks the command-line config options of main.py
+
+import os
+import json
+from event_log import EventLog
+from experiment import ExperimentRunner
+from main import full_budget, main, parse_args
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CONFIG = {"name": "budget", "total_steps": 8000, "seed": 3, "algorithm": 'SARSA', "learning_rate": 0.3,
+          "discount_factor": 0.5, "policy_schedule": [(500, 'PRANDOM'), (7500, 'PEXPLOIT')], "plots": False,
+          "early_stop": {"patience": 3, "window": 3},
+          "dp_baseline": {"epsilon": 10.0, "window": 2},
+          "convergence": {"steps_variance": 1e9, "window": 2}}
+
+def test_full_budget_turns_off_every_stop():
+    stopped = ExperimentRunner(CONFIG, EventLog())
+    stopped.train()
+    assert stopped.stop_reason != 'budget'
+    runner = ExperimentRunner(full_budget(CONFIG), EventLog())
+    runner.train()
+    assert runner.stop_reason == 'budget' and runner.steps_trained == CONFIG['total_steps']
+    assert runner.converged_step is not None # still recorded
+    assert 'optimal_steps' in runner.summary()
+    assert CONFIG['early_stop'] and CONFIG['dp_baseline']['epsilon'] # the original config is left alone
+
+def test_replicates_skip_the_run2_copies(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with EventLog(str(tmp_path / 'log.jsonl')) as event_log:
+        main(parse_args(['--config', os.path.join(ROOT, 'experiments.toml'), '--replicates', '2', '--no-plots']), event_log)
+    with open(tmp_path / 'log.jsonl') as f:
+        finished = [e['experiment'] for e in map(json.loads, f) if e['event'] == 'replicates_finished']
+    assert sorted(finished) == sorted(set(finished)) == ['Exp_1a_PRANDOM', 'Exp_1b_PGREEDY', 'Exp_1c_PEXPLOIT', 'Exp_2_SARSA',
+        'Exp_3_PEXPLOIT__learning_rate-0.15', 'Exp_3_PEXPLOIT__learning_rate-0.45', 'Exp_4_Adaptability']
@@ -0,0 +1,28 @@
+# this is discover-paths-rl/tests/test_metrics.py
+# this file checks the ChunkedTable's cached to_array()
+
+import numpy as np
+import pytest
+from metrics import ChunkedTable
+
+DTYPE = [('a', np.int64), ('b', np.float64)]
+
+def test_to_array_is_cached_until_the_next_append():
+    table = ChunkedTable(DTYPE, chunk_size=4)
+    for i in range(6):
+        table.append((i, i / 2))
+    rows = table.to_array()
+    assert table.to_array() is rows and table.column('a').tolist() == list(range(6))
+    with pytest.raises(ValueError):
+        rows['a'][0] = 99 # shared, so read-only
+    table.append((6, 3.0))
+    assert table.to_array() is not rows and len(rows) == 6
+    assert table.column('a').tolist() == list(range(7))
+    table.extend(np.array([(7, 3.5), (8, 4.0)], dtype=DTYPE))
+    assert table.column('b').tolist() == [i / 2 for i in range(9)]
+
+def test_empty_table():
+    table = ChunkedTable(DTYPE, chunk_size=4)
+    assert len(table.to_array()) == 0
+    table.append((1, 1.0))
+    assert table.column('a').tolist() == [1]
@@ -0,0 +1,43 @@
+# this is discover-paths-rl/tests/test_multi_agent.py
+# this file checks the collision rule of simultaneous turns
+
+from agent import Agent
+from environment import PDWorld
+from event_log import EventLog
+from experiment import ExperimentRunner
+from multi_agent import AgentView
+
+def test_simultaneous_moves_use_the_round_snapshot():
+    world = PDWorld()
+    agents = [Agent('A', 0, 1), Agent('B', 2, 1), Agent('C', 0, 2), Agent('D', 4, 4)]
+    world.track_agents(agents)
+    AgentView(agents, world).freeze()
+    a, b, c, d = agents
+    assert world.apply_action(a, None, 'East') == -1 and (a.x, a.y) == (1, 1)
+    # B was offered (1, 1) from the snapshot: the clash leaves it in place at the normal move cost
+    assert 'West' in world.get_possible_actions(b, None)
+    assert world.apply_action(b, None, 'West') == -1 and (b.x, b.y) == (2, 1)
+    # A's old cell stays blocked for the rest of the round, as it was when C decided
+    assert 'North' not in world.get_possible_actions(c, None)
+    assert world.apply_action(c, None, 'North') == -10 and (c.x, c.y) == (0, 2)
+
+def test_offered_moves_are_never_rejected_as_invalid():
+    config = {"name": "sim", "total_steps": 6000, "seed": 4, "algorithm": 'Q_LEARNING', "learning_rate": 0.3,
+              "discount_factor": 0.5, "policy_schedule": [(6000, 'PRANDOM')], "plots": False,
+              "turn_order": 'simultaneous', "state_encoding": 'occupancy',
+              "world": {"agents": [{"name": "F", "x": 0, "y": 2}, {"name": "M", "x": 4, "y": 2},
+                                   {"name": "G", "x": 2, "y": 0}, {"name": "H", "x": 2, "y": 4}]}}
+    runner = ExperimentRunner(config, EventLog())
+    world, offered, rejected = runner.world, {}, []
+    get_possible_actions, apply_action = world.get_possible_actions, world.apply_action
+    def offer(agent, other_agent):
+        offered[agent.name] = get_possible_actions(agent, other_agent)
+        return offered[agent.name]
+    def apply(agent, other_agent, action):
+        reward = apply_action(agent, other_agent, action)
+        if reward == -10 and action in offered.get(agent.name, ()):
+            rejected.append((agent.name, action))
+        return reward
+    world.get_possible_actions, world.apply_action = offer, apply
+    runner.train()
+    assert runner.terminal_states_reached > 0 and rejected == []
@@ -0,0 +1,23 @@
+# this is discover-paths-rl/tests/test_replay.py
+# this file checks that replay keeps to its ratio of replayed transitions per step
+
+import numpy as np
+import pytest
+from event_log import EventLog
+from experiment import ExperimentRunner
+
+CONFIG = {"name": "replay", "total_steps": 100, "seed": 1, "algorithm": 'Q_LEARNING', "learning_rate": 0.3,
+          "discount_factor": 0.5, "policy_schedule": [(100, 'PRANDOM')], "plots": False, "dense_q_table": True}
+
+@pytest.mark.parametrize('batch_size, ratio', [(32, 1.0), (32, 4.0), (8, 0.5), (4, 10.0)])
+def test_replay_batches_follow_the_ratio_from_the_first_full_batch(batch_size, ratio):
+    runner = ExperimentRunner({**CONFIG, "replay": {"batch_size": batch_size, "ratio": ratio}}, EventLog())
+    replay = runner.replay
+    transition = ((0, 2, 0, 4, 2), 'South', -1, (0, 3, 0, 4, 2), ['North', 'South', 'East'])
+    for n in range(1, 401):
+        before = replay.batches
+        replay.record(0, *transition)
+        earned = max(n - batch_size + 1, 0) * ratio # transitions earned since the buffer first held a batch
+        assert replay.batches == int(earned // batch_size)
+        assert replay.batches - before <= np.ceil(ratio / batch_size) # never a catch-up burst
+    assert replay.batches > 0
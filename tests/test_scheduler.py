@@ -0,0 +1,18 @@
+# this is discover-paths-rl/tests/test_scheduler.py
+# this file checks the job seeds handed out by the parallel scheduler
+
+from scheduler import run_experiments, job_seeds
+
+def config(name, **extra):
+    return {"name": name, "total_steps": 200, "algorithm": 'Q_LEARNING', "learning_rate": 0.3,
+            "discount_factor": 0.5, "policy_schedule": [(200, 'PRANDOM')], "plots": False, **extra}
+
+def seeds(configs, tmp_path):
+    return {r['name']: r['seed'] for r in run_experiments(configs, max_workers=2, root_seed=7, log_dir=str(tmp_path))}
+
+def test_seeded_configs_leave_the_derived_seeds_alone(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    derived = job_seeds(2, root_seed=7)
+    assert seeds([config('b'), config('c')], tmp_path) == {'b': derived[0], 'c': derived[1]}
+    assert seeds([config('a', seed=5), config('b'), config('x', seed=6), config('c')], tmp_path) == \
+           {'a': 5, 'b': derived[0], 'x': 6, 'c': derived[1]}
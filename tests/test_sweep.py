@@ -0,0 +1,34 @@
+# this is discover-paths-rl/tests/test_sweep.py
+# this file checks successive halving: promoted trials resume exactly where they
+# stopped, and trials that finished on their own are not resumed
+
+from event_log import EventLog
+from experiment import ExperimentRunner
+from sweep import run_sweep
+
+BASE = {"name": "base", "total_steps": 6000, "algorithm": 'SARSA', "learning_rate": 0.3, "discount_factor": 0.5,
+        "policy_schedule": [(500, 'PRANDOM'), (5500, 'PEXPLOIT')],
+        "world_change": {"after_terminal_states": 5, "pickup_locs": {(1, 2): 5, (4, 4): 5}}}
+
+def test_halving_resumes_like_an_uninterrupted_run(tmp_path):
+    sweep = {"name": "lr", "base": BASE, "space": {"learning_rate": [0.2, 0.3, 0.4]},
+             "halving": {"min_steps": 2000, "eta": 3}}
+    table = run_sweep(sweep, workers=2, root_seed=3, out_dir=str(tmp_path))
+    best = table[0]
+    assert best['rung'] == 1 and best['steps_trained'] == BASE['total_steps']
+    runner = ExperimentRunner({**BASE, "plots": False, "learning_rate": best['learning_rate'], "seed": best['seed']},
+                              EventLog())
+    runner.train()
+    assert best['terminal_states'] == runner.terminal_states_reached
+    assert best['avg_steps_per_run'] == sum(runner.steps_per_run) / len(runner.steps_per_run)
+    assert [row['stop_reason'] for row in table[1:]] == ['halving', 'halving']
+
+def test_finished_trials_are_not_resumed(tmp_path):
+    converge = {"steps_variance": 1e9, "window": 2} # holds as soon as two runs are done
+    sweep = {"name": "stop", "base": BASE, "space": {"convergence": [converge, None]},
+             "halving": {"min_steps": 2000, "eta": 2}}
+    rows = {row['trial']: row for row in run_sweep(sweep, workers=2, root_seed=3, out_dir=str(tmp_path))}
+    converged, running = rows['stop_t000'], rows['stop_t001']
+    assert converged['stop_reason'] == 'converged' and converged['rung'] == 0
+    assert converged['steps_trained'] < 2000
+    assert running['stop_reason'] == 'budget' and running['steps_trained'] == BASE['total_steps']
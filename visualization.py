@@ -1,22 +1,38 @@
 import os
+import matplotlib
+if 'MPLBACKEND' not in os.environ:
+    matplotlib.use('Agg') # figures are only saved to files, so never start a GUI backend
 import matplotlib.pyplot as plt
+from matplotlib.colors import ListedColormap
 import numpy as np
-import random
-from constants import GRID_WIDTH, GRID_HEIGHT, DEFAULT_PICKUP_LOCS, DEFAULT_DROPOFF_LOCS
+from results_sink import atomic_write
 
 class Visualization:
     """Groups all plotting and printing functions as static methods."""
 
     @staticmethod
-    def plot_performance(steps_per_run_list, policy_switch_run, title):
-        """Creates a plot showing steps per run."""
+    def plot_performance(steps_per_run_list, policy_switch_run, title, bands=None):
+        """
+        Creates a plot showing steps per run.
+        bands (see replicate.aggregate_curves) draws the mean over several seeds with a
+        shaded quantile band instead of a single run.
+        """
         plt.figure(figsize=(12, 6))
-        plt.plot(steps_per_run_list, marker='o', linestyle='-', markersize=4)
+        if bands is None:
+            plt.plot(steps_per_run_list, marker='o', linestyle='-', markersize=4)
+        else:
+            runs = np.arange(len(bands['mean']))
+            low, high = bands['quantile_levels'][0], bands['quantile_levels'][-1]
+            plt.fill_between(runs, bands['quantiles'][0], bands['quantiles'][-1], alpha=0.3,
+                             label=f'{low:.0%}-{high:.0%} quantile band')
+            plt.plot(runs, bands['mean'], marker='o', linestyle='-', markersize=3,
+                     label=f"Mean of {bands['replicates']} seeds")
         plt.title(f'{title}: Agent Performance Over Time (Steps per Terminal State)')
         plt.xlabel('Terminal State (Run Number)')
         plt.ylabel('Steps Taken to Complete')
         if policy_switch_run != -1:
             plt.axvline(x=policy_switch_run, color='r', linestyle='--', label=f'Policy Switch')
+        if policy_switch_run != -1 or bands is not None:
             plt.legend()
         
         plt.grid(True)
@@ -24,109 +40,110 @@ class Visualization:
         # Save to a 'results' folder
         os.makedirs('results', exist_ok=True)
         filename = os.path.join('results', f'{title}_performance_plot.png')
-        plt.savefig(filename)
-        print(f"\nSaved performance plot to '{filename}'")
+        atomic_write(filename, plt.savefig) # a half-written PNG is never left behind
         plt.close() # Close the plot to save memory
+        return filename
 
     @staticmethod
-    def plot_attractive_paths(q_table, agent_has_block, other_agent_pos, title):
-        """
-        Creates a "quiver plot" (arrow plot) to visualize the attractive paths.
-        This is a "visually appealing" component for extra credit.
-        """
-        # Create a 5x5 grid for the path arrows
-        # u = x-component of arrow, v = y-component of arrow
-        u = np.zeros((GRID_HEIGHT, GRID_WIDTH))
-        v = np.zeros((GRID_HEIGHT, GRID_WIDTH))
-        
-        # Create a 5x5 grid for the background colors
-        grid_colors = np.zeros((GRID_HEIGHT, GRID_WIDTH))
-        
-        movement_actions = ['North', 'South', 'East', 'West']
-        action_vectors = {'North': (0, 1), 'South': (0, -1), 'East': (1, 0), 'West': (-1, 0)}
+    def _draw_field(ax, u, v, world_spec, tick_labels=True):
+        """Draws the P/D/obstacle cells and the (u, v) arrow field on one axes. Returns the cell colormap."""
+        width, height = world_spec['width'], world_spec['height']
+        cells = max(width, height)
 
-        for y in range(GRID_HEIGHT):
-            for x in range(GRID_WIDTH):
-                # This is the state for this specific grid cell
-                # We fix the other agent's position for this visualization
-                state = (x, y, agent_has_block, other_agent_pos[0], other_agent_pos[1])
-                
-                # Find the best *movement* action from this state
-                best_move = ''
-                max_q = -float('inf')
-                
-                for action in movement_actions:
-                    q_val = q_table.get(state, {}).get(action, 0.0)
-                    if q_val > max_q:
-                        max_q = q_val
-                        best_move = action
-                
-                # Store the vector for the best move
-                if best_move in action_vectors:
-                    dx, dy = action_vectors[best_move]
-                    u[y, x] = dx
-                    v[y, x] = dy * -1 # Y-axis is inverted in plots (0 is at top)
-                
-                # Set background colors
-                if (x, y) in DEFAULT_PICKUP_LOCS:
-                    grid_colors[y, x] = 1 # Blue
-                elif (x, y) in DEFAULT_DROPOFF_LOCS:
-                    grid_colors[y, x] = 2 # Green
-
-        # --- Create the plot ---
-        fig, ax = plt.subplots(figsize=(8, 8))
-        
-        # Create a colormap: 0=White, 1=Blue, 2=Green
+        # Background colors: 0=White, 1=Blue (pickup), 2=Green (dropoff); obstacles are drawn on top
+        grid_colors = np.zeros((height, width))
+        for x, y in world_spec['dropoff_locs']:
+            grid_colors[y, x] = 2
+        for x, y in world_spec['pickup_locs']:
+            grid_colors[y, x] = 1
         cmap = plt.get_cmap('Pastel2', 3)
         ax.imshow(grid_colors, cmap=cmap, interpolation='nearest', vmin=0, vmax=2)
-        
-        # Draw the quiver plot (arrows)
-        # We need to specify the center of each grid cell
-        x_coords = np.arange(GRID_WIDTH)
-        y_coords = np.arange(GRID_HEIGHT)
-        X, Y = np.meshgrid(x_coords, y_coords)
-        
-        ax.quiver(X, Y, u, v, color='black', scale=21, headwidth=4, headlength=5)
+        if world_spec['obstacles']:
+            obstacle_mask = np.zeros((height, width), dtype=bool)
+            for x, y in world_spec['obstacles']:
+                obstacle_mask[y, x] = True
+            ax.imshow(np.ma.masked_where(~obstacle_mask, obstacle_mask), cmap=ListedColormap(['dimgray']),
+                      interpolation='nearest')
 
-        # Configure the plot
-        ax.set_title(title, fontsize=14)
-        ax.set_xticks(np.arange(GRID_WIDTH))
-        ax.set_yticks(np.arange(GRID_HEIGHT))
-        ax.set_xticklabels(np.arange(GRID_WIDTH))
-        ax.set_yticklabels(np.arange(GRID_HEIGHT))
-        ax.set_xticks(np.arange(-.5, GRID_WIDTH, 1), minor=True)
-        ax.set_yticks(np.arange(-.5, GRID_HEIGHT, 1), minor=True)
-        ax.grid(which='minor', color='black', linestyle='-', linewidth=2)
+        # Draw the quiver plot (arrows) at the center of each grid cell
+        X, Y = np.meshgrid(np.arange(width), np.arange(height))
+        ax.quiver(X, Y, u, v, color='black', scale=21 * max(cells, 5) / 5, headwidth=4, headlength=5)
+
+        tick_step = max(1, cells // 20) # label every cell on small grids only
+        if tick_labels:
+            ax.set_xticks(np.arange(0, width, tick_step))
+            ax.set_yticks(np.arange(0, height, tick_step))
+            ax.set_xticklabels(np.arange(0, width, tick_step))
+            ax.set_yticklabels(np.arange(0, height, tick_step))
+        else:
+            ax.set_xticks([])
+            ax.set_yticks([])
+        ax.set_xticks(np.arange(-.5, width, 1), minor=True)
+        ax.set_yticks(np.arange(-.5, height, 1), minor=True)
+        ax.grid(which='minor', color='black', linestyle='-', linewidth=(2 if cells <= 20 else 0.3) * (1 if tick_labels else 0.5))
         ax.set_aspect('equal') # Make squares square
-        
-        # Add a legend for colors
+        ax.invert_yaxis() # Put (0,0) at the top-left
+        return cmap
+
+    @staticmethod
+    def _legend_elements(cmap, world_spec):
         legend_elements = [plt.Rectangle((0, 0), 1, 1, color=cmap(0), label='Empty'),
                            plt.Rectangle((0, 0), 1, 1, color=cmap(1), label='Pickup (P)'),
                            plt.Rectangle((0, 0), 1, 1, color=cmap(2), label='Dropoff (D)')]
-        ax.legend(handles=legend_elements, bbox_to_anchor=(1.05, 1), loc='upper left')
+        if world_spec['obstacles']:
+            legend_elements.append(plt.Rectangle((0, 0), 1, 1, color='dimgray', label='Obstacle'))
+        return legend_elements
 
-        plt.gca().invert_yaxis() # Put (0,0) at the top-left
+    @staticmethod
+    def draw_paths(u, v, title, world_spec):
+        """Draws and saves one path figure from a precomputed arrow field (see plot_renderer.greedy_fields)."""
+        # Figures grow with the grid (capped at 40in), arrows and grid lines shrink
+        width, height = world_spec['width'], world_spec['height']
+        cells = max(width, height)
+        side = min(8 * cells / 5, 40) if cells > 5 else 8
+        fig, ax = plt.subplots(figsize=(side * width / cells, side * height / cells))
+
+        cmap = Visualization._draw_field(ax, u, v, world_spec)
+        ax.set_title(title, fontsize=14)
+        ax.legend(handles=Visualization._legend_elements(cmap, world_spec), bbox_to_anchor=(1.05, 1), loc='upper left')
 
         # Save to a 'results' folder
         os.makedirs('results', exist_ok=True)
         filename = os.path.join('results', f'{title}_path_plot.png')
-        plt.savefig(filename, bbox_inches='tight')
-        print(f"Saved path visualization to '{filename}'")
-        plt.close()
+        atomic_write(filename, lambda tmp_path: plt.savefig(tmp_path, bbox_inches='tight'))
+        plt.close(fig)
+        return filename
 
     @staticmethod
-    def print_q_table_sample(q_table, num_states=5):
-        """Prints a small, random sample of the Q-table."""
-        print(f"\n--- Q-Table Sample (Size: {len(q_table)} states) ---")
-        if not q_table:
-            print("Q-Table is empty.")
-            return
-        
-        # Get a random sample of states
-        states_to_print = random.sample(list(q_table.keys()), min(num_states, len(q_table)))
-        
-        for state in states_to_print:
-            actions = q_table[state]
-            # Format actions for printing
-            actions_str = ", ".join(f"{act}: {val:.2f}" for act, val in actions.items())
-            print(f"State: {state}\n  Actions: {actions_str}")
\ No newline at end of file
+    def draw_path_panels(u, v, other_positions, title, world_spec):
+        """
+        Draws one panel per other-agent position (u, v have shape (panels, height, width))
+        and saves them as a single figure. The other agent's cell is marked in red.
+        """
+        panels = len(other_positions)
+        ncols = int(np.ceil(np.sqrt(panels)))
+        nrows = int(np.ceil(panels / ncols))
+        width, height = world_spec['width'], world_spec['height']
+        panel_side = 2.5 if max(width, height) <= 10 else 4
+        fig, axes = plt.subplots(nrows, ncols, squeeze=False,
+                                 figsize=(ncols * panel_side * width / max(width, height),
+                                          nrows * panel_side * height / max(width, height)))
+        cmap = None
+        for i, ax in enumerate(axes.flat):
+            if i >= panels:
+                ax.axis('off')
+                continue
+            ox, oy = other_positions[i]
+            cmap = Visualization._draw_field(ax, u[i], v[i], world_spec, tick_labels=False)
+            ax.add_patch(plt.Rectangle((ox - .5, oy - .5), 1, 1, color='indianred', alpha=0.8))
+            ax.set_title(f"other at ({ox}, {oy})", fontsize=8)
+        fig.suptitle(title, fontsize=14)
+        legend_elements = Visualization._legend_elements(cmap, world_spec)
+        legend_elements.append(plt.Rectangle((0, 0), 1, 1, color='indianred', label='Other agent'))
+        fig.legend(handles=legend_elements, loc='upper center', bbox_to_anchor=(0.5, 0.02), ncol=len(legend_elements))
+
+        os.makedirs('results', exist_ok=True)
+        filename = os.path.join('results', f'{title}_path_panels.png')
+        atomic_write(filename, lambda tmp_path: plt.savefig(tmp_path, bbox_inches='tight'))
+        plt.close(fig)
+        return filename
@@ -0,0 +1,125 @@
+# this is discover-paths-rl/world_config.py
+# this file builds the world definition (grid size, obstacles, pickup/dropoff
+# cells, agent start positions) from an experiment config or a world file
+
+import json
+from constants import *
+
+def default_world_spec():
+    """The original 5x5 PD-World from constants.py."""
+    return {
+        'width': GRID_WIDTH,
+        'height': GRID_HEIGHT,
+        'pickup_locs': dict(DEFAULT_PICKUP_LOCS),
+        'dropoff_locs': dict(DEFAULT_DROPOFF_LOCS),
+        'dropoff_capacity': {},
+        'obstacles': set(),
+        'agents': [{'name': 'F', **AGENT_F_START}, {'name': 'M', **AGENT_M_START}],
+    }
+
+def _cell_counts(entries, default=None):
+    """
+    Accepts {(x, y): n} or a JSON-style list of [x, y] / [x, y, n] entries.
+    Returns ({(x, y): n}, {(x, y): n for entries that gave an explicit n}).
+    """
+    if isinstance(entries, dict):
+        cells = {tuple(pos): n for pos, n in entries.items()}
+        return cells, dict(cells)
+    cells, explicit = {}, {}
+    for entry in entries:
+        pos = (int(entry[0]), int(entry[1]))
+        cells[pos] = int(entry[2]) if len(entry) > 2 else default
+        if len(entry) > 2:
+            explicit[pos] = int(entry[2])
+    return cells, explicit
+
+def parse_pickup_locs(entries):
+    """{(x, y): blocks} from either the dict or the [[x, y, blocks], ...] form."""
+    cells, _ = _cell_counts(entries, default=0)
+    return cells
+
+def cell_list(cells):
+    """{(x, y): n} -> [[x, y, n], ...], the JSON form used by world files and the event log."""
+    return [[x, y, n] for (x, y), n in cells.items()]
+
+def parse_world_spec(world):
+    """
+    Builds a world spec from a dict (inline "world" config or a loaded world file):
+        {"width": 10, "height": 10,
+         "pickups": [[x, y, blocks], ...],
+         "dropoffs": [[x, y], [x, y, capacity], ...],
+         "obstacles": [[x, y], ...],
+         "agents": [{"name": "F", "x": 0, "y": 0}, {"name": "M", "x": 9, "y": 9}]}
+    Missing keys fall back to the default 5x5 world.
+    """
+    spec = default_world_spec()
+    spec['width'] = int(world.get('width', spec['width']))
+    spec['height'] = int(world.get('height', spec['height']))
+    if 'pickups' in world:
+        spec['pickup_locs'] = parse_pickup_locs(world['pickups'])
+    if 'dropoffs' in world:
+        cells, capacity = _cell_counts(world['dropoffs'])
+        spec['dropoff_locs'] = {pos: 0 for pos in cells} # dropoffs start empty
+        # Only the [x, y, capacity] list form sets capacities ({(x, y): 0} is the PDWorld count form)
+        spec['dropoff_capacity'] = {} if isinstance(world['dropoffs'], dict) else capacity
+    if 'obstacles' in world:
+        spec['obstacles'] = {(int(x), int(y)) for x, y in world['obstacles']}
+    if 'agents' in world:
+        spec['agents'] = [{'name': a['name'], 'x': int(a['x']), 'y': int(a['y']),
+                           'has_block': bool(a.get('has_block', False))} for a in world['agents']]
+    validate_world_spec(spec)
+    return spec
+
+def load_world_file(path):
+    """Loads a JSON world file (see parse_world_spec for the format)."""
+    with open(path, 'r', encoding='utf-8') as f:
+        return parse_world_spec(json.load(f))
+
+def world_spec_from_config(config):
+    """Uses config['world_file'] if given, else the inline config['world'], else the default world."""
+    if config.get('world_file'):
+        return load_world_file(config['world_file'])
+    if config.get('world'):
+        return parse_world_spec(config['world'])
+    return default_world_spec()
+
+def validate_world_change(spec, pickup_locs):
+    """Raises ValueError if the world_change pickup cells don't fit the world (checked like the world's own)."""
+    try:
+        validate_world_spec({**spec, 'pickup_locs': pickup_locs})
+    except ValueError as e:
+        raise ValueError(f"world_change: {e}") from None
+
+def validate_world_spec(spec):
+    """Raises ValueError if cells are off-grid, overlap an obstacle, or agents collide."""
+    width, height, obstacles = spec['width'], spec['height'], spec['obstacles']
+    if width < 1 or height < 1:
+        raise ValueError(f"Invalid grid size: {width}x{height}")
+
+    def check(pos, what):
+        if not (0 <= pos[0] < width and 0 <= pos[1] < height):
+            raise ValueError(f"{what} {pos} is outside the {width}x{height} grid")
+        if pos in obstacles:
+            raise ValueError(f"{what} {pos} is on an obstacle")
+
+    for pos in spec['pickup_locs']:
+        check(pos, "Pickup cell")
+    for pos in spec['dropoff_locs']:
+        check(pos, "Dropoff cell")
+    starts = [(a['x'], a['y']) for a in spec['agents']]
+    for pos in starts:
+        check(pos, "Agent start")
+    if len(set(starts)) != len(starts):
+        raise ValueError(f"Agents must start on different cells: {starts}")
+    if len(spec['agents']) < 2:
+        raise ValueError(f"PD-World needs at least 2 agents, got {len(spec['agents'])}")
+    names = [a['name'] for a in spec['agents']]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Agent names must be unique: {names}")
+    if not spec['pickup_locs'] or not spec['dropoff_locs']:
+        raise ValueError("A world needs at least one pickup and one dropoff cell")
+    if all(pos in spec['dropoff_capacity'] for pos in spec['dropoff_locs']):
+        total_capacity = sum(spec['dropoff_capacity'].values())
+        if total_capacity < sum(spec['pickup_locs'].values()):
+            raise ValueError(f"Dropoff capacity ({total_capacity}) is smaller than the number of blocks; "
+                             "the terminal state could never be reached")